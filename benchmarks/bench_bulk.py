@@ -0,0 +1,95 @@
+"""Throughput and peak memory of bulk config generation (/api/v1/bulk-generate).
+
+Runs the endpoint's pipeline (spool the request body, parse rows, generate,
+encode NDJSON or zip) over N rows of per-node overrides, discarding the
+output as a client would consume it. Reports rows/s, and in a second pass
+under tracemalloc the peak Python heap above the request body itself. For
+NDJSON it stays flat as the row count grows; for zip it grows by the central
+directory the format requires at the end. (httpx's in-process ASGI
+transport buffers whole responses, so it can't show the streaming memory
+profile.)
+
+Single CPU, Python 3.11:
+
+        rows  output  seconds    rows/s  out MB  peak heap MB
+       10000  ndjson     0.69     14499     8.9          1.22
+       10000     zip     1.96      5101     3.4         10.71
+       50000  ndjson     2.94     17033    44.7          1.33
+       50000     zip     5.92      8453    16.9         52.41
+
+    python benchmarks/bench_bulk.py --rows 10000 50000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mtfwbuilder.services import bulk_generator  # noqa: E402
+
+BASE = {
+    "channels_to_write": "2",
+    "owner_short_name": "FLT",
+    "lora_enabled": "true",
+    "lora_region": "US",
+    "channel_0[name]": "Fleet",
+    "channel_0[psk]": "deadbeef" * 8,
+    "channel_1[name]": "Ops",
+    "channel_1[psk]": "0badc0de" * 8,
+}
+REQUEST_CHUNK = 64 * 1024  # body arrives in chunks, as from the server
+
+
+def ndjson_body(rows: int) -> bytes:
+    lines = [json.dumps({"$base": BASE})]
+    for i in range(rows):
+        lines.append(json.dumps({"$name": f"node-{i:05d}", "device_name": f"Node {i}", "owner_long_name": f"Fleet {i}"}))
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def _chunks(body: bytes):
+    for start in range(0, len(body), REQUEST_CHUNK):
+        yield body[start : start + REQUEST_CHUNK]
+
+
+async def run(body: bytes, output: str) -> int:
+    spool = await bulk_generator.spool_body(_chunks(body))
+    try:
+        rows = bulk_generator.generate_rows(bulk_generator.iter_records(spool, bulk_generator.NDJSON))
+        stream = bulk_generator.zip_stream(rows) if output == "zip" else bulk_generator.ndjson_stream(rows)
+        return sum(len(chunk) for chunk in stream)
+    finally:
+        spool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'output':>7} {'seconds':>8} {'rows/s':>9} {'out MB':>7} {'peak heap MB':>13}")
+    for count in args.rows:
+        body = ndjson_body(count)
+        for output in ("ndjson", "zip"):
+            start = time.perf_counter()
+            size = asyncio.run(run(body, output))
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            asyncio.run(run(body, output))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{count:>8} {output:>7} {elapsed:>8.2f} {count / elapsed:>9.0f} "
+                f"{size / 1e6:>7.1f} {peak / 1e6:>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
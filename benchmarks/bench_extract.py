@@ -0,0 +1,86 @@
+"""Benchmark firmware source extraction.
+
+Compares zipfile's serial extractall with the parallel single-pass extractor
+on a real Meshtastic release archive. Pass an archive path, or --download to
+fetch the latest release zipball into the downloads cache first.
+
+    python benchmarks/bench_extract.py path/to/firmware.zip --workers 1 4 8
+    python benchmarks/bench_extract.py --download
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mtfwbuilder.config import Settings  # noqa: E402
+from mtfwbuilder.services import archive_extractor, firmware_store, firmware_updater  # noqa: E402
+
+
+def _download_latest() -> Path:
+    settings = Settings()
+    info = firmware_updater.get_latest_release_info(settings)
+    if not info:
+        raise SystemExit("Could not fetch release info from GitHub")
+    version = info["version"]
+    url = info["release_data"]["zipball_url"]
+    print(f"Downloading {version} from {url}")
+    return firmware_updater.download_archive(settings, url, firmware_store.version_dir_name(version))
+
+
+def _time(label: str, fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="bench_extract_") as tmp:
+            start = time.perf_counter()
+            fn(Path(tmp) / "out")
+            best = min(best, time.perf_counter() - start)
+    print(f"{label:<32} {best:8.2f}s")
+    return best
+
+
+def _baseline(archive: Path, dest: Path) -> None:
+    # What update_firmware did before: validate every name, then extractall
+    with zipfile.ZipFile(archive, "r") as zf:
+        for name in zf.namelist():
+            if name.startswith("/") or ".." in name.split("/"):
+                raise ValueError(name)
+        zf.extractall(dest)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archive", nargs="?", type=Path, help="Firmware source zip")
+    parser.add_argument("--download", action="store_true", help="Download the latest release zipball")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, archive_extractor.DEFAULT_WORKERS])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant; best time is reported")
+    args = parser.parse_args()
+
+    if args.download:
+        archive = _download_latest()
+    elif args.archive:
+        archive = args.archive
+    else:
+        parser.error("pass an archive path or --download")
+
+    with zipfile.ZipFile(archive) as zf:
+        infos = zf.infolist()
+    total = sum(i.file_size for i in infos)
+    print(f"{archive.name}: {len(infos)} entries, {total / 1024 / 1024:.1f} MiB uncompressed\n")
+
+    baseline = _time("zipfile.extractall", lambda d: _baseline(archive, d), args.repeat)
+    for workers in args.workers:
+        elapsed = _time(
+            f"extract_zip (workers={workers})",
+            lambda d: archive_extractor.extract_zip(archive, d, strip_top_dir=True, workers=workers),
+            args.repeat,
+        )
+        print(f"{'':<32} {baseline / elapsed:8.2f}x vs extractall")
+
+
+if __name__ == "__main__":
+    main()
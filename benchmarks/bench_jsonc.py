@@ -0,0 +1,79 @@
+"""Micro-benchmark userPrefs.jsonc generation on large fleet configs.
+
+Compares the table-driven generator with the procedural one in
+utils/jsonc_generator.py, which scans every key once per channel.
+
+    python benchmarks/bench_jsonc.py --extra-keys 0 500 5000
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mtfwbuilder.services.jsonc_generator import generate_jsonc  # noqa: E402
+from utils.jsonc_generator import generate_jsonc as procedural_generate_jsonc  # noqa: E402
+
+
+def fleet_config(channels: int, extra_keys: int) -> dict:
+    """A fully populated config, plus unrelated form fields as fleet tooling tends to send."""
+    config = {
+        "channels_to_write": str(channels),
+        "device_name": "Fleet Node 042",
+        "owner_short_name": "F042",
+        "owner_long_name": "Fleet Node 042",
+        "tz_string": "EST5EDT,M3.2.0,M11.1.0",
+        "lora_enabled": "true",
+        "lora_region": "US",
+        "lora_modem_preset": "LONG_FAST",
+        "lora_ignore_mqtt": "true",
+        "gps_enabled": "true",
+        "gps_mode": "ENABLED",
+        "fixed_position": "true",
+        "fixed_lat": "40.7128",
+        "fixed_lon": "-74.0060",
+        "network_enabled": "true",
+        "wifi_enabled": "true",
+        "wifi_ssid": "fleet",
+        "wifi_psk": "secret",
+        "mqtt_enabled": "true",
+        "mqtt_address": "mqtt.example.com",
+        "mqtt_tls_enabled": "true",
+        "admin_key_0": "base64:" + "A" * 43 + "=",
+    }
+    for i in range(channels):
+        config[f"channel_{i}[name]"] = f"Ch{i}"
+        config[f"channel_{i}[psk]"] = "deadbeef" * 8
+        config[f"channel_{i}[precision]"] = "13"
+        config[f"channel_{i}[uplink_enabled]"] = "true"
+        config[f"channel_{i}[downlink_enabled]"] = "false"
+    for i in range(extra_keys):
+        config[f"fleet_meta_{i}"] = "x"
+    return config
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--extra-keys", type=int, nargs="+", default=[0, 500, 5000])
+    parser.add_argument("--number", type=int, default=0, help="Calls per timing (0 = auto)")
+    args = parser.parse_args()
+
+    print(f"{'extra keys':>10} {'procedural':>14} {'table-driven':>14} {'speedup':>8}")
+    for extra in args.extra_keys:
+        config = fleet_config(args.channels, extra)
+        assert generate_jsonc(config) == procedural_generate_jsonc(config)
+        timings = []
+        for fn in (procedural_generate_jsonc, generate_jsonc):
+            timer = timeit.Timer(lambda: fn(config))
+            number = args.number or timer.autorange()[0]
+            timings.append(min(timer.repeat(5, number)) / number)
+        old, new = timings
+        print(f"{extra:>10} {old * 1e6:>11.1f} µs {new * 1e6:>11.1f} µs {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
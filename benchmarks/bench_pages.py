@@ -0,0 +1,65 @@
+"""Benchmark HTML page throughput with and without the rendered page cache.
+
+Drives the ASGI app in-process (no network), so the numbers isolate
+rendering and routing cost.
+
+    python benchmarks/bench_pages.py --requests 500
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from mtfwbuilder.config import Settings  # noqa: E402
+from mtfwbuilder.main import create_app  # noqa: E402
+from mtfwbuilder.services.device_registry import DeviceRegistry  # noqa: E402
+
+PAGES = ["/", "/firmware-builder", "/admin"]
+
+
+async def _run(page_cache: bool, requests: int, revalidate: bool) -> dict[str, float]:
+    app = create_app()
+    settings = Settings(page_cache=page_cache)
+    app.state.settings = settings
+    app.state.device_registry = DeviceRegistry(settings.devices_file)
+
+    results = {}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for page in PAGES:
+            headers = {}
+            first = await client.get(page)
+            first.raise_for_status()
+            if revalidate and "etag" in first.headers:
+                headers["If-None-Match"] = first.headers["etag"]
+            start = time.perf_counter()
+            for _ in range(requests):
+                await client.get(page, headers=headers)
+            results[page] = requests / (time.perf_counter() - start)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="Requests per page per mode")
+    args = parser.parse_args()
+
+    modes = [
+        ("uncached (before)", False, False),
+        ("cached", True, False),
+        ("cached + If-None-Match", True, True),
+    ]
+    rows = {label: asyncio.run(_run(cache, args.requests, revalidate)) for label, cache, revalidate in modes}
+
+    print(f"{'page':<20}" + "".join(f"{label:>26}" for label, _, _ in modes))
+    for page in PAGES:
+        print(f"{page:<20}" + "".join(f"{rows[label][page]:>22.0f} r/s" for label, _, _ in modes))
+
+
+if __name__ == "__main__":
+    main()
@@ -39,11 +39,15 @@ def get_session_token(request: Request) -> Optional[str]:
     return request.cookies.get(SESSION_COOKIE)
 
 
+def is_admin(request: Request) -> bool:
+    """Whether the request carries a valid admin session."""
+    token = get_session_token(request)
+    return bool(token) and validate_session_token(token, request.app.state.settings)
+
+
 async def require_admin(request: Request) -> None:
     """FastAPI dependency that requires a valid admin session."""
-    settings: Settings = request.app.state.settings
-    token = get_session_token(request)
-    if not token or not validate_session_token(token, settings):
+    if not is_admin(request):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Admin authentication required",
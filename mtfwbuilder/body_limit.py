@@ -0,0 +1,78 @@
+"""Request body size limits, enforced while the body streams in.
+
+A request whose Content-Length is over its route's limit is answered 413
+before any of the body is read. Otherwise (chunked bodies, or a client that
+understates the length) the bytes are counted as the app receives them and
+the read that crosses the limit raises a 413 HTTPException, so neither
+request.form() nor a streaming reader ever holds more than the limit.
+"""
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from mtfwbuilder.config import Settings
+
+# Routes with their own limit: path -> Settings attribute; the rest use max_body_bytes
+ROUTE_LIMITS = {
+    "/api/v1/build-firmware": "upload_max_body_bytes",
+    "/api/v1/preview-userprefs": "upload_max_body_bytes",
+    "/api/v1/bulk-generate": "bulk_max_bytes",
+}
+
+
+def body_limit(settings: Settings, path: str) -> int:
+    """Maximum request body size for path in bytes (0 = unlimited)."""
+    return getattr(settings, ROUTE_LIMITS.get(path, "max_body_bytes"))
+
+
+def too_large_detail(limit: int) -> str:
+    if limit >= 1024 * 1024:
+        return f"Request body too large (max {limit // (1024 * 1024)}MB)"
+    return f"Request body too large (max {limit // 1024}KB)"
+
+
+class BodyLimitMiddleware:
+    """ASGI middleware applying body_limit() to every HTTP request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = body_limit(scope["app"].state.settings, scope["path"])
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        declared = _content_length(scope)
+        if declared is not None and declared > limit:
+            response = JSONResponse({"detail": too_large_detail(limit)}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=too_large_detail(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _content_length(scope: Scope) -> int | None:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None  # the server rejects malformed lengths itself
+    return None
@@ -24,21 +24,50 @@ class Settings(BaseSettings):
     temp_dir: Path = Path("/tmp/meshtastic_config")
     database_path: Optional[Path] = None
     devices_file: Optional[Path] = None
+    registry_cache_dir: Optional[Path] = None  # parsed variants.yaml, keyed by file hash
+    static_build_dir: Optional[Path] = None  # fingerprinted + precompressed static assets
+    rate_limit_path: Optional[Path] = None  # token buckets shared by all workers (SQLite)
+    firmware_import_dir: Optional[Path] = None  # local archives / git mirrors for offline installs
 
     # Build settings
     max_queue_size: int = 5
     build_timeout_seconds: int = 900  # 15 minutes
     cleanup_interval_seconds: int = 1800  # 30 minutes
     build_max_age_seconds: int = 3600  # 1 hour
+    failed_build_ttl_seconds: int = 3600  # compile failures answered from cache for this long; 0 disables
+
+    # Device registry
+    registry_reload_interval: float = 2.0  # seconds between variants.yaml change checks; 0 disables
+
+    # Firmware source
+    firmware_keep_versions: int = 3  # installed versions kept side by side
+    firmware_update_mode: str = "incremental"  # or "full"; incremental keeps mtimes of unchanged files
+    github_api_url: str = "https://api.github.com"
+    firmware_repo: str = "meshtastic/firmware"
 
     # Auth
     admin_password_hash: str = ""
     secret_key: str = "change-me-in-production"  # Auto-generated on config.json migration; override in config.yaml for fresh installs
     session_max_age: int = 3600  # 1 hour
 
-    # Rate limiting
-    build_rate_limit: str = "5/minute"
+    # Request body limits in bytes, enforced as the body streams in (413 past them; 0 = unlimited)
+    max_body_bytes: int = 256 * 1024  # any route without its own limit below
+    upload_max_body_bytes: int = 128 * 1024  # build-firmware, preview-userprefs (multipart)
+    userprefs_max_bytes: int = 64 * 1024  # the uploaded userPrefs file itself
+
+    # Bulk config generation (/api/v1/bulk-generate)
+    bulk_max_rows: int = 100_000
+    bulk_max_bytes: int = 64 * 1024 * 1024  # request body, spooled to disk past 1MB
+
+    # Pages
+    page_cache: bool = True  # serve rendered pages from memory until templates or the registry change
+
+    # Rate limiting: token buckets per client (or "admin"); "" = unlimited
+    api_rate_limit: str = "600/minute"  # every API request costs 1
+    build_rate_limit: str = "60/hour"  # a build costs its predicted minutes
     login_rate_limit: str = "10/minute"
+    rate_limit_overrides: dict[str, dict[str, str]] = {}  # identity -> bucket -> quota
+    build_estimate_seconds: int = 300  # predicted build time for variants not built yet
 
     # Logging
     log_level: str = "INFO"
@@ -51,8 +80,16 @@ class Settings(BaseSettings):
             self.firmware_dir = self.base_dir / "firmware"
         if self.database_path is None:
             self.database_path = self.base_dir / "mtfwbuilder.db"
+        if self.firmware_import_dir is None:
+            self.firmware_import_dir = self.base_dir / "imports"
         if self.devices_file is None:
             self.devices_file = self.base_dir / "devices" / "variants.yaml"
+        if self.registry_cache_dir is None:
+            self.registry_cache_dir = self.temp_dir / "registry_cache"
+        if self.static_build_dir is None:
+            self.static_build_dir = self.temp_dir / "static_assets"
+        if self.rate_limit_path is None:
+            self.rate_limit_path = self.temp_dir / "rate_limits.db"
 
 
 def load_settings() -> Settings:
@@ -1,4 +1,10 @@
-"""SQLite database initialization and access (raw SQL, no ORM)."""
+"""SQLite database initialization and access (raw SQL, no ORM).
+
+The database is shared by every uvicorn worker: the builds table is where a
+build queued by one worker is found, claimed and reported by another.
+"""
+
+import sqlite3
 
 import aiosqlite
 
@@ -30,17 +36,65 @@ CREATE INDEX IF NOT EXISTS idx_builds_status ON builds(status);
 CREATE INDEX IF NOT EXISTS idx_builds_created ON builds(created_at);
 """
 
+# Columns added after the first release: (table, column, definition), applied in order
+MIGRATIONS = [
+    ("config_profiles", "parent_id", "INTEGER REFERENCES config_profiles(id)"),
+    ("config_profiles", "kind", "TEXT NOT NULL DEFAULT 'node'"),
+    ("config_profiles", "org", "TEXT NOT NULL DEFAULT ''"),
+    ("config_profiles", "revision", "INTEGER NOT NULL DEFAULT 1"),
+    ("builds", "firmware_version", "TEXT"),
+    ("builds", "config_hash", "TEXT NOT NULL DEFAULT ''"),
+    ("builds", "cache_key", "TEXT"),
+    ("builds", "config_content", "TEXT"),  # userPrefs (channel keys): cleared once claimed
+    ("builds", "deterministic", "INTEGER NOT NULL DEFAULT 0"),  # cached failure (failure_cache)
+    ("builds", "failure_hits", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+POST_MIGRATION_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_profiles_org ON config_profiles(org, kind);
+CREATE INDEX IF NOT EXISTS idx_profiles_parent ON config_profiles(parent_id);
+CREATE INDEX IF NOT EXISTS idx_builds_cache_key ON builds(cache_key);
+"""
+
+# Deepest base -> overlay chain a profile may have
+MAX_PROFILE_DEPTH = 8
+
+# Queued builds nobody started within this long are abandoned
+BUILD_CLAIM_SECONDS = 1800
+
+# Workers wait this long for each other's write locks
+BUSY_TIMEOUT_SECONDS = 10.0
+
 
 async def init_db(settings: Settings) -> None:
-    """Create tables if they don't exist."""
-    async with aiosqlite.connect(settings.database_path) as db:
+    """Create tables if they don't exist. Safe to run from several workers at once."""
+    async with aiosqlite.connect(settings.database_path, timeout=BUSY_TIMEOUT_SECONDS) as db:
+        # WAL: page and build-progress reads don't wait for another worker's write
+        await db.execute("PRAGMA journal_mode=WAL")
         await db.executescript(SCHEMA)
+        # Migrate under the write lock, so workers starting together take turns
+        await db.execute("BEGIN IMMEDIATE")
+        await _migrate(db)
         await db.commit()
+        await db.executescript(POST_MIGRATION_SCHEMA)
+        await db.commit()
+
+
+async def _migrate(db: aiosqlite.Connection) -> None:
+    """Add MIGRATIONS columns missing from databases created by older versions."""
+    for table, column, definition in MIGRATIONS:
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in await cursor.fetchall()}:
+            try:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
 
 
 async def get_db(settings: Settings) -> aiosqlite.Connection:
     """Get a database connection."""
-    db = await aiosqlite.connect(settings.database_path)
+    db = await aiosqlite.connect(settings.database_path, timeout=BUSY_TIMEOUT_SECONDS)
     db.row_factory = aiosqlite.Row
     return db
 
@@ -52,13 +106,51 @@ async def record_build(
     architecture: str,
     firmware_format: str,
     status: str = "queued",
-) -> None:
-    """Insert a new build record."""
+    firmware_version: str | None = None,
+    config_hash: str = "",
+    cache_key: str | None = None,
+    config_content: str | None = None,
+    max_active: int | None = None,
+) -> bool:
+    """Insert a new build record.
+
+    With max_active, the insert only happens while fewer builds than that are
+    queued or running (across all workers); returns False when the queue is full.
+    """
     await db.execute(
-        "INSERT INTO builds (id, variant, architecture, firmware_format, status) VALUES (?, ?, ?, ?, ?)",
-        (build_id, variant, architecture, firmware_format, status),
+        "UPDATE builds SET status = 'failed', error_message = 'Build was never started', "
+        "config_content = NULL, completed_at = CURRENT_TIMESTAMP "
+        "WHERE status = 'queued' AND created_at < datetime('now', ?)",
+        (f"-{BUILD_CLAIM_SECONDS} seconds",),
+    )
+    cursor = await db.execute(
+        "INSERT INTO builds (id, variant, architecture, firmware_format, status, "
+        "firmware_version, config_hash, cache_key, config_content) "
+        "SELECT ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE ? IS NULL OR "
+        "(SELECT COUNT(*) FROM builds WHERE status IN ('queued', 'running') AND created_at > datetime('now', ?)) < ?",
+        (
+            build_id, variant, architecture, firmware_format, status,
+            firmware_version, config_hash, cache_key, config_content,
+            max_active, f"-{BUILD_CLAIM_SECONDS} seconds", max_active,
+        ),
     )
     await db.commit()
+    return cursor.rowcount == 1
+
+
+async def claim_build(db: aiosqlite.Connection, build_id: str) -> bool:
+    """Move a queued build to running. Only one caller, in any worker, gets True."""
+    cursor = await db.execute(
+        "UPDATE builds SET status = 'running', config_content = NULL WHERE id = ? AND status = 'queued'",
+        (build_id,),
+    )
+    await db.commit()
+    return cursor.rowcount == 1
+
+
+async def delete_build(db: aiosqlite.Connection, build_id: str) -> None:
+    await db.execute("DELETE FROM builds WHERE id = ?", (build_id,))
+    await db.commit()
 
 
 async def update_build_status(
@@ -68,6 +160,7 @@ async def update_build_status(
     firmware_path: str | None = None,
     build_log: str | None = None,
     error_message: str | None = None,
+    deterministic: bool = False,
 ) -> None:
     """Update build status and optional fields."""
     fields = ["status = ?"]
@@ -82,8 +175,11 @@ async def update_build_status(
     if error_message is not None:
         fields.append("error_message = ?")
         values.append(error_message)
+    if deterministic:
+        fields.append("deterministic = 1")
     if status in ("complete", "failed"):
         fields.append("completed_at = CURRENT_TIMESTAMP")
+        fields.append("config_content = NULL")
 
     values.append(build_id)
     await db.execute(f"UPDATE builds SET {', '.join(fields)} WHERE id = ?", values)
@@ -106,3 +202,131 @@ async def get_recent_builds(db: aiosqlite.Connection, limit: int = 20) -> list[d
     )
     rows = await cursor.fetchall()
     return [dict(row) for row in rows]
+
+
+async def get_cached_failure(db: aiosqlite.Connection, cache_key: str, ttl: int) -> dict | None:
+    """The newest deterministic failure of cache_key within the last ttl seconds, counting the hit."""
+    if ttl <= 0:
+        return None
+    cursor = await db.execute(
+        "UPDATE builds SET failure_hits = failure_hits + 1 WHERE id = ("
+        "SELECT id FROM builds WHERE cache_key = ? AND deterministic = 1 "
+        "AND completed_at > datetime('now', ?) ORDER BY completed_at DESC LIMIT 1) "
+        "RETURNING id, error_message, build_log, CAST(strftime('%s', completed_at) AS REAL) AS failed_at",
+        (cache_key, f"-{ttl} seconds"),
+    )
+    row = await cursor.fetchone()
+    await db.commit()
+    return dict(row) if row is not None else None
+
+
+async def forget_failures(db: aiosqlite.Connection, cache_key: str | None = None) -> int:
+    """Stop serving cached failures, of one cache key or all. Returns how many were dropped."""
+    if cache_key is None:
+        cursor = await db.execute("UPDATE builds SET deterministic = 0 WHERE deterministic = 1")
+    else:
+        cursor = await db.execute(
+            "UPDATE builds SET deterministic = 0 WHERE deterministic = 1 AND cache_key = ?", (cache_key,)
+        )
+    await db.commit()
+    return cursor.rowcount
+
+
+async def failure_stats(db: aiosqlite.Connection, ttl: int) -> dict:
+    """Cached failures still being served, and how often they answered a build."""
+    cursor = await db.execute(
+        "SELECT COUNT(*), COALESCE(SUM(failure_hits), 0) FROM builds "
+        "WHERE deterministic = 1 AND completed_at > datetime('now', ?)",
+        (f"-{max(ttl, 0)} seconds",),
+    )
+    entries, hits = await cursor.fetchone()
+    return {"entries": entries, "hits": hits}
+
+
+async def create_profile(
+    db: aiosqlite.Connection,
+    name: str,
+    config_json: str,
+    kind: str = "node",
+    org: str = "",
+    parent_id: int | None = None,
+) -> int:
+    """Insert a config profile and return its ID."""
+    cursor = await db.execute(
+        "INSERT INTO config_profiles (name, config_json, kind, org, parent_id) VALUES (?, ?, ?, ?, ?)",
+        (name, config_json, kind, org, parent_id),
+    )
+    await db.commit()
+    return cursor.lastrowid
+
+
+async def update_profile(
+    db: aiosqlite.Connection,
+    profile_id: int,
+    name: str,
+    config_json: str,
+    kind: str,
+    org: str,
+    parent_id: int | None,
+) -> bool:
+    """Replace a profile's fields and bump its revision. False if it doesn't exist."""
+    cursor = await db.execute(
+        "UPDATE config_profiles SET name = ?, config_json = ?, kind = ?, org = ?, parent_id = ?, "
+        "revision = revision + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (name, config_json, kind, org, parent_id, profile_id),
+    )
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+async def get_profile(db: aiosqlite.Connection, profile_id: int) -> dict | None:
+    """Get a config profile by ID."""
+    cursor = await db.execute("SELECT * FROM config_profiles WHERE id = ?", (profile_id,))
+    row = await cursor.fetchone()
+    if row is None:
+        return None
+    return dict(row)
+
+
+async def list_profiles(db: aiosqlite.Connection, org: str | None = None, kind: str | None = None) -> list[dict]:
+    """List config profiles, optionally of one org and/or kind, without their configs."""
+    query = "SELECT id, name, kind, org, parent_id, revision, created_at, updated_at FROM config_profiles"
+    clauses, values = [], []
+    if org is not None:
+        clauses.append("org = ?")
+        values.append(org)
+    if kind is not None:
+        clauses.append("kind = ?")
+        values.append(kind)
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    cursor = await db.execute(query + " ORDER BY org, kind, name", values)
+    rows = await cursor.fetchall()
+    return [dict(row) for row in rows]
+
+
+async def get_profile_chain(db: aiosqlite.Connection, profile_id: int) -> list[dict]:
+    """A profile and its ancestors, root base first. Empty if it doesn't exist.
+
+    Stops after MAX_PROFILE_DEPTH levels; writes keep chains shorter and acyclic.
+    """
+    cursor = await db.execute(
+        """
+        WITH RECURSIVE chain(id, depth) AS (
+            SELECT id, 0 FROM config_profiles WHERE id = ?
+            UNION ALL
+            SELECT p.parent_id, chain.depth + 1 FROM config_profiles p JOIN chain ON p.id = chain.id
+            WHERE p.parent_id IS NOT NULL AND chain.depth < ?
+        )
+        SELECT config_profiles.* FROM chain JOIN config_profiles USING (id) ORDER BY chain.depth DESC
+        """,
+        (profile_id, MAX_PROFILE_DEPTH),
+    )
+    rows = await cursor.fetchall()
+    return [dict(row) for row in rows]
+
+
+async def profile_has_children(db: aiosqlite.Connection, profile_id: int) -> bool:
+    """Whether any profile inherits from profile_id."""
+    cursor = await db.execute("SELECT 1 FROM config_profiles WHERE parent_id = ? LIMIT 1", (profile_id,))
+    return await cursor.fetchone() is not None
@@ -0,0 +1,22 @@
+"""Conditional GET helpers — ETag matching and 304 responses."""
+
+from fastapi import Request, Response
+
+# Cacheable, but revalidated on every use (cheap with an ETag)
+REVALIDATE = "no-cache"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match names etag (weak comparison, as RFC 9110 requires for GET)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in header.split(","))
+
+
+def not_modified(etag: str, cache_control: str = REVALIDATE) -> Response:
+    """Empty 304 carrying the validator headers the full response would have had."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
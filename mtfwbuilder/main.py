@@ -1,16 +1,24 @@
 """FastAPI application factory and lifespan."""
 
+import asyncio
+import contextlib
 import logging
 import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 
+from mtfwbuilder.body_limit import BodyLimitMiddleware
 from mtfwbuilder.config import load_settings
 from mtfwbuilder.database import init_db
-from mtfwbuilder.services.device_registry import DeviceRegistry
+from mtfwbuilder.page_cache import PageCache
+from mtfwbuilder.rate_limit import RateLimiter
+from mtfwbuilder.services.jsonc_cache import JsoncCache
+from mtfwbuilder.services.profiles import ProfileCache
+from mtfwbuilder.static_assets import PrecompressedStaticFiles, StaticAssets
+from mtfwbuilder.services.device_registry import DeviceRegistry, refresh_registry, watch_registry
 
 
 def setup_logging(log_level: str, log_json: bool) -> None:
@@ -53,15 +61,33 @@ async def lifespan(app: FastAPI):
     # Ensure temp directory exists
     os.makedirs(settings.temp_dir, exist_ok=True)
 
+    # Compiled templates survive restarts (Jinja re-checks each template's mtime)
+    bytecode_dir = settings.temp_dir / "jinja_bytecode"
+    os.makedirs(bytecode_dir, exist_ok=True)
+    app.state.templates.env.bytecode_cache = FileSystemBytecodeCache(str(bytecode_dir))
+
+    # Fingerprint and precompress static files (reuses anything prebuilt)
+    try:
+        count = await asyncio.to_thread(app.state.static_assets.build, settings.static_build_dir)
+        logger.info(f"Built {count} static assets into {settings.static_build_dir}")
+    except OSError as e:
+        logger.warning(f"Static asset build failed, serving unfingerprinted files: {e}")
+
     # Initialize database
     await init_db(settings)
     logger.info(f"Database initialized at {settings.database_path}")
 
     # Load device registry
-    registry = DeviceRegistry(settings.devices_file)
+    registry = DeviceRegistry(settings.devices_file, settings.registry_cache_dir)
+    registry = await asyncio.to_thread(refresh_registry, registry, settings) or registry
     app.state.device_registry = registry
     logger.info(f"Loaded {registry.count} device variants")
 
+    # Hot reload: swap in a new registry when variants.yaml or the firmware changes
+    registry_watcher = None
+    if settings.registry_reload_interval > 0:
+        registry_watcher = asyncio.create_task(watch_registry(app.state, settings))
+
     # Initialize build system
     from mtfwbuilder.services.build_service import init_build_system
 
@@ -71,6 +97,11 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("Shutting down MTFWBuilder")
+    app.state.rate_limiter.close()
+    if registry_watcher is not None:
+        registry_watcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await registry_watcher
 
 
 def create_app() -> FastAPI:
@@ -88,30 +119,37 @@ def create_app() -> FastAPI:
     template_dir = os.path.join(base_dir, "templates")
 
     app.state.templates = Jinja2Templates(directory=template_dir)
+    app.state.static_assets = StaticAssets(static_dir)
+    app.state.templates.env.globals["static_url"] = app.state.static_assets.url
+    app.state.page_cache = PageCache(app.state.templates, app.state.static_assets)
+    app.state.jsonc_cache = JsoncCache()
+    app.state.profile_cache = ProfileCache()
 
-    # Rate limiting
-    from slowapi import _rate_limit_exceeded_handler
-    from slowapi.errors import RateLimitExceeded
-    from mtfwbuilder.rate_limit import limiter
+    # Rate limiting: token buckets in settings.rate_limit_path, shared by all workers
+    app.state.rate_limiter = RateLimiter()
 
-    app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    # Request body caps (per route, from settings), checked as bodies stream in
+    app.add_middleware(BodyLimitMiddleware)
 
     # Routers
     from mtfwbuilder.routers.config_generator import router as config_router
     from mtfwbuilder.routers.firmware_builder import router as firmware_router
     from mtfwbuilder.routers.admin import router as admin_router
     from mtfwbuilder.routers.pages import router as pages_router
+    from mtfwbuilder.routers.profiles import router as profiles_router
+    from mtfwbuilder.routers.variants import router as variants_router
 
     app.include_router(config_router)
     app.include_router(firmware_router)
     app.include_router(admin_router)
     app.include_router(pages_router)
+    app.include_router(profiles_router)
+    app.include_router(variants_router)
 
     # Static files mount AFTER routers — Starlette matches routes in order,
     # and /static must not shadow API routes, but url_for('static') still works
     if os.path.isdir(static_dir):
-        app.mount("/static", StaticFiles(directory=static_dir), name="static")
+        app.mount("/static", PrecompressedStaticFiles(directory=static_dir, assets=app.state.static_assets), name="static")
 
     return app
 
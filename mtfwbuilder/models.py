@@ -1,6 +1,6 @@
 """Pydantic models for request/response validation."""
 
-from typing import Optional
+from typing import Any, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -85,6 +85,27 @@ class BuildRequest(BaseModel):
     custom_filename: Optional[str] = None
 
 
+class ProfileRequest(BaseModel):
+    """A stored config profile: a layer of form fields over an optional base profile."""
+
+    name: str = Field(..., min_length=1, max_length=100)
+    config: dict[str, Any] = Field(default_factory=dict, description="Form fields, as for /api/v1/generate")
+    kind: Literal["base", "node"] = "node"
+    org: str = Field("", max_length=100)
+    parent_id: Optional[int] = Field(None, description="Base profile this one overlays")
+
+
+class FirmwareImportRequest(BaseModel):
+    """Request to install firmware from a local archive or git mirror."""
+
+    source: str = Field(..., description="Archive or git mirror name inside the import directory")
+    version: Optional[str] = Field(None, description="Version name; defaults to the ref or archive name")
+    ref: Optional[str] = Field(None, description="Tag or commit, required for git mirrors")
+    sha256: Optional[str] = None
+    mode: Optional[str] = None
+    force: bool = False
+
+
 class BuildStatus(BaseModel):
     """SSE event for build progress."""
 
@@ -95,6 +116,18 @@ class BuildStatus(BaseModel):
     error: Optional[str] = None
 
 
+class UpdateStatus(BaseModel):
+    """SSE event for firmware update progress."""
+
+    job_id: str
+    status: str
+    phase: str
+    message: Optional[str] = None
+    bytes_done: int = 0
+    bytes_total: int = 0
+    error: Optional[str] = None
+
+
 class BuildResult(BaseModel):
     """Result of a completed build."""
 
@@ -0,0 +1,90 @@
+"""Rendered HTML page cache.
+
+The site's pages are the same for every visitor: their content depends only
+on the templates, the device registry, the static asset fingerprints and the
+base URL links are generated against. Each rendering is kept keyed by those, served with a
+strong ETag, and dropped when the registry is reloaded.
+"""
+
+import hashlib
+import os
+import time
+
+from fastapi import Request, Response
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+
+from mtfwbuilder.http_cache import REVALIDATE, etag_matches, not_modified
+from mtfwbuilder.static_assets import StaticAssets
+
+# How often template files are re-stat'ed for edits
+TEMPLATE_CHECK_INTERVAL = 1.0
+MAX_CACHED_PAGES = 32
+
+
+class PageCache:
+    """Render-once cache for pages that depend only on registry and template versions."""
+
+    def __init__(self, templates: Jinja2Templates, assets: StaticAssets | None = None):
+        self.templates = templates
+        self.assets = assets
+        self._pages: dict[tuple, tuple[str, bytes]] = {}
+        self._registry_etag: str | None = None
+        self._template_version = ""
+        self._template_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def respond(self, request: Request, name: str, context: dict | None = None) -> Response:
+        """Serve template name, rendering it only when nothing cached matches.
+
+        context must not vary between requests other than through the
+        registry (e.g. a fixed page title); anything per-user belongs in an
+        uncached TemplateResponse.
+        """
+        context = {"request": request, **(context or {})}
+        if not request.app.state.settings.page_cache:
+            return self.templates.TemplateResponse(request, name, context)
+
+        registry_etag = request.app.state.device_registry.etag
+        if registry_etag != self._registry_etag:
+            # Registry reloaded: every page listing variants is stale
+            self._pages.clear()
+            self._registry_etag = registry_etag
+
+        assets_version = self.assets.version if self.assets else ""
+        key = (name, str(request.base_url), registry_etag, self.template_version(), assets_version)
+        cached = self._pages.get(key)
+        if cached is None:
+            self.misses += 1
+            body = self.templates.get_template(name).render(context).encode()
+            cached = (f'"{hashlib.sha256(body).hexdigest()[:20]}"', body)
+            if len(self._pages) >= MAX_CACHED_PAGES:
+                self._pages.pop(next(iter(self._pages)))
+            self._pages[key] = cached
+        else:
+            self.hits += 1
+
+        etag, body = cached
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return HTMLResponse(content=body, headers={"ETag": etag, "Cache-Control": REVALIDATE})
+
+    def template_version(self) -> str:
+        """Fingerprint of the template files, re-checked at most every TEMPLATE_CHECK_INTERVAL."""
+        now = time.monotonic()
+        if now - self._template_checked_at >= TEMPLATE_CHECK_INTERVAL or not self._template_version:
+            self._template_checked_at = now
+            self._template_version = _tree_signature(self.templates.env.loader.searchpath)
+        return self._template_version
+
+
+def _tree_signature(roots: list[str]) -> str:
+    digest = hashlib.sha256()
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                st = os.stat(os.path.join(dirpath, filename))
+                digest.update(f"{dirpath}/{filename}:{st.st_mtime_ns}:{st.st_size};".encode())
+    return digest.hexdigest()[:16]
@@ -1,7 +1,180 @@
-"""Rate limiting configuration — shared limiter instance."""
+"""Cost-weighted token-bucket rate limiting, shared across workers via SQLite.
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+Each (bucket, identity) pair, e.g. ("build", "203.0.113.7"), holds up to N
+tokens and refills continuously at N per period (a quota like "60/hour").
+A request spends tokens by cost: one for a preview, the predicted build
+minutes for a firmware build. Bucket levels live in a small SQLite file
+(WAL mode, one UPSERT per request), so every uvicorn worker sees the same
+levels and they survive restarts.
 
-# Shared limiter instance used by route decorators
-limiter = Limiter(key_func=get_remote_address)
+Identities are the client address, or "admin" for a valid admin session;
+rate_limit_overrides gives single identities their own quotas.
+"""
+
+import functools
+import logging
+import math
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException, Request
+
+from mtfwbuilder.auth import is_admin
+from mtfwbuilder.config import Settings
+
+logger = logging.getLogger("mtfwbuilder.rate_limit")
+
+# Bucket name -> Settings attribute holding its quota
+BUCKETS = {
+    "api": "api_rate_limit",
+    "build": "build_rate_limit",
+    "login": "login_rate_limit",
+}
+
+RATE_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_RATE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    granted INTEGER NOT NULL
+);
+"""
+
+# Refill the bucket up to capacity, then spend cost if that many tokens are there.
+# One statement, so concurrent workers can't both spend the same tokens.
+_ACQUIRE = """
+INSERT INTO buckets (key, tokens, updated, granted)
+VALUES (:key, :capacity - :cost, :now, 1)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + max(0, :now - updated) * :rate)
+        - CASE WHEN min(:capacity, tokens + max(0, :now - updated) * :rate) >= :cost THEN :cost ELSE 0 END,
+    granted = min(:capacity, tokens + max(0, :now - updated) * :rate) >= :cost,
+    updated = max(updated, :now)
+RETURNING tokens, granted
+"""
+
+
+@dataclass(frozen=True)
+class Rate:
+    """A quota: capacity tokens, refilled evenly over period seconds."""
+
+    capacity: float
+    period: float
+    text: str
+
+    @property
+    def per_second(self) -> float:
+        return self.capacity / self.period
+
+
+@functools.lru_cache(maxsize=64)
+def parse_rate(text: str) -> Rate:
+    """Parse "60/hour", "10 per minute" or "100/5 minutes". Raises ValueError."""
+    match = _RATE.match(text.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit {text!r}: use e.g. 60/hour")
+    capacity, multiple, unit = match.groups()
+    return Rate(capacity=float(capacity), period=int(multiple or 1) * RATE_UNITS[unit], text=text.strip())
+
+
+def quota(settings: Settings, bucket: str, identity: str) -> Rate | None:
+    """The quota for identity in bucket; None if the bucket is unlimited ("")."""
+    text = settings.rate_limit_overrides.get(identity, {}).get(bucket)
+    if text is None:
+        text = getattr(settings, BUCKETS[bucket])
+    return parse_rate(text) if text else None
+
+
+def client_identity(request: Request) -> str:
+    """Who a request is charged to."""
+    if is_admin(request):
+        return "admin"
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """Token buckets in SQLite files, one connection per file."""
+
+    def __init__(self):
+        self._connections: dict[Path, sqlite3.Connection] = {}
+
+    def acquire(self, path: Path, key: str, rate: Rate, cost: float, now: float | None = None) -> float:
+        """Spend cost tokens from key's bucket. Returns 0 if granted, else seconds until it would be.
+
+        A cost above the bucket's capacity is charged as the full bucket.
+        """
+        cost = min(cost, rate.capacity)
+        params = {
+            "key": key,
+            "capacity": rate.capacity,
+            "rate": rate.per_second,
+            "cost": cost,
+            "now": time.time() if now is None else now,
+        }
+        tokens, granted = self._connect(path).execute(_ACQUIRE, params).fetchone()
+        if granted:
+            return 0.0
+        return (cost - tokens) / rate.per_second
+
+    def reset(self) -> None:
+        """Refill every bucket (tests, or after changing quotas)."""
+        for conn in self._connections.values():
+            conn.execute("DELETE FROM buckets")
+
+    def close(self) -> None:
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def _connect(self, path: Path) -> sqlite3.Connection:
+        conn = self._connections.get(path)
+        if conn is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit; WAL with synchronous=NORMAL skips the fsync per request
+            # (a crash can lose the last few spends, which is fine for rate limits)
+            conn = sqlite3.connect(path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._connections[path] = conn
+        return conn
+
+
+def charge(request: Request, bucket: str, cost: float = 1) -> None:
+    """Spend cost tokens of the requester's bucket, or raise 429 with Retry-After.
+
+    Fails open: if the limiter's database is unavailable the request is let through.
+    """
+    settings = request.app.state.settings
+    identity = client_identity(request)
+    rate = quota(settings, bucket, identity)
+    if rate is None or cost <= 0:
+        return
+    try:
+        retry_after = request.app.state.rate_limiter.acquire(
+            settings.rate_limit_path, f"{bucket}:{identity}", rate, cost
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"Rate limiter unavailable, not limiting: {e}")
+        return
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded: {rate.text} for {bucket}",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def limit(bucket: str, cost: float = 1):
+    """Route dependency charging cost tokens from bucket."""
+
+    async def dependency(request: Request) -> None:
+        charge(request, bucket, cost)
+
+    return dependency
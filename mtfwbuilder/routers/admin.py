@@ -1,19 +1,31 @@
 """Admin routes — login, firmware update, cleanup, system info."""
 
-import asyncio
+import functools
 import logging
+from dataclasses import asdict
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
+from sse_starlette.sse import EventSourceResponse
+
+from mtfwbuilder import database
 from mtfwbuilder.auth import (
     SESSION_COOKIE,
     create_session_token,
     require_admin,
     verify_password,
 )
-from mtfwbuilder.rate_limit import limiter
+from mtfwbuilder.models import FirmwareImportRequest, UpdateStatus
+from mtfwbuilder.rate_limit import limit
 from mtfwbuilder.services.cleanup_service import cleanup_old_builds
-from mtfwbuilder.services.firmware_updater import get_firmware_version, update_firmware
+from mtfwbuilder.services.firmware_updater import (
+    UPDATE_MODES,
+    import_firmware,
+    list_import_sources,
+    resolve_import_source,
+    update_firmware,
+)
+from mtfwbuilder.services.update_jobs import UpdateInProgress, get_job, start_update_job
 
 logger = logging.getLogger("mtfwbuilder.admin")
 
@@ -23,12 +35,10 @@ router = APIRouter(tags=["admin"])
 @router.get("/admin")
 async def admin_page(request: Request):
     """Render the admin dashboard."""
-    templates = request.app.state.templates
-    return templates.TemplateResponse("admin.html", {"request": request, "title": "Admin Dashboard"})
+    return request.app.state.page_cache.respond(request, "admin.html", {"title": "Admin Dashboard"})
 
 
-@router.post("/admin/login")
-@limiter.limit("10/minute")
+@router.post("/admin/login", dependencies=[Depends(limit("login"))])
 async def admin_login(request: Request):
     """Authenticate admin and set session cookie."""
     settings = request.app.state.settings
@@ -62,22 +72,107 @@ async def admin_logout():
 
 
 @router.post("/api/v1/update-firmware", dependencies=[Depends(require_admin)])
-async def update_firmware_route(request: Request):
-    """Start firmware update from GitHub (admin only)."""
+async def update_firmware_route(request: Request, force: bool = False, mode: str | None = None):
+    """Start a background firmware update from GitHub (admin only).
+
+    Pass force=true to reinstall even when the latest release is already current,
+    and mode=full|incremental to override settings.firmware_update_mode.
+    """
     settings = request.app.state.settings
+    if mode is not None and mode not in UPDATE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown update mode: {mode}")
 
-    # Run firmware update in a thread (blocking I/O)
-    loop = asyncio.get_event_loop()
     try:
-        success = await loop.run_in_executor(None, update_firmware, settings)
-    except Exception as e:
-        logger.error(f"Firmware update error: {e}")
-        return {"success": False, "error": str(e)}
+        runner = functools.partial(update_firmware, force=force, mode=mode) if force or mode else None
+        job = start_update_job(settings, runner=runner)
+    except UpdateInProgress as e:
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "error": str(e), "job_id": e.job_id},
+        )
+
+    return {
+        "success": True,
+        "job_id": job.job_id,
+        "message": "Firmware update started.",
+        "progress_url": f"/api/v1/update-firmware/{job.job_id}/progress",
+    }
+
+
+@router.get("/api/v1/import-firmware/sources", dependencies=[Depends(require_admin)])
+async def import_sources(request: Request):
+    """List archives and git mirrors available for offline import (admin only)."""
+    settings = request.app.state.settings
+    return {
+        "success": True,
+        "import_dir": str(settings.firmware_import_dir),
+        "sources": list_import_sources(settings),
+    }
 
-    if success:
-        return {"success": True, "message": "Firmware updated successfully."}
-    else:
-        return {"success": False, "error": "Firmware update failed. Check logs for details."}
+
+@router.post("/api/v1/import-firmware", dependencies=[Depends(require_admin)])
+async def import_firmware_route(body: FirmwareImportRequest, request: Request):
+    """Start a background firmware install from a local archive or git mirror (admin only).
+
+    Progress and cancellation use the same job endpoints as update-firmware.
+    """
+    settings = request.app.state.settings
+    if body.mode is not None and body.mode not in UPDATE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown update mode: {body.mode}")
+    try:
+        resolve_import_source(settings, body.source)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    runner = functools.partial(
+        import_firmware,
+        source=body.source,
+        version=body.version,
+        ref=body.ref,
+        expected_sha256=body.sha256,
+        mode=body.mode,
+        force=body.force,
+    )
+    try:
+        job = start_update_job(settings, runner=runner, description=f"Import from {body.source}")
+    except UpdateInProgress as e:
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "error": str(e), "job_id": e.job_id},
+        )
+
+    return {
+        "success": True,
+        "job_id": job.job_id,
+        "message": f"Firmware import from {body.source} started.",
+        "progress_url": f"/api/v1/update-firmware/{job.job_id}/progress",
+    }
+
+
+@router.get("/api/v1/update-firmware/{job_id}/progress", dependencies=[Depends(require_admin)])
+async def update_firmware_progress(job_id: str, request: Request):
+    """SSE stream of firmware update phases and download progress (admin only)."""
+    job = get_job(job_id, request.app.state.settings)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Update job not found")
+
+    async def event_stream():
+        async for event in job.follow():
+            data = UpdateStatus(job_id=job.job_id, **asdict(event)).model_dump_json()
+            yield {"event": "status", "data": data}
+
+    return EventSourceResponse(event_stream())
+
+
+@router.post("/api/v1/update-firmware/{job_id}/cancel", dependencies=[Depends(require_admin)])
+async def cancel_firmware_update(job_id: str, request: Request):
+    """Cancel a running firmware update (admin only)."""
+    job = get_job(job_id, request.app.state.settings)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Update job not found")
+    if not job.cancel():
+        return JSONResponse(status_code=409, content={"success": False, "error": f"Update already {job.status}"})
+    return {"success": True, "message": "Cancellation requested."}
 
 
 @router.post("/api/v1/cleanup", dependencies=[Depends(require_admin)])
@@ -86,3 +181,14 @@ async def cleanup_route(request: Request):
     settings = request.app.state.settings
     removed = cleanup_old_builds(settings)
     return {"success": True, "message": f"Removed {removed} old build directories."}
+
+
+@router.delete("/api/v1/failed-builds", dependencies=[Depends(require_admin)])
+async def clear_failed_builds(request: Request):
+    """Forget all cached build failures, e.g. after fixing the toolchain (admin only)."""
+    db = await database.get_db(request.app.state.settings)
+    try:
+        cleared = await database.forget_failures(db)
+    finally:
+        await db.close()
+    return {"success": True, "message": f"Cleared {cleared} cached build failures."}
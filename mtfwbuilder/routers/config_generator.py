@@ -1,48 +1,77 @@
-"""Config generator API routes — /api/v1/generate, /api/v1/preview, /api/v1/download."""
+"""Config generator API routes — /api/v1/generate, /api/v1/preview, /api/v1/download,
+/api/v1/bulk-generate, /api/v1/generator-schema."""
 
 import json
 import logging
 
-from fastapi import APIRouter, Request, UploadFile, File, HTTPException
-from fastapi.responses import PlainTextResponse, Response
+from fastapi import APIRouter, Depends, Request, UploadFile, File, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
+from mtfwbuilder.http_cache import REVALIDATE, etag_matches, not_modified
 from mtfwbuilder.models import PreviewResponse, FilePreviewResponse
-from mtfwbuilder.services.jsonc_generator import generate_jsonc
+from mtfwbuilder.rate_limit import charge, limit
+from mtfwbuilder.services import bulk_generator
+from mtfwbuilder.services.jsonc_generator import export_schema
 
 logger = logging.getLogger("mtfwbuilder.config_generator")
 
-router = APIRouter(prefix="/api/v1", tags=["config"])
+router = APIRouter(prefix="/api/v1", tags=["config"], dependencies=[Depends(limit("api"))])
 
-MAX_UPLOAD_SIZE = 65536  # 64KB
+# Content-Type of a bulk request body -> input format
+BULK_INPUT_TYPES = {
+    "application/x-ndjson": bulk_generator.NDJSON,
+    "application/jsonl": bulk_generator.NDJSON,
+    "application/json": bulk_generator.NDJSON,
+    "text/csv": bulk_generator.CSV,
+}
+BULK_BYTES_PER_TOKEN = 16 * 1024  # roughly 50 rows of overrides
 
 
 @router.post("/generate")
 async def generate(request: Request) -> PreviewResponse:
     """Generate JSONC configuration from form data."""
-    try:
-        form_data = await request.json()
-        jsonc_content = generate_jsonc(form_data)
-
-        if form_data.get("preview_only", False):
-            return PreviewResponse(success=True, content=jsonc_content)
-
-        return PreviewResponse(success=True, content=jsonc_content)
-    except Exception as e:
-        logger.error(f"Config generation error: {e}")
-        return PreviewResponse(success=False, error=str(e))
+    return await _generate_cached(request, "Config generation")
 
 
 @router.post("/preview")
 async def preview(request: Request) -> PreviewResponse:
     """Generate a preview of the JSONC configuration."""
+    return await _generate_cached(request, "Preview")
+
+
+async def _generate_cached(request: Request, action: str):
+    """Memoized generation with an ETag; If-None-Match naming it gets an empty 304.
+
+    The 304 is sent for these POSTs too (rather than RFC 9110's 412): they are
+    safe, idempotent lookups, and the UI uses it to keep the preview it has.
+    """
     try:
         form_data = await request.json()
-        jsonc_content = generate_jsonc(form_data)
-        return PreviewResponse(success=True, content=jsonc_content)
+        etag, jsonc_content = request.app.state.jsonc_cache.generate(form_data)
+    except HTTPException:
+        raise  # e.g. 413 from the body limit
     except Exception as e:
-        logger.error(f"Preview error: {e}")
+        logger.error(f"{action} error: {e}")
         return PreviewResponse(success=False, error=str(e))
 
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return JSONResponse(
+        PreviewResponse(success=True, content=jsonc_content).model_dump(),
+        headers={"ETag": etag, "Cache-Control": REVALIDATE},
+    )
+
+
+@router.get("/generator-schema")
+async def generator_schema(request: Request) -> Response:
+    """Field mapping for the browser-side preview renderer (static/js/jsonc-preview.js)."""
+    schema = export_schema()
+    etag = f'"{schema["version"]}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return JSONResponse(schema, headers={"ETag": etag, "Cache-Control": REVALIDATE})
+
 
 @router.post("/download")
 async def download(request: Request) -> Response:
@@ -56,29 +85,79 @@ async def download(request: Request) -> Response:
             config_str = form.get("config", "{}")
             form_data = json.loads(config_str)
 
-        jsonc_content = generate_jsonc(form_data)
+        _, jsonc_content = request.app.state.jsonc_cache.generate(form_data)
 
         return Response(
             content=jsonc_content,
             media_type="application/json",
             headers={"Content-Disposition": "attachment; filename=userPrefs.jsonc"},
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Download error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/bulk-generate")
+async def bulk_generate(request: Request, format: str = bulk_generator.NDJSON, base: str | None = None) -> Response:
+    """Generate one userPrefs.jsonc per NDJSON line or CSV row of overrides on a base config.
+
+    The base config is the `base` query parameter (JSON) and/or a leading
+    {"$base": {...}} NDJSON line. The response streams NDJSON results, or a
+    zip of .jsonc files with format=zip.
+    """
+    settings = request.app.state.settings
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    input_format = BULK_INPUT_TYPES.get(content_type)
+    if input_format is None:
+        raise HTTPException(
+            status_code=415, detail="Send application/x-ndjson (one JSON object per line) or text/csv"
+        )
+    if format not in (bulk_generator.NDJSON, bulk_generator.ZIP):
+        raise HTTPException(status_code=400, detail="format must be ndjson or zip")
+
+    base_config = {}
+    if base:
+        try:
+            base_config = json.loads(base)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid base config: {e}")
+        if not isinstance(base_config, dict):
+            raise HTTPException(status_code=400, detail="Invalid base config: must be a JSON object")
+
+    # Beyond the request itself, a token per BULK_BYTES_PER_TOKEN of declared input
+    charge(request, "api", int(request.headers.get("content-length") or 0) // BULK_BYTES_PER_TOKEN)
+
+    body = await bulk_generator.spool_body(request.stream())
+
+    rows = bulk_generator.generate_rows(
+        bulk_generator.iter_records(body, input_format), base_config, settings.bulk_max_rows
+    )
+    if format == bulk_generator.ZIP:
+        return StreamingResponse(
+            bulk_generator.zip_stream(rows),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=userPrefs.zip"},
+            background=BackgroundTask(body.close),
+        )
+    return StreamingResponse(
+        bulk_generator.ndjson_stream(rows), media_type="application/x-ndjson", background=BackgroundTask(body.close)
+    )
+
+
 @router.post("/preview-userprefs")
-async def preview_userprefs(userPrefs: UploadFile = File(...)) -> FilePreviewResponse:
+async def preview_userprefs(request: Request, userPrefs: UploadFile = File(...)) -> FilePreviewResponse:
     """Preview an uploaded userPrefs.jsonc file content."""
+    max_bytes = request.app.state.settings.userprefs_max_bytes
     try:
         if not userPrefs.filename:
             return FilePreviewResponse(success=False, error="No file selected")
 
-        # Validate file size
-        contents = await userPrefs.read()
-        if len(contents) > MAX_UPLOAD_SIZE:
-            return FilePreviewResponse(success=False, error=f"File too large (max {MAX_UPLOAD_SIZE // 1024}KB)")
+        # Validate file size (reading at most one byte past the limit)
+        contents = await userPrefs.read(max_bytes + 1)
+        if len(contents) > max_bytes:
+            return FilePreviewResponse(success=False, error=f"File too large (max {max_bytes // 1024}KB)")
 
         # Validate content type
         file_content = contents.decode("utf-8")
@@ -1,26 +1,40 @@
 """Firmware builder API routes — build, download, SSE progress."""
 
+import asyncio
 import json
 import logging
 import re
+import shutil
 
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
 from fastapi.responses import FileResponse
 from sse_starlette.sse import EventSourceResponse
 
+from mtfwbuilder import database
+from mtfwbuilder.auth import is_admin
 from mtfwbuilder.models import BuildStatus
-from mtfwbuilder.rate_limit import limiter
-from mtfwbuilder.services import build_service
+from mtfwbuilder.rate_limit import charge, limit
+from mtfwbuilder.services import (
+    build_service,
+    config_canonical,
+    failure_cache,
+    firmware_store,
+    pio_env_index,
+    userprefs_validator,
+)
+from mtfwbuilder.services.build_service import BuildProgress
 from mtfwbuilder.services.cleanup_service import cleanup_build_directory
 from mtfwbuilder.services.jsonc_generator import generate_jsonc
 
 logger = logging.getLogger("mtfwbuilder.firmware_routes")
 
-router = APIRouter(prefix="/api/v1", tags=["firmware"])
+router = APIRouter(prefix="/api/v1", tags=["firmware"], dependencies=[Depends(limit("api"))])
+
+# Build log lines sent with the final progress event and kept in the build record
+BUILD_LOG_LINES = 100
 
 
 @router.post("/build-firmware")
-@limiter.limit("5/minute")
 async def start_build(request: Request):
     """Start a firmware build. Returns build_id for SSE progress tracking."""
     settings = request.app.state.settings
@@ -30,6 +44,8 @@ async def start_build(request: Request):
     variant_id = form.get("variant")
     config_source = form.get("config_source", "upload")
     custom_filename = form.get("custom_filename", "").strip()
+    firmware_version = form.get("firmware_version") or None
+    profile_id = form.get("profile_id") or None
 
     if not variant_id:
         raise HTTPException(status_code=400, detail="No device variant selected")
@@ -39,8 +55,21 @@ async def start_build(request: Request):
 
     variant = registry.get(variant_id)
 
+    if firmware_version is not None and not firmware_store.is_installed(settings, firmware_version):
+        raise HTTPException(status_code=400, detail=f"Firmware version not installed: {firmware_version}")
+
+    # Reject environments the firmware doesn't define before queueing a doomed build
+    env_index = await asyncio.to_thread(pio_env_index.get_index, settings, firmware_version)
+    if env_index is not None and variant_id not in env_index:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Device variant {variant_id} is not a build environment in firmware {env_index.version}",
+        )
+
     # Get config content
-    if config_source == "current":
+    if profile_id is not None:
+        config_content = await _profile_content(request, profile_id)
+    elif config_source == "current":
         config_json = form.get("config_json") or form.get("stored_config")
         if not config_json:
             raise HTTPException(status_code=400, detail="No configuration data provided")
@@ -54,30 +83,101 @@ async def start_build(request: Request):
         if upload is None:
             raise HTTPException(status_code=400, detail="No userPrefs file uploaded")
         if hasattr(upload, "read"):
-            raw = await upload.read()
-            if len(raw) > 65536:  # 64KB max, same as preview-userprefs
-                raise HTTPException(status_code=400, detail="File too large (max 64KB)")
+            max_bytes = settings.userprefs_max_bytes  # same as preview-userprefs
+            raw = await upload.read(max_bytes + 1)
+            if len(raw) > max_bytes:
+                raise HTTPException(status_code=400, detail=f"File too large (max {max_bytes // 1024}KB)")
             config_content = raw.decode("utf-8")
         else:
             config_content = str(upload)
 
-    # Create build context
-    build_id = build_service.generate_build_id()
-    ctx = build_service.BuildContext(
-        build_id=build_id,
-        variant=variant,
-        config_content=config_content,
-        settings=settings,
-    )
-
-    # Store build context for SSE endpoint with timestamp for TTL cleanup
+    try:
+        prefs = config_canonical.parse_prefs(config_content)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid userPrefs file: {e}")
+
+    # Catch what would otherwise be a compile error minutes into the build
+    enums = await asyncio.to_thread(userprefs_validator.firmware_enums, settings, firmware_version)
+    errors = userprefs_validator.validate(prefs, enums)
+    if errors:
+        raise HTTPException(
+            status_code=422,
+            detail={"message": "Invalid configuration", "errors": [e.to_dict() for e in errors]},
+        )
+
+    # Equivalent configs (generated or uploaded, any key order, comments) hash the same
+    config_hash = config_canonical.canonical_form(prefs).digest
+
+    # A config that failed to compile recently fails again: answer from cache
+    ttl = settings.failed_build_ttl_seconds
+    resolved_version, _ = firmware_store.resolve(settings, firmware_version)
+    key = build_service.cache_key(resolved_version, variant_id, config_hash)
+    db = await database.get_db(settings)
+    try:
+        if form.get("force_rebuild") in ("1", "true", "on"):
+            if not is_admin(request):
+                raise HTTPException(status_code=403, detail="Only admins can force a rebuild")
+            if await database.forget_failures(db, key):
+                logger.info(f"Admin forced rebuild of cached failure {key}")
+        elif (row := await database.get_cached_failure(db, key, ttl)) is not None:
+            cached = failure_cache.CachedFailure.from_row(row, ttl).to_dict()
+            raise HTTPException(
+                status_code=422,
+                detail={"message": "This configuration failed to build recently", "cached": True, **cached},
+                headers={"Retry-After": str(cached["retry_after"])},
+            )
+
+        # Create build context
+        build_id = build_service.generate_build_id()
+        ctx = build_service.BuildContext(
+            build_id=build_id,
+            variant=variant,
+            config_content=config_content,
+            settings=settings,
+            config_hash=config_hash,
+            firmware_version=firmware_version,
+        )
+
+        # Queue it where every worker can find it; the queue limit is global
+        queued = await database.record_build(
+            db,
+            build_id,
+            variant.id,
+            variant.architecture,
+            variant.firmware_format,
+            firmware_version=ctx.firmware_version,
+            config_hash=config_hash,
+            cache_key=ctx.cache_key,
+            config_content=config_content,
+            max_active=settings.max_queue_size,
+        )
+        if not queued:
+            shutil.rmtree(ctx.build_dir, ignore_errors=True)
+            raise HTTPException(
+                status_code=503, detail="Build queue is full, try again later", headers={"Retry-After": "60"}
+            )
+
+        # Builds are charged by how long they hold the build slot: a token per predicted minute
+        try:
+            charge(request, "build", max(1, round(build_service.predicted_duration(variant_id, settings) / 60)))
+        except HTTPException:
+            await database.delete_build(db, build_id)
+            shutil.rmtree(ctx.build_dir, ignore_errors=True)
+            raise
+    finally:
+        await db.close()
+
+    # Keep the context for an SSE connection to this worker, with timestamp for TTL cleanup
     if not hasattr(request.app.state, "active_builds"):
         request.app.state.active_builds = {}
 
     # TTL cleanup: remove entries older than 30 minutes
     import time as _time
     now = _time.time()
-    stale = [k for k, v in request.app.state.active_builds.items() if now - getattr(v, "_created_at", 0) > 1800]
+    stale = [
+        k for k, v in request.app.state.active_builds.items()
+        if now - getattr(v, "_created_at", 0) > database.BUILD_CLAIM_SECONDS
+    ]
     for k in stale:
         request.app.state.active_builds.pop(k, None)
 
@@ -88,22 +188,66 @@ async def start_build(request: Request):
         "success": True,
         "build_id": build_id,
         "message": f"Build queued for {variant.name}",
+        "firmware_version": ctx.firmware_version,
+        "config_hash": config_hash,
+        "profile_id": int(profile_id) if profile_id is not None else None,
         "progress_url": f"/api/v1/build-progress/{build_id}",
     }
 
 
+async def _profile_content(request: Request, profile_id: str) -> str:
+    """userPrefs.jsonc of a stored profile merged with its base profiles (admin only)."""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Only admins can build from stored profiles")
+    if not profile_id.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid profile ID: {profile_id}")
+
+    db = await database.get_db(request.app.state.settings)
+    try:
+        chain = await database.get_profile_chain(db, int(profile_id))
+    finally:
+        await db.close()
+    if not chain:
+        raise HTTPException(status_code=400, detail=f"Profile not found: {profile_id}")
+    try:
+        return request.app.state.profile_cache.resolve(chain).content
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid configuration: {e}")
+
+
 @router.get("/build-progress/{build_id}")
 async def build_progress(build_id: str, request: Request):
-    """SSE endpoint for real-time build progress."""
+    """SSE endpoint for real-time build progress.
+
+    Any worker can serve it: the first connection claims the queued build and
+    runs it; a build that has already finished is replayed from its record.
+    """
+    settings = request.app.state.settings
     active_builds = getattr(request.app.state, "active_builds", {})
-    ctx = active_builds.get(build_id)
 
-    if ctx is None:
-        raise HTTPException(status_code=404, detail="Build not found")
+    db = await database.get_db(settings)
+    try:
+        record = await database.get_build(db, build_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Build not found")
+        ctx = active_builds.pop(build_id, None)
+        if ctx is None and record["status"] == "queued":
+            ctx = _context_from_record(request, record)
+        claimed = await database.claim_build(db, build_id)
+    finally:
+        await db.close()
+
+    if not claimed:
+        if record["status"] not in ("complete", "failed"):
+            raise HTTPException(status_code=409, detail="Build is already running")
+        return EventSourceResponse(_replay(record))
 
     async def event_stream():
+        final = BuildProgress(status="failed", error="Build interrupted")
         try:
             async for progress in build_service.build_firmware(ctx):
+                if progress.status in ("complete", "failed"):
+                    final = progress
                 data = BuildStatus(
                     status=progress.status,
                     message=progress.message,
@@ -115,21 +259,75 @@ async def build_progress(build_id: str, request: Request):
             # Send build log as final event
             yield {
                 "event": "log",
-                "data": json.dumps({"log": "\n".join(ctx.build_log[-100:])}),
+                "data": json.dumps({"log": "\n".join(ctx.build_log[-BUILD_LOG_LINES:])}),
             }
         except Exception as e:
             logger.error(f"Build {build_id} stream error: {e}")
+            final = BuildProgress(status="failed", error=str(e))
             yield {
                 "event": "status",
                 "data": BuildStatus(status="failed", error=str(e)).model_dump_json(),
             }
         finally:
-            # Remove from active builds
-            active_builds.pop(build_id, None)
+            # Record the outcome for other workers, late clients and the failure cache,
+            # even if the client disconnected and this stream is being cancelled
+            await asyncio.shield(_record_outcome(ctx, final))
 
     return EventSourceResponse(event_stream())
 
 
+def _context_from_record(request: Request, record: dict) -> build_service.BuildContext:
+    """Rebuild the context of a build queued by another worker."""
+    registry = request.app.state.device_registry
+    if not registry.exists(record["variant"]):
+        raise HTTPException(status_code=410, detail=f"Device variant {record['variant']} is no longer available")
+    try:
+        return build_service.BuildContext(
+            build_id=record["id"],
+            variant=registry.get(record["variant"]),
+            config_content=record["config_content"] or "",
+            settings=request.app.state.settings,
+            firmware_version=record["firmware_version"],
+            config_hash=record["config_hash"],
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+
+async def _record_outcome(ctx: build_service.BuildContext, final: BuildProgress) -> None:
+    try:
+        db = await database.get_db(ctx.settings)
+        try:
+            await database.update_build_status(
+                db,
+                ctx.build_id,
+                final.status,
+                firmware_path=str(ctx.firmware_path) if ctx.firmware_path else None,
+                build_log="\n".join(ctx.build_log[-BUILD_LOG_LINES:]),
+                error_message=final.error or None,
+                deterministic=final.status == "failed" and ctx.deterministic_failure,
+            )
+        finally:
+            await db.close()
+    except Exception as e:
+        logger.error(f"Build {ctx.build_id}: could not record outcome: {e}")
+
+
+async def _replay(record: dict):
+    """The final status and log of a finished build, as build-progress events."""
+    download_url = ""
+    if record["status"] == "complete":
+        download_url = f"/api/v1/download-firmware/{record['id']}?variant={record['variant']}"
+    data = BuildStatus(
+        status=record["status"],
+        message="Build complete!" if download_url else "",
+        download_url=download_url,
+        error=record["error_message"] or "",
+    ).model_dump_json()
+    yield {"event": "status", "data": data}
+    yield {"event": "log", "data": json.dumps({"log": record["build_log"] or ""})}
+
+
 @router.get("/download-firmware/{build_id}")
 async def download_firmware(build_id: str, request: Request, variant: str = "unknown", filename: str = ""):
     """Download the built firmware file."""
@@ -196,8 +394,6 @@ async def download_firmware(build_id: str, request: Request, variant: str = "unk
 
 def _sync_cleanup(build_dir):
     """Synchronous cleanup for FileResponse background task."""
-    import shutil
-
     try:
         if build_dir.exists():
             shutil.rmtree(str(build_dir), ignore_errors=True)
@@ -213,4 +409,29 @@ async def system_info(request: Request):
 
     settings = request.app.state.settings
     info = get_firmware_version(settings)
-    return {"success": True, **info}
+    return {
+        "success": True,
+        **info,
+        "jsonc_cache": request.app.state.jsonc_cache.stats(),
+        "failure_cache": await _failure_stats(settings),
+    }
+
+
+async def _failure_stats(settings) -> dict:
+    db = await database.get_db(settings)
+    try:
+        return await database.failure_stats(db, settings.failed_build_ttl_seconds)
+    finally:
+        await db.close()
+
+
+@router.get("/firmware-versions")
+async def firmware_versions(request: Request):
+    """List installed firmware versions and the current one."""
+    settings = request.app.state.settings
+    return {
+        "success": True,
+        "current": firmware_store.current_version(settings),
+        "versions": firmware_store.installed_versions(settings),
+        "keep": settings.firmware_keep_versions,
+    }
@@ -0,0 +1,113 @@
+"""Config profile API routes — /api/v1/profiles (admin only; profiles hold channel keys)."""
+
+import json
+import logging
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from mtfwbuilder import database
+from mtfwbuilder.auth import require_admin
+from mtfwbuilder.models import ProfileRequest
+from mtfwbuilder.rate_limit import limit
+from mtfwbuilder.services import config_canonical, profiles, userprefs_validator
+
+logger = logging.getLogger("mtfwbuilder.profiles")
+
+router = APIRouter(
+    prefix="/api/v1", tags=["profiles"], dependencies=[Depends(require_admin), Depends(limit("api"))]
+)
+
+
+async def _db(request: Request):
+    db = await database.get_db(request.app.state.settings)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+@router.get("/profiles")
+async def list_profiles(org: str | None = None, kind: str | None = None, db=Depends(_db)):
+    """List profiles (without their configs), optionally of one org and/or kind."""
+    return {"success": True, "profiles": await database.list_profiles(db, org, kind)}
+
+
+@router.post("/profiles", status_code=201)
+async def create_profile(body: ProfileRequest, request: Request, db=Depends(_db)):
+    """Create a base profile or a node overlay."""
+    await _check_profile(db, None, body)
+    profile_id = await database.create_profile(
+        db, body.name, json.dumps(body.config), body.kind, body.org, body.parent_id
+    )
+    logger.info(f"Created {body.kind} profile {profile_id} ({body.name})")
+    return await _profile_response(request, db, profile_id)
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: int, request: Request, db=Depends(_db)):
+    """A profile's own fields plus its resolved (merged) config and canonical hash."""
+    return await _profile_response(request, db, profile_id)
+
+
+@router.put("/profiles/{profile_id}")
+async def update_profile(profile_id: int, body: ProfileRequest, request: Request, db=Depends(_db)):
+    """Replace a profile. Overlays inheriting from it pick up the change on their next resolve."""
+    if await database.get_profile(db, profile_id) is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if body.kind != profiles.BASE and await database.profile_has_children(db, profile_id):
+        raise HTTPException(status_code=400, detail="Profiles other profiles inherit from must stay base profiles")
+    await _check_profile(db, profile_id, body)
+    await database.update_profile(
+        db, profile_id, body.name, json.dumps(body.config), body.kind, body.org, body.parent_id
+    )
+    logger.info(f"Updated profile {profile_id} ({body.name})")
+    return await _profile_response(request, db, profile_id)
+
+
+async def _check_profile(db, profile_id: int | None, body: ProfileRequest) -> None:
+    """Reject a write that would break the hierarchy or make an unbuildable node profile."""
+    parent_chain = []
+    if body.parent_id is not None:
+        parent_chain = await database.get_profile_chain(db, body.parent_id)
+        if not parent_chain:
+            raise HTTPException(status_code=400, detail=f"Parent profile not found: {body.parent_id}")
+        try:
+            profiles.check_parent(profile_id, body.org, parent_chain)
+        except profiles.ProfileError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    layers = [json.loads(row["config_json"]) for row in parent_chain] + [body.config]
+    try:
+        content, _ = profiles.render(profiles.merge_layers(layers))
+        prefs = config_canonical.parse_prefs(content)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid configuration: {e}")
+
+    # Base profiles may be partial (a channel count their overlays complete); nodes get built
+    if body.kind == profiles.NODE:
+        errors = userprefs_validator.validate(prefs)
+        if errors:
+            raise HTTPException(
+                status_code=422,
+                detail={"message": "Invalid configuration", "errors": [e.to_dict() for e in errors]},
+            )
+
+
+async def _profile_response(request: Request, db, profile_id: int) -> dict[str, Any]:
+    chain = await database.get_profile_chain(db, profile_id)
+    if not chain:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    try:
+        resolved = request.app.state.profile_cache.resolve(chain)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Profile {profile_id} can't be resolved: {e}")
+
+    profile = dict(chain[-1])
+    profile["config"] = json.loads(profile.pop("config_json"))
+    return {
+        "success": True,
+        "profile": profile,
+        "resolved": resolved.config,
+        "config_hash": resolved.config_hash,
+    }
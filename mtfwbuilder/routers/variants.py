@@ -0,0 +1,78 @@
+"""Device variant API — filterable registry listing with ETag revalidation."""
+
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request, Response
+
+from mtfwbuilder.http_cache import REVALIDATE, etag_matches, not_modified
+from mtfwbuilder.rate_limit import limit
+from mtfwbuilder.services.device_registry import DeviceRegistry, DeviceVariant
+
+router = APIRouter(prefix="/api/v1", tags=["variants"], dependencies=[Depends(limit("api"))])
+
+# Serialized bodies for the current registry, keyed by filter; reset on reload
+_MAX_CACHED_BODIES = 64
+_bodies: dict[tuple, tuple[str, bytes]] = {}
+_bodies_registry: str = ""
+
+
+def _variant_json(v: DeviceVariant) -> dict:
+    return {
+        "id": v.id,
+        "name": v.name,
+        "manufacturer": v.manufacturer,
+        "architecture": v.architecture,
+        "pio_platform": v.pio_platform,
+        "firmware_format": v.firmware_format,
+        "platform": v.platform,
+        "board": v.board,
+        "flash_size": v.flash_size,
+    }
+
+
+def _render(registry: DeviceRegistry, filters: tuple) -> tuple[str, bytes]:
+    """(ETag, body) for one filter combination, built once per registry."""
+    global _bodies_registry
+
+    if _bodies_registry != registry.etag:
+        _bodies.clear()
+        _bodies_registry = registry.etag
+    cached = _bodies.get(filters)
+    if cached is not None:
+        return cached
+
+    variants = registry.filter(*filters)
+    body = json.dumps(
+        {"registry_version": registry.version, "count": len(variants), "variants": [_variant_json(v) for v in variants]},
+        separators=(",", ":"),
+    ).encode()
+    # Strong ETag: registry identity plus the filter that selected this representation
+    selector = hashlib.sha256(repr(filters).encode()).hexdigest()[:8]
+    etag = f'{registry.etag[:-1]}-{selector}"'
+
+    if len(_bodies) >= _MAX_CACHED_BODIES:
+        _bodies.pop(next(iter(_bodies)))
+    _bodies[filters] = (etag, body)
+    return etag, body
+
+
+@router.get("/variants")
+async def list_variants(
+    request: Request,
+    manufacturer: Optional[str] = None,
+    architecture: Optional[str] = None,
+    pio_platform: Optional[str] = None,
+):
+    """List device variants, optionally filtered by manufacturer, architecture and pio_platform."""
+    registry = request.app.state.device_registry
+    etag, body = _render(registry, (manufacturer, architecture, pio_platform))
+
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": REVALIDATE},
+    )
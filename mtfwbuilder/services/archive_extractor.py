@@ -0,0 +1,190 @@
+"""Parallel, single-pass zip extraction for firmware source archives.
+
+A release zipball holds thousands of small files. Entries are validated as
+they are scheduled, each parent directory is created once before any file
+lands in it, and file bodies are inflated in batches by a thread pool (zlib
+releases the GIL), each worker reading through its own handle on the archive.
+On a single core the batches are written inline.
+"""
+
+import os
+import shutil
+import stat
+import threading
+import zipfile
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+COPY_BUFFER_SIZE = 1024 * 1024
+# Inflating is CPU-bound; on a single core the pool only adds handoff cost, so write inline
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+# Files are handed to workers in batches so scheduling overhead stays small
+# next to the per-file work; a batch closes at whichever limit comes first
+BATCH_FILES = 64
+BATCH_BYTES = 8 * 1024 * 1024
+
+# Batches queued per worker before scheduling waits — bounds memory for huge archives
+_MAX_PENDING_PER_WORKER = 2
+
+
+@dataclass
+class ExtractResult:
+    """What an extraction produced."""
+
+    root: Path  # source tree root (dest, or dest/<top dir> when not stripped)
+    files: int = 0
+    directories: int = 0
+    bytes_written: int = 0
+
+
+def extract_zip(
+    zip_path: Path,
+    dest: Path,
+    strip_top_dir: bool = False,
+    workers: int | None = None,
+    check_cancelled: Callable[[], None] | None = None,
+) -> ExtractResult:
+    """Extract zip_path into dest.
+
+    With strip_top_dir, the single top-level directory that release archives
+    wrap everything in is dropped, so files land directly in dest — e.g. a
+    staging tree that is about to be activated. Raises ValueError for an
+    entry that would escape dest; extraction stops at the first bad entry.
+    check_cancelled is called between entries and may raise to abort.
+    """
+    workers = workers or DEFAULT_WORKERS
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    dest_root = os.path.realpath(dest)
+    local = threading.local()
+    handles: list[zipfile.ZipFile] = []
+    handles_lock = threading.Lock()
+
+    def worker_handle() -> zipfile.ZipFile:
+        zf = getattr(local, "zf", None)
+        if zf is None:
+            zf = zipfile.ZipFile(zip_path, "r")
+            local.zf = zf
+            with handles_lock:
+                handles.append(zf)
+        return zf
+
+    def write_batch(batch: list[tuple[zipfile.ZipInfo, str]]) -> int:
+        zf = worker_handle()
+        written = 0
+        for info, target in batch:
+            with zf.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            mode = (info.external_attr >> 16) & 0o777
+            if mode & stat.S_IXUSR:
+                os.chmod(target, mode)
+            written += info.file_size
+        return written
+
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        infos = zf.infolist()
+        prefix = _common_top_dir(infos) if strip_top_dir else ""
+        result = ExtractResult(root=dest)
+        created: set[str] = {dest_root}
+        pending: set = set()
+        batch: list[tuple[zipfile.ZipInfo, str]] = []
+        batch_bytes = 0
+
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract") if workers > 1 else None
+
+        def flush(batch: list[tuple[zipfile.ZipInfo, str]]) -> None:
+            if pool is None:
+                result.bytes_written += write_batch(batch)
+                return
+            pending.add(pool.submit(write_batch, batch))
+            if len(pending) >= workers * _MAX_PENDING_PER_WORKER:
+                result.bytes_written += _drain(pending, wait_all=False)
+
+        try:
+            for info in infos:
+                if check_cancelled is not None:
+                    check_cancelled()
+                name = info.filename[len(prefix):]
+                if not name:
+                    continue
+                target = _safe_target(dest_root, name)
+
+                if info.is_dir():
+                    if target not in created:
+                        os.makedirs(target, exist_ok=True)
+                        created.add(target)
+                        result.directories += 1
+                    continue
+
+                parent = os.path.dirname(target)
+                if parent not in created:
+                    os.makedirs(parent, exist_ok=True)
+                    created.add(parent)
+                    result.directories += 1
+
+                batch.append((info, target))
+                batch_bytes += info.file_size
+                result.files += 1
+                if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                    flush(batch)
+                    batch, batch_bytes = [], 0
+
+            if batch:
+                flush(batch)
+            result.bytes_written += _drain(pending, wait_all=True)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+            for handle in handles:
+                handle.close()
+
+    if not strip_top_dir:
+        result.root = _single_top_dir(dest) or dest
+    return result
+
+
+def _drain(pending: set, wait_all: bool) -> int:
+    """Collect finished writes, re-raising the first error. Returns bytes written."""
+    done, _ = wait(pending, return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED)
+    written = sum(future.result() for future in done)
+    pending.difference_update(done)
+    return written
+
+
+def _safe_target(dest_root: str, name: str) -> str:
+    """Absolute target path for an entry, rejecting absolute and parent-relative names."""
+    normalized = os.path.normpath(name.replace("\\", "/"))
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith("../"):
+        raise ValueError(f"Zip entry would escape target directory: {name}")
+    target = os.path.join(dest_root, normalized)
+    if not target.startswith(dest_root + os.sep):
+        raise ValueError(f"Zip entry would escape target directory: {name}")
+    return target
+
+
+def _common_top_dir(infos: list[zipfile.ZipInfo]) -> str:
+    """The 'top/' prefix shared by every entry, or '' if there is none."""
+    if not infos:
+        return ""
+    top = infos[0].filename.split("/", 1)[0]
+    if top in ("", ".", "..") or "\\" in top:
+        # Never strip a component that would hide an escaping or absolute path
+        return ""
+    top += "/"
+    if all(info.filename.startswith(top) for info in infos):
+        return top
+    return ""
+
+
+def _single_top_dir(dest: Path) -> Path | None:
+    entries = list(dest.iterdir())
+    if len(entries) == 1 and entries[0].is_dir():
+        return entries[0]
+    return None
@@ -1,33 +1,41 @@
 """Async firmware build orchestration with PlatformIO.
 
-Serialized builds (Semaphore=1) to prevent shared firmware tree race condition.
+Serialized builds (an flock on temp_dir/build.lock, held across every uvicorn
+worker) to prevent shared firmware tree race condition.
 Line-by-line stdout streaming for SSE progress. Configurable build timeout.
+Each build resolves its firmware tree when queued and pins it while running,
+so a firmware update switching versions never pulls the tree out from under it.
 """
 
 import asyncio
+import fcntl
 import logging
 import os
 import re
+import secrets
 import shutil
 import time
 from dataclasses import dataclass, field
 from pathlib import Path
 
 from mtfwbuilder.config import Settings
+from mtfwbuilder.services import failure_cache, firmware_store
 from mtfwbuilder.services.device_registry import DeviceVariant
 
 logger = logging.getLogger("mtfwbuilder.build")
 
 # Serialized: shared firmware tree prevents concurrent builds
-_build_semaphore: asyncio.Semaphore | None = None
-_build_queue: asyncio.Queue | None = None
+BUILD_LOCK_FILE = "build.lock"
+BUILD_SLOT_POLL_SECONDS = 0.5
+
+# Moving average of successful build durations per variant, in seconds
+_build_durations: dict[str, float] = {}
+DURATION_SMOOTHING = 0.3  # weight of the newest build
 
 
 def init_build_system(settings: Settings) -> None:
-    """Initialize the build semaphore and queue."""
-    global _build_semaphore, _build_queue
-    _build_semaphore = asyncio.Semaphore(1)
-    _build_queue = asyncio.Queue(maxsize=settings.max_queue_size)
+    """Create the build directory holding build outputs and the build slot lock."""
+    settings.temp_dir.mkdir(parents=True, exist_ok=True)
 
 
 @dataclass
@@ -49,15 +57,30 @@ class BuildContext:
     variant: DeviceVariant
     config_content: str
     settings: Settings
+    firmware_version: str | None = None  # None = current version at queue time
+    config_hash: str = ""  # digest of the canonical config (config_canonical)
+    firmware_tree: Path = field(default_factory=Path)
     build_dir: Path = field(default_factory=Path)
     firmware_path: Path | None = None
     factory_path: Path | None = None
     build_log: list[str] = field(default_factory=list)
+    deterministic_failure: bool = False  # failed in a way a retry would repeat (failure_cache)
 
     def __post_init__(self):
+        self.firmware_version, self.firmware_tree = firmware_store.resolve(self.settings, self.firmware_version)
         self.build_dir = self.settings.temp_dir / self.build_id
         self.build_dir.mkdir(parents=True, exist_ok=True)
 
+    @property
+    def cache_key(self) -> str:
+        """Identity of the build's output: same firmware, variant and canonical config."""
+        return cache_key(self.firmware_version, self.variant.id, self.config_hash)
+
+
+def cache_key(firmware_version: str | None, variant_id: str, config_hash: str) -> str:
+    """BuildContext.cache_key, for callers that have not created the context yet."""
+    return f"{firmware_version}:{variant_id}:{config_hash}"
+
 
 async def build_firmware(ctx: BuildContext):
     """Run a firmware build, yielding BuildProgress events via async generator.
@@ -66,47 +89,71 @@ async def build_firmware(ctx: BuildContext):
         async for progress in build_firmware(ctx):
             send_to_client(progress)
     """
-    if _build_semaphore is None:
+    lock_path = ctx.settings.temp_dir / BUILD_LOCK_FILE
+    if not ctx.settings.temp_dir.is_dir():
         raise RuntimeError("Build system not initialized — call init_build_system()")
 
-    # Try to acquire build slot
-    if _build_semaphore.locked():
-        yield BuildProgress(status="queued", message="Waiting for current build to finish...")
+    with open(lock_path, "a") as slot:
+        # Try to acquire build slot
+        if not _try_lock(slot):
+            yield BuildProgress(status="queued", message="Waiting for current build to finish...")
+            while not _try_lock(slot):
+                await asyncio.sleep(BUILD_SLOT_POLL_SECONDS)
 
-    async with _build_semaphore:
-        yield BuildProgress(status="compiling", message=f"Building firmware for {ctx.variant.name}...")
-
-        try:
-            async with asyncio.timeout(ctx.settings.build_timeout_seconds):
-                async for progress in _run_pio_build(ctx):
-                    yield progress
-        except asyncio.TimeoutError:
-            error_msg = f"Build timed out after {ctx.settings.build_timeout_seconds // 60} minutes"
-            logger.error(f"Build {ctx.build_id}: {error_msg}")
-            yield BuildProgress(status="failed", error=error_msg)
-            return
-
-        # Find and copy firmware files
+        # Closing the file (or the worker dying) releases the slot
+        firmware_store.pin(ctx.settings, ctx.firmware_version)
         try:
-            await _extract_firmware(ctx)
-        except FileNotFoundError as e:
-            yield BuildProgress(status="failed", error=str(e))
-            return
+            async for progress in _run_pinned_build(ctx):
+                yield progress
+        finally:
+            firmware_store.unpin(ctx.settings, ctx.firmware_version)
 
-        download_url = f"/api/v1/download-firmware/{ctx.build_id}?variant={ctx.variant.id}"
-        yield BuildProgress(
-            status="complete",
-            message="Build complete!",
-            download_url=download_url,
-        )
+
+def _try_lock(file) -> bool:
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+async def _run_pinned_build(ctx: BuildContext):
+    """Build steps that run with the build slot held and the firmware tree pinned."""
+    yield BuildProgress(status="compiling", message=f"Building firmware for {ctx.variant.name}...")
+
+    started = time.monotonic()
+    try:
+        async with asyncio.timeout(ctx.settings.build_timeout_seconds):
+            async for progress in _run_pio_build(ctx):
+                yield progress
+    except asyncio.TimeoutError:
+        error_msg = f"Build timed out after {ctx.settings.build_timeout_seconds // 60} minutes"
+        logger.error(f"Build {ctx.build_id}: {error_msg}")
+        yield BuildProgress(status="failed", error=error_msg)
+        return
+
+    # Find and copy firmware files
+    try:
+        await _extract_firmware(ctx)
+    except FileNotFoundError as e:
+        yield BuildProgress(status="failed", error=str(e))
+        return
+
+    _record_duration(ctx.variant.id, time.monotonic() - started)
+    download_url = f"/api/v1/download-firmware/{ctx.build_id}?variant={ctx.variant.id}"
+    yield BuildProgress(
+        status="complete",
+        message="Build complete!",
+        download_url=download_url,
+    )
 
 
 # Type alias for the async generator
 async def _run_pio_build(ctx: BuildContext):
     """Run PlatformIO build as async subprocess, streaming stdout line-by-line."""
-    firmware_dir = ctx.settings.firmware_dir
+    firmware_dir = ctx.firmware_tree
 
-    if not firmware_dir.exists():
+    if not (firmware_dir / "platformio.ini").exists():
         yield BuildProgress(status="failed", error="Firmware source not installed. Use Admin panel to update.")
         return
 
@@ -131,8 +178,8 @@ async def _run_pio_build(ctx: BuildContext):
     ]
 
     env = os.environ.copy()
-    # Build cache (preserves incremental builds)
-    env["PLATFORMIO_BUILD_CACHE_DIR"] = str(firmware_dir / ".pio" / "build_cache")
+    # Build cache (preserves incremental builds, shared across firmware versions)
+    env["PLATFORMIO_BUILD_CACHE_DIR"] = str(firmware_store.build_cache_dir(ctx.settings))
     # Disable color output for clean log parsing
     env["PLATFORMIO_FORCE_COLOR"] = "false"
     env["PLATFORMIO_NO_ANSI"] = "1"
@@ -167,6 +214,7 @@ async def _run_pio_build(ctx: BuildContext):
     if exit_code != 0:
         error_lines = [l for l in ctx.build_log[-20:] if "error" in l.lower()]
         error_summary = error_lines[-1] if error_lines else f"PlatformIO exited with code {exit_code}"
+        ctx.deterministic_failure = failure_cache.is_deterministic(exit_code, ctx.build_log)
         logger.error(f"Build {ctx.build_id} failed: {error_summary}")
         yield BuildProgress(
             status="failed",
@@ -175,6 +223,19 @@ async def _run_pio_build(ctx: BuildContext):
         )
 
 
+def predicted_duration(variant_id: str, settings: Settings) -> float:
+    """Expected seconds to build variant_id: recent builds of it, else the configured estimate."""
+    return _build_durations.get(variant_id, settings.build_estimate_seconds)
+
+
+def _record_duration(variant_id: str, seconds: float) -> None:
+    previous = _build_durations.get(variant_id)
+    if previous is None:
+        _build_durations[variant_id] = seconds
+    else:
+        _build_durations[variant_id] = previous + DURATION_SMOOTHING * (seconds - previous)
+
+
 def _parse_progress(line: str) -> str | None:
     """Parse a PlatformIO output line for progress milestones."""
     lower = line.lower()
@@ -193,7 +254,7 @@ def _parse_progress(line: str) -> str | None:
 
 async def _extract_firmware(ctx: BuildContext) -> None:
     """Find and copy firmware files to the build directory."""
-    firmware_dir = ctx.settings.firmware_dir
+    firmware_dir = ctx.firmware_tree
     variant_id = ctx.variant.id
     fmt = ctx.variant.firmware_format
 
@@ -228,7 +289,7 @@ async def _extract_firmware(ctx: BuildContext) -> None:
 
 def _scrub_firmware_tree(ctx: BuildContext) -> None:
     """Remove userPrefs and firmware files from the shared firmware tree."""
-    firmware_dir = ctx.settings.firmware_dir
+    firmware_dir = ctx.firmware_tree
 
     for path in [
         firmware_dir / "configs" / "userPrefs.jsonc",
@@ -247,11 +308,11 @@ def _scrub_firmware_tree(ctx: BuildContext) -> None:
     logger.debug(f"Build {ctx.build_id}: sensitive files scrubbed from firmware tree")
 
 
-_build_counter = 0
-
-
 def generate_build_id() -> str:
-    """Generate a unique build ID."""
-    global _build_counter
-    _build_counter += 1
-    return f"build_{int(time.time())}_{os.getpid()}_{_build_counter}"
+    """Generate a unique build ID that sorts by creation time.
+
+    build_<seconds>_<microseconds>_<random>: unique across workers and
+    restarts without coordination; cleanup_old_builds reads the seconds.
+    """
+    now = time.time_ns() // 1000
+    return f"build_{now // 1_000_000}_{now % 1_000_000:06d}_{secrets.token_hex(4)}"
@@ -0,0 +1,219 @@
+"""Bulk userPrefs.jsonc generation for provisioning many nodes in one request.
+
+The request body is NDJSON (one JSON object per line) or CSV (a header row,
+then one row per node) of per-node overrides, applied on top of a base
+config. The body is first spooled to a temporary file (in memory up to
+SPOOL_MEMORY_BYTES, then on disk): the response can't start while the body
+is still being received, as Starlette's streaming responses read the
+request channel to watch for disconnects. Rows are then parsed, generated
+and written out one at a time, so NDJSON output runs in constant memory
+however many rows are sent. Zip output must also keep each entry's
+central-directory record until the archive is closed, about 1KB an entry at
+peak.
+
+Special keys/columns:
+    $base   first NDJSON line only: {"$base": {...}} sets the base config
+    $name   output name for the row (default node-<row>)
+"""
+
+import csv
+import io
+import json
+import re
+import tempfile
+import time
+import zipfile
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass
+from typing import IO, Any
+
+from mtfwbuilder.services.jsonc_generator import generate_jsonc
+
+NDJSON = "ndjson"
+CSV = "csv"
+ZIP = "zip"
+
+BASE_KEY = "$base"
+NAME_KEY = "$name"
+
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Output is handed to the server in chunks of about this size; each chunk is
+# one trip through Starlette's threadpool, so per-row chunks would dominate
+CHUNK_BYTES = 64 * 1024
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class BulkInputError(ValueError):
+    """The request as a whole can't be processed (not a per-row error)."""
+
+
+@dataclass
+class BulkRow:
+    """One generated config, or the reason the row failed.
+
+    row 0 is a request-level error that ended processing early.
+    """
+
+    row: int  # 1-based data row (the $base line and CSV header are not counted)
+    name: str
+    content: str | None = None
+    error: str | None = None
+
+
+async def spool_body(chunks: AsyncIterator[bytes]) -> IO[bytes]:
+    """Copy a request body into a rewound temporary file.
+
+    The size is capped by BodyLimitMiddleware (settings.bulk_max_bytes).
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    try:
+        async for chunk in chunks:
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def iter_records(body: IO[bytes], input_format: str) -> Iterator[Any]:
+    """Per-row override objects; a row that can't be parsed yields its error message as a str."""
+    text = io.TextIOWrapper(body, encoding="utf-8", newline="")
+    if input_format == NDJSON:
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield f"Invalid JSON: {e}"
+        return
+
+    reader = csv.reader(text)
+    header = [name.strip() for name in next(reader, [])]
+    if not any(header):
+        raise BulkInputError("CSV header row is missing or empty")
+    for record in reader:
+        if not any(record):
+            continue
+        if len(record) > len(header):
+            yield f"Row has {len(record)} fields, header has {len(header)}"
+            continue
+        # Empty cells keep the base config's value
+        yield {name: value for name, value in zip(header, record) if name and value != ""}
+
+
+def generate_rows(records: Iterator[Any], base: dict[str, Any] | None = None, max_rows: int = 0) -> Iterator[BulkRow]:
+    """Merge each record over the base config and run it through generate_jsonc."""
+    base = dict(base or {})
+    row = 0
+    try:
+        for record in records:
+            if row == 0 and isinstance(record, dict) and BASE_KEY in record:
+                if not isinstance(record[BASE_KEY], dict) or len(record) != 1:
+                    raise BulkInputError(f'The {BASE_KEY} line must be {{"{BASE_KEY}": {{...}}}}')
+                base.update(record[BASE_KEY])
+                continue
+
+            row += 1
+            if max_rows and row > max_rows:
+                raise BulkInputError(f"Too many rows (max {max_rows})")
+            name = f"node-{row}"
+            if isinstance(record, str):
+                yield BulkRow(row, name, error=record)
+                continue
+            if not isinstance(record, dict):
+                yield BulkRow(row, name, error="Row must be a JSON object")
+                continue
+
+            overrides = dict(record)
+            name = str(overrides.pop(NAME_KEY, "") or name)
+            try:
+                content = generate_jsonc({**base, **overrides})
+            except Exception as e:
+                yield BulkRow(row, name, error=str(e))
+                continue
+            yield BulkRow(row, name, content=content)
+    except (BulkInputError, UnicodeDecodeError, csv.Error) as e:
+        yield BulkRow(0, "", error=str(e))
+
+
+def ndjson_stream(rows: Iterator[BulkRow]) -> Iterator[bytes]:
+    """One JSON object per row: {"row", "name", "content"} or {"row", "name", "error"}.
+
+    A request-level error is a final {"error"} line without a row.
+    """
+    buffer = io.BytesIO()
+    for result in rows:
+        if result.row == 0:
+            item = {"error": result.error}
+        elif result.error is None:
+            item = {"row": result.row, "name": result.name, "content": result.content}
+        else:
+            item = {"row": result.row, "name": result.name, "error": result.error}
+        buffer.write((json.dumps(item) + "\n").encode())
+        if buffer.tell() >= CHUNK_BYTES:
+            yield _take(buffer)
+    yield _take(buffer)
+
+
+def zip_stream(rows: Iterator[BulkRow]) -> Iterator[bytes]:
+    """A zip of <name>.jsonc per row (<name>.error.txt for failed rows), written as it goes.
+
+    A request-level error becomes ERROR.txt and ends the archive.
+    """
+    sink = _ZipSink()
+    names: set[str] = set()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for result in rows:
+            if result.row == 0:
+                filename, data = "ERROR.txt", result.error
+            elif result.error is None:
+                filename, data = f"{_entry_stem(result, names)}.jsonc", result.content
+            else:
+                filename, data = f"{_entry_stem(result, names)}.error.txt", result.error
+            info = zipfile.ZipInfo(filename, date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, data)
+            if sink.size >= CHUNK_BYTES:
+                yield sink.drain()
+    yield sink.drain()  # rest, including the central directory
+
+
+def _take(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def _entry_stem(result: BulkRow, used: set[str]) -> str:
+    stem = _UNSAFE_NAME.sub("_", result.name).strip("._") or f"node-{result.row}"
+    while stem in used:
+        stem = f"{stem}-{result.row}"
+    used.add(stem)
+    return stem
+
+
+class _ZipSink:
+    """Write-only, unseekable zip target; zipfile falls back to data descriptors."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
@@ -0,0 +1,121 @@
+"""Canonical form and digest for userPrefs configurations.
+
+A config generated from the form and the same config uploaded as a
+hand-edited userPrefs.jsonc differ in key order, whitespace, comments and
+trailing commas. Both are reduced to one canonical JSON text — keys sorted,
+scalars as the strings the firmware's build script expects, byte lists in the
+generator's `{ 0x.., 0x.. }` layout — and hashed, so anything keyed on a
+config treats equivalent ones as the same.
+"""
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Any
+
+_BYTE_LIST = re.compile(r"^\{\s*(0[xX][0-9a-fA-F]{1,2}\s*(,\s*0[xX][0-9a-fA-F]{1,2}\s*)*),?\s*\}$")
+
+
+@dataclass(frozen=True)
+class CanonicalConfig:
+    """A parsed config in canonical form."""
+
+    prefs: dict[str, str]
+    text: str  # compact canonical JSON
+    digest: str  # sha256 of text
+
+
+def canonicalize(content: str) -> CanonicalConfig:
+    """Parse userPrefs JSONC and return its canonical form.
+
+    Raises ValueError for text that isn't a JSONC object of scalar values.
+    """
+    return canonical_form(parse_prefs(content))
+
+
+def parse_prefs(content: str) -> dict[str, str]:
+    """Parse userPrefs JSONC into key -> value strings, as the firmware's build script reads them.
+
+    Values are otherwise as written (byte lists keep their spelling), which
+    is what validation needs. Raises ValueError like canonicalize().
+    """
+    data = json.loads(strip_jsonc(content))
+    if not isinstance(data, dict):
+        raise ValueError("userPrefs must be a JSON object")
+    return {str(key).strip(): _scalar_string(key, value) for key, value in data.items()}
+
+
+def canonical_form(prefs: dict[str, str]) -> CanonicalConfig:
+    """Canonical form of already parsed prefs (see parse_prefs)."""
+    prefs = {key: _normalize_byte_list(value) for key, value in prefs.items()}
+    text = json.dumps(prefs, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return CanonicalConfig(prefs=prefs, text=text, digest=hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+
+def strip_jsonc(content: str) -> str:
+    """Remove // and /* */ comments and trailing commas, leaving strings intact."""
+    out: list[str] = []
+    i, n = 0, len(content)
+    pending_comma = -1  # index in out of a comma that may turn out to be trailing
+    while i < n:
+        ch = content[i]
+        if ch == '"':
+            end = _string_end(content, i)
+            out.append(content[i:end])
+            pending_comma = -1
+            i = end
+        elif content.startswith("//", i):
+            newline = content.find("\n", i)
+            i = n if newline == -1 else newline
+        elif content.startswith("/*", i):
+            close = content.find("*/", i + 2)
+            if close == -1:
+                raise ValueError("Unterminated /* comment")
+            i = close + 2
+        elif ch in "}]":
+            if pending_comma >= 0:
+                out[pending_comma] = ""
+            pending_comma = -1
+            out.append(ch)
+            i += 1
+        else:
+            if ch == ",":
+                pending_comma = len(out)
+            elif not ch.isspace():
+                pending_comma = -1
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _string_end(content: str, start: int) -> int:
+    """Index just past the JSON string literal opening at start."""
+    i = start + 1
+    while i < len(content):
+        if content[i] == "\\":
+            i += 2
+        elif content[i] == '"':
+            return i + 1
+        else:
+            i += 1
+    raise ValueError("Unterminated string")
+
+
+def _scalar_string(key: Any, value: Any) -> str:
+    # The firmware's build script reads every value as a string
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return json.dumps(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Unsupported value for {key}: expected a string, number or boolean")
+    return value
+
+
+def _normalize_byte_list(value: str) -> str:
+    match = _BYTE_LIST.match(value.strip())
+    if match:
+        items = [item.strip().lower() for item in match.group(1).split(",")]
+        return "{ " + ", ".join(f"0x{item[2:].zfill(2)}" for item in items) + " }"
+    return value
@@ -1,10 +1,36 @@
-"""Device variant registry loaded from YAML."""
+"""Device variant registry loaded from YAML.
 
+Parsed entries are cached (marshal, keyed by the file's SHA-256) so restarts
+skip YAML parsing, and the file is watched so edits take effect without a
+restart: a fresh registry is built and swapped in whole, with a bumped
+version that caches derived from the registry can key on. Metadata
+discovered from the installed firmware's PlatformIO environments (board,
+flash size) is merged in the same way.
+"""
+
+import asyncio
+import copy
+import dataclasses
+import hashlib
+import logging
+import marshal
+import os
 from dataclasses import dataclass
 from pathlib import Path
 
 import yaml
 
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services import pio_env_index
+
+logger = logging.getLogger("mtfwbuilder.registry")
+
+# libyaml's loader is several times faster than the pure-Python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Bump when the cached row layout changes
+CACHE_FORMAT = 1
+
 # Architecture → firmware format mapping
 FIRMWARE_FORMATS = {
     "esp32": "bin",
@@ -23,6 +49,10 @@ class DeviceVariant:
     manufacturer: str
     architecture: str
     pio_platform: str = ""
+    # Discovered from the firmware's platformio.ini (empty until merged)
+    platform: str = ""
+    board: str = ""
+    flash_size: str = ""
 
     @property
     def firmware_format(self) -> str:
@@ -36,20 +66,45 @@ class DeviceVariant:
 
 
 class DeviceRegistry:
-    """Load and query device variants from YAML."""
+    """Load and query device variants from YAML.
+
+    A registry is immutable once loaded; reloading builds a new one with
+    version + 1 (see reload_registry).
+    """
 
-    def __init__(self, variants_path: Path):
+    def __init__(self, variants_path: Path, cache_dir: Path | None = None, version: int = 1):
+        self.path = Path(variants_path)
+        self.version = version
+        self.env_index_key: tuple | None = None  # firmware environment index merged in, if any
+        self._reset_indexes()
+
+        # Stat before reading so an edit made mid-load is still seen as a change
+        self.signature = file_signature(self.path)
+        data = self.path.read_bytes()
+        self.file_hash = hashlib.sha256(data).hexdigest()
+
+        rows = _read_cache(cache_dir, self.file_hash) if cache_dir else None
+        if rows is None:
+            rows = self._parse(data)
+            if cache_dir:
+                _write_cache(cache_dir, self.file_hash, rows)
+        self._index(rows)
+
+    def _reset_indexes(self) -> None:
         self._variants: dict[str, DeviceVariant] = {}
         self._by_manufacturer: dict[str, list[DeviceVariant]] = {}
-        self._load(variants_path)
+        self._by_architecture: dict[str, list[DeviceVariant]] = {}
+        self._by_pio_platform: dict[str, list[DeviceVariant]] = {}
+        self._position: dict[str, int] = {}
 
-    def _load(self, path: Path) -> None:
-        with open(path) as f:
-            entries = yaml.safe_load(f)
+    def _parse(self, data: bytes) -> list[tuple]:
+        """Parse and validate YAML into rows in DeviceVariant field order."""
+        entries = yaml.load(data, Loader=YamlLoader)
 
         if not entries:
-            raise ValueError(f"No variants found in {path}")
+            raise ValueError(f"No variants found in {self.path}")
 
+        rows: list[tuple] = []
         seen_ids: set[str] = set()
         for entry in entries:
             # Validate required fields
@@ -66,18 +121,48 @@ class DeviceRegistry:
                 raise ValueError(f"Unknown architecture '{arch}' for variant '{vid}'")
 
             seen_ids.add(vid)
-            variant = DeviceVariant(
-                id=vid,
-                name=entry["name"],
-                manufacturer=entry["manufacturer"],
-                architecture=arch,
-                pio_platform=entry.get("pio_platform", ""),
-            )
-            self._variants[vid] = variant
+            rows.append((vid, entry["name"], entry["manufacturer"], arch, entry.get("pio_platform", "")))
+        return rows
+
+    def _index(self, rows: list[tuple]) -> None:
+        for row in rows:
+            self._add(DeviceVariant(*row))
 
-            if variant.manufacturer not in self._by_manufacturer:
-                self._by_manufacturer[variant.manufacturer] = []
-            self._by_manufacturer[variant.manufacturer].append(variant)
+    def _add(self, variant: DeviceVariant) -> None:
+        self._position[variant.id] = len(self._variants)
+        self._variants[variant.id] = variant
+
+        for index, key in (
+            (self._by_manufacturer, variant.manufacturer),
+            (self._by_architecture, variant.architecture),
+            (self._by_pio_platform, variant.pio_platform),
+        ):
+            if key not in index:
+                index[key] = []
+            index[key].append(variant)
+
+    def with_environments(self, index: pio_env_index.EnvIndex) -> "DeviceRegistry":
+        """New registry (version + 1) with board and flash metadata from index.
+
+        Values from variants.yaml win; the index only fills what it leaves empty.
+        Variants the firmware doesn't define are kept as they are.
+        """
+        merged = copy.copy(self)
+        merged.version = self.version + 1
+        merged.env_index_key = index.key
+        merged._reset_indexes()
+        for variant in self._variants.values():
+            env = index.get(variant.id)
+            if env is not None:
+                variant = dataclasses.replace(
+                    variant,
+                    pio_platform=variant.pio_platform or env.variant_dir,
+                    platform=env.platform,
+                    board=env.board,
+                    flash_size=env.flash_size,
+                )
+            merged._add(variant)
+        return merged
 
     def get(self, variant_id: str) -> DeviceVariant:
         """Look up a variant by ID. Raises KeyError if not found."""
@@ -99,6 +184,145 @@ class DeviceRegistry:
         """Variants grouped by manufacturer."""
         return dict(self._by_manufacturer)
 
+    def filter(
+        self,
+        manufacturer: str | None = None,
+        architecture: str | None = None,
+        pio_platform: str | None = None,
+    ) -> list[DeviceVariant]:
+        """Variants matching every given field, in registry order."""
+        selected = [
+            index.get(value, [])
+            for index, value in (
+                (self._by_manufacturer, manufacturer),
+                (self._by_architecture, architecture),
+                (self._by_pio_platform, pio_platform),
+            )
+            if value is not None
+        ]
+        if not selected:
+            return self.all_variants
+        # Walk the smallest index and check the rest against it
+        smallest = min(selected, key=len)
+        others = [{v.id for v in group} for group in selected if group is not smallest]
+        matches = [v for v in smallest if all(v.id in ids for ids in others)]
+        matches.sort(key=lambda v: self._position[v.id])
+        return matches
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag for this registry: version plus the content it was built from."""
+        identity = f"{self.file_hash}:{self.env_index_key}".encode()
+        return f'"{self.version}-{hashlib.sha256(identity).hexdigest()[:16]}"'
+
     @property
     def count(self) -> int:
         return len(self._variants)
+
+
+def file_signature(path: Path) -> tuple[int, int]:
+    """Cheap change marker for a file: (mtime_ns, size)."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _cache_path(cache_dir: Path, file_hash: str) -> Path:
+    return Path(cache_dir) / f"variants-{file_hash[:32]}.marshal"
+
+
+def _read_cache(cache_dir: Path, file_hash: str) -> list[tuple] | None:
+    """Cached rows for this file hash, or None on a miss or unreadable cache."""
+    try:
+        fmt, cached_hash, rows = marshal.loads(_cache_path(cache_dir, file_hash).read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if fmt != CACHE_FORMAT or cached_hash != file_hash:
+        return None
+    return rows
+
+
+def _write_cache(cache_dir: Path, file_hash: str, rows: list[tuple]) -> None:
+    """Write rows atomically and drop caches for older file versions."""
+    cache_dir = Path(cache_dir)
+    target = _cache_path(cache_dir, file_hash)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_bytes(marshal.dumps((CACHE_FORMAT, file_hash, rows)))
+        os.replace(tmp, target)
+        for stale in cache_dir.glob("variants-*.marshal"):
+            if stale != target:
+                stale.unlink(missing_ok=True)
+    except OSError as e:
+        # The cache is an optimization; a read-only disk must not stop startup
+        logger.warning(f"Could not write registry cache {target}: {e}")
+
+
+def reload_registry(current: DeviceRegistry, cache_dir: Path | None = None) -> DeviceRegistry | None:
+    """Load a new registry if the file changed since current was loaded.
+
+    Returns None when nothing changed, or when the new file is invalid (the
+    error is logged and current stays in service). A touch that leaves the
+    contents identical refreshes current's signature without a new version.
+    """
+    try:
+        signature = file_signature(current.path)
+    except OSError as e:
+        logger.error(f"Device registry {current.path} unreadable, keeping version {current.version}: {e}")
+        return None
+    if signature == current.signature:
+        return None
+
+    try:
+        registry = DeviceRegistry(current.path, cache_dir, version=current.version + 1)
+    except (OSError, ValueError, TypeError, yaml.YAMLError) as e:
+        logger.error(f"Device registry reload failed, keeping version {current.version}: {e}")
+        current.signature = signature  # don't retry until the file changes again
+        return None
+
+    if registry.file_hash == current.file_hash:
+        current.signature = registry.signature
+        return None
+
+    logger.info(f"Device registry reloaded: version {registry.version}, {registry.count} variants")
+    return registry
+
+
+def refresh_registry(current: DeviceRegistry, settings: Settings) -> DeviceRegistry | None:
+    """Reload variants.yaml and merge the current firmware's environments.
+
+    Returns the registry to swap in, or None if current is still up to date.
+    """
+    registry = reload_registry(current, settings.registry_cache_dir)
+    base = registry or current
+
+    try:
+        index = pio_env_index.get_index(settings)
+    except Exception as e:
+        # A malformed firmware tree must not take the registry down with it
+        logger.error(f"Could not index firmware environments: {e}")
+        index = None
+
+    if index is not None and index.key != base.env_index_key:
+        base = base.with_environments(index)
+        missing = [v.id for v in base.all_variants if v.id not in index]
+        if missing:
+            logger.warning(
+                f"{len(missing)} device variants are not environments in firmware {index.version}: "
+                f"{', '.join(missing[:10])}{' …' if len(missing) > 10 else ''}"
+            )
+        return base
+    return registry
+
+
+async def watch_registry(state, settings: Settings) -> None:
+    """Poll for registry or firmware changes and swap state.device_registry.
+
+    The swap is a single attribute assignment, so a request sees either the
+    old registry or the new one, never a mix.
+    """
+    while True:
+        await asyncio.sleep(settings.registry_reload_interval)
+        registry = await asyncio.to_thread(refresh_registry, state.device_registry, settings)
+        if registry is not None:
+            state.device_registry = registry
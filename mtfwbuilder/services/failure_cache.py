@@ -0,0 +1,82 @@
+"""Negative cache of deterministic build failures.
+
+A config that does not compile for a variant fails the same way every time,
+and each retry holds the single build slot for minutes. Failures whose log
+shows a compiler or linker error are remembered by BuildContext.cache_key
+(firmware version, variant, canonical config hash) for a TTL, and
+build-firmware answers a retry with the cached summary and log tail instead
+of queueing it. Timeouts, OOM kills, full disks and network errors are
+environmental and never cached. Admins can force a rebuild past an entry.
+
+Entries are the failed builds' own rows in the builds table (flagged
+deterministic), so every worker serves the same cache.
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Any
+
+LOG_TAIL_LINES = 50
+
+# Compiler/linker errors: the same sources fail the same way on every attempt
+_DETERMINISTIC = re.compile(
+    r": (?:fatal )?error: |undefined reference to |region `\S+' overflowed|will not fit in region"
+)
+# The machine, not the config: killed compilers, exhausted memory or disk, network
+_TRANSIENT = re.compile(
+    r"\bkilled\b|signal 9|out of memory|cannot allocate memory|virtual memory exhausted"
+    r"|no space left on device|resource temporarily unavailable|could not resolve host"
+    r"|connection (?:reset|refused|timed out)|httpclienterror",
+    re.IGNORECASE,
+)
+
+
+def is_deterministic(exit_code: int, log: list[str]) -> bool:
+    """Whether a failed PlatformIO run would fail again with the same inputs.
+
+    Death by signal (negative exit code) is never deterministic; otherwise
+    the log needs a compiler/linker error and no sign of an environmental
+    cause.
+    """
+    if exit_code <= 0:
+        return False
+    deterministic = False
+    for line in log:
+        if _TRANSIENT.search(line):
+            return False
+        deterministic = deterministic or bool(_DETERMINISTIC.search(line))
+    return deterministic
+
+
+@dataclass
+class CachedFailure:
+    """Summary of a deterministic build failure."""
+
+    error: str
+    log_tail: list[str]
+    build_id: str
+    failed_at: float
+    expires_at: float
+
+    @classmethod
+    def from_row(cls, row: dict, ttl: int) -> "CachedFailure":
+        """From a database.get_cached_failure() row."""
+        log = (row["build_log"] or "").splitlines()
+        return cls(
+            error=row["error_message"] or "",
+            log_tail=log[-LOG_TAIL_LINES:],
+            build_id=row["id"],
+            failed_at=row["failed_at"],
+            expires_at=row["failed_at"] + ttl,
+        )
+
+    def to_dict(self, now: float | None = None) -> dict[str, Any]:
+        now = time.time() if now is None else now
+        return {
+            "error": self.error,
+            "log": "\n".join(self.log_tail),
+            "build_id": self.build_id,
+            "failed_at": self.failed_at,
+            "retry_after": max(0, int(self.expires_at - now) + 1),
+        }
@@ -0,0 +1,246 @@
+"""Versioned firmware source trees with an atomic switch-over.
+
+Layout under settings.firmware_dir:
+
+    firmware/
+    ├── versions/<version>/     installed source trees, one per release
+    ├── current -> versions/<version>
+    ├── .staging/               in-progress installs (same filesystem as versions/)
+    ├── .build_cache/           PlatformIO object cache shared by every version
+    └── .pins/<version>.lock    held shared (flock) by each build using a version
+
+A firmware_dir holding a platformio.ini directly is an install from before
+versioned trees existed; it is served as the "legacy" version until the
+first update migrates it into versions/.
+"""
+
+import fcntl
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from mtfwbuilder.config import Settings
+
+logger = logging.getLogger("mtfwbuilder.firmware_store")
+
+VERSIONS_DIR = "versions"
+CURRENT_LINK = "current"
+STAGING_DIR = ".staging"
+BUILD_CACHE_DIR = ".build_cache"
+PINS_DIR = ".pins"
+LEGACY_VERSION = "legacy"
+
+# Entries in firmware_dir that belong to the store or the updater, never to a legacy tree
+STORE_ENTRIES = {
+    VERSIONS_DIR, CURRENT_LINK, STAGING_DIR, BUILD_CACHE_DIR, PINS_DIR, ".downloads", ".release_cache.json"
+}
+
+# Versions with a build running in them — never pruned or replaced. Each pin is
+# a shared flock on the version's lock file, so builds in other workers count.
+_pins: dict[Path, list[int]] = {}
+_pins_lock = threading.Lock()
+
+
+def version_dir_name(version: str) -> str:
+    """Map a release tag to a safe directory name."""
+    name = re.sub(r"[^\w.\-]", "_", version.strip()).lstrip(".")
+    if not name:
+        raise ValueError(f"Invalid firmware version: {version!r}")
+    return name
+
+
+def _is_legacy_tree(settings: Settings) -> bool:
+    return (settings.firmware_dir / "platformio.ini").is_file()
+
+
+def current_version(settings: Settings) -> str | None:
+    """Name of the active firmware version, or None if nothing is installed."""
+    link = settings.firmware_dir / CURRENT_LINK
+    if link.is_symlink():
+        return Path(os.readlink(link)).name
+    if _is_legacy_tree(settings):
+        return LEGACY_VERSION
+    return None
+
+
+def installed_versions(settings: Settings) -> list[str]:
+    """Installed version names, newest first."""
+    versions_dir = settings.firmware_dir / VERSIONS_DIR
+    found: list[tuple[float, str]] = []
+    if versions_dir.is_dir():
+        for entry in versions_dir.iterdir():
+            if entry.is_dir():
+                found.append((entry.stat().st_mtime, entry.name))
+    names = [name for _, name in sorted(found, reverse=True)]
+    if _is_legacy_tree(settings) and LEGACY_VERSION not in names:
+        names.append(LEGACY_VERSION)
+    return names
+
+
+def is_installed(settings: Settings, version: str) -> bool:
+    """Check if a firmware version is installed."""
+    return version in installed_versions(settings)
+
+
+def tree_path(settings: Settings, version: str) -> Path:
+    """Source tree for an installed version name."""
+    if version == LEGACY_VERSION and _is_legacy_tree(settings):
+        return settings.firmware_dir
+    return settings.firmware_dir / VERSIONS_DIR / version_dir_name(version)
+
+
+def resolve(settings: Settings, version: str | None = None) -> tuple[str | None, Path]:
+    """Resolve a requested version (None = current) to (version, tree path).
+
+    With nothing installed, returns (None, firmware_dir) so callers can report
+    the missing source the same way they always have. Raises KeyError for an
+    explicitly requested version that is not installed.
+    """
+    if version is None:
+        version = current_version(settings)
+        if version is None:
+            return None, settings.firmware_dir
+    elif not is_installed(settings, version):
+        raise KeyError(f"Firmware version not installed: {version}")
+    return version, tree_path(settings, version)
+
+
+def build_cache_dir(settings: Settings) -> Path:
+    """PlatformIO build cache shared across versions (content-addressed, safe to share)."""
+    return settings.firmware_dir / BUILD_CACHE_DIR
+
+
+def _pin_path(settings: Settings, version: str) -> Path:
+    return settings.firmware_dir / PINS_DIR / f"{version_dir_name(version)}.lock"
+
+
+def pin(settings: Settings, version: str | None) -> None:
+    """Mark a version as in use by a running build, in this worker or any other."""
+    if version is None:
+        return
+    path = _pin_path(settings, version)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    with _pins_lock:
+        _pins.setdefault(path, []).append(fd)
+
+
+def unpin(settings: Settings, version: str | None) -> None:
+    """Release a pin taken with pin()."""
+    if version is None:
+        return
+    path = _pin_path(settings, version)
+    with _pins_lock:
+        fds = _pins.get(path)
+        if not fds:
+            return
+        fd = fds.pop()
+        if not fds:
+            del _pins[path]
+    os.close(fd)
+
+
+def is_pinned(settings: Settings, version: str) -> bool:
+    path = _pin_path(settings, version)
+    with _pins_lock:
+        if _pins.get(path):
+            return True
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        # Any worker's shared lock makes the exclusive one fail
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def create_staging_dir(settings: Settings) -> Path:
+    """Create an empty staging directory on the same filesystem as versions/."""
+    staging_root = settings.firmware_dir / STAGING_DIR
+    staging_root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix="install-", dir=staging_root))
+
+
+def activate(settings: Settings, staged_tree: Path, version: str) -> Path:
+    """Move a fully installed staging tree into versions/ and switch current to it.
+
+    The switch is a single rename of the current symlink, so a build resolving
+    the tree either sees the old version or the new one, never a partial tree.
+    """
+    firmware_dir = settings.firmware_dir
+    name = version_dir_name(version)
+    versions_dir = firmware_dir / VERSIONS_DIR
+    versions_dir.mkdir(parents=True, exist_ok=True)
+
+    _migrate_legacy_tree(settings)
+
+    target = versions_dir / name
+    if target.exists():
+        if is_pinned(settings, name):
+            raise RuntimeError(f"Firmware version {name} is in use by a running build")
+        retired = Path(tempfile.mkdtemp(prefix="retired-", dir=firmware_dir / STAGING_DIR))
+        target.rename(retired / name)
+        shutil.rmtree(str(retired), ignore_errors=True)
+
+    staged_tree.rename(target)
+    os.utime(target)  # installed_versions() orders by mtime
+
+    tmp_link = firmware_dir / f".{CURRENT_LINK}-{os.getpid()}"
+    if tmp_link.is_symlink() or tmp_link.exists():
+        tmp_link.unlink()
+    os.symlink(Path(VERSIONS_DIR) / name, tmp_link)
+    os.replace(tmp_link, firmware_dir / CURRENT_LINK)
+
+    logger.info(f"Activated firmware version {name}")
+    return target
+
+
+def _migrate_legacy_tree(settings: Settings) -> None:
+    """Move a pre-versioning tree into versions/legacy once nothing builds in it."""
+    if not _is_legacy_tree(settings):
+        return
+    if is_pinned(settings, LEGACY_VERSION):
+        logger.info("Legacy firmware tree in use; migration deferred to next update")
+        return
+
+    firmware_dir = settings.firmware_dir
+    target = firmware_dir / VERSIONS_DIR / LEGACY_VERSION
+    target.mkdir(parents=True, exist_ok=True)
+    for entry in firmware_dir.iterdir():
+        if entry.name in STORE_ENTRIES or entry.name.startswith(f".{CURRENT_LINK}-"):
+            continue
+        entry.rename(target / entry.name)
+    logger.info(f"Migrated legacy firmware tree to {target}")
+
+
+def prune_versions(settings: Settings, keep: int | None = None) -> list[str]:
+    """Remove the oldest versions beyond the retention limit. Returns names removed.
+
+    The current version and any version pinned by a running build are always kept.
+    """
+    keep = settings.firmware_keep_versions if keep is None else keep
+    current = current_version(settings)
+    removed: list[str] = []
+
+    for name in installed_versions(settings)[max(keep, 1):]:
+        if name == current or is_pinned(settings, name):
+            continue
+        path = tree_path(settings, name)
+        if path == settings.firmware_dir:
+            continue
+        shutil.rmtree(str(path), ignore_errors=True)
+        removed.append(name)
+        logger.info(f"Pruned firmware version {name}")
+
+    shutil.rmtree(str(settings.firmware_dir / STAGING_DIR), ignore_errors=True)
+    return removed
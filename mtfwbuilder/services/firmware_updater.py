@@ -3,31 +3,121 @@
 Migrated from utils/firmware_updater.py. Shell=True removed, logging replaces print().
 """
 
+import hashlib
+import json
 import logging
 import os
 import shutil
 import subprocess
-import tempfile
+import tarfile
+import threading
 import zipfile
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import Callable
 
 import requests
 
 from mtfwbuilder.config import Settings
+from mtfwbuilder.services import firmware_store
+from mtfwbuilder.services.archive_extractor import extract_zip
 
 logger = logging.getLogger("mtfwbuilder.firmware_updater")
 
+# Download progress is reported at most this often (bytes)
+PROGRESS_REPORT_BYTES = 256 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Files kept under settings.firmware_dir
+RELEASE_CACHE_FILE = ".release_cache.json"
+DOWNLOADS_DIR = ".downloads"
+
+# Archive types accepted by import_firmware
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.xz", ".tar.bz2")
+
+# full: every file in a new version is fresh; incremental: unchanged files keep their mtimes
+UPDATE_MODES = ("full", "incremental")
+
+# Top-level directories of a firmware tree that are not release content
+_SYNC_SKIP_DIRS = {".pio", ".git"} | firmware_store.STORE_ENTRIES
+
+
+@dataclass
+class SyncReport:
+    """File counts from comparing a new release against the installed tree."""
+
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+    def summary(self) -> str:
+        return f"{self.changed} changed, {self.added} added, {self.removed} removed, {self.unchanged} unchanged"
+
+
+class UpdateCancelled(Exception):
+    """Raised inside an update once its cancel event is set."""
+
+
+@dataclass
+class UpdateMonitor:
+    """Progress sink and cancel flag threaded through an update.
+
+    on_progress is called from the updater's worker thread with
+    (phase, message, bytes_done, bytes_total).
+    """
+
+    on_progress: Callable[[str, str, int, int], None] | None = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    error: str = ""
+    result: str = ""  # success message when not a plain update, e.g. already up to date
+    sync_report: SyncReport | None = None
+
+    def report(self, phase: str, message: str, done: int = 0, total: int = 0) -> None:
+        self.check_cancelled()
+        if self.on_progress is not None:
+            self.on_progress(phase, message, done, total)
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise UpdateCancelled("Firmware update cancelled")
+
+    def fail(self, message: str) -> bool:
+        """Record a failure message and return False for the caller to pass on."""
+        logger.error(message)
+        self.error = message
+        return False
+
+
+def get_latest_release_info(settings: Settings) -> dict | None:
+    """Get latest Meshtastic firmware release info from the GitHub API.
+
+    The response is cached with its ETag; later calls send If-None-Match and
+    reuse the cached body on 304, which GitHub does not count against the
+    rate limit.
+    """
+    cache_path = settings.firmware_dir / RELEASE_CACHE_FILE
+    cached = _read_release_cache(cache_path)
 
-def get_latest_release_info() -> dict | None:
-    """Get latest Meshtastic firmware release info from GitHub API."""
     try:
         logger.info("Fetching latest release info from GitHub...")
-        api_url = "https://api.github.com/repos/meshtastic/firmware/releases/latest"
-        response = requests.get(api_url, timeout=30)
-        response.raise_for_status()
+        api_url = f"{settings.github_api_url.rstrip('/')}/repos/{settings.firmware_repo}/releases/latest"
+        headers = {"Accept": "application/vnd.github+json"}
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+        response = requests.get(api_url, headers=headers, timeout=30)
+
+        if response.status_code == 304 and cached:
+            logger.info("Release info not modified, using cached copy")
+            data = cached["data"]
+        else:
+            response.raise_for_status()
+            data = response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                _write_release_cache(cache_path, etag, data)
 
-        data = response.json()
         version = data["tag_name"]
         published = data["published_at"]
 
@@ -42,84 +132,500 @@ def get_latest_release_info() -> dict | None:
         return None
 
 
-def update_firmware(settings: Settings) -> bool:
-    """Download and set up the latest firmware source.
+def _read_release_cache(path: Path) -> dict | None:
+    try:
+        cached = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or "etag" not in cached or "data" not in cached:
+        return None
+    return cached
+
+
+def _write_release_cache(path: Path, etag: str, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"etag": etag, "data": data}))
+    tmp.replace(path)
+
+
+def update_firmware(
+    settings: Settings,
+    monitor: UpdateMonitor | None = None,
+    force: bool = False,
+    mode: str | None = None,
+) -> bool:
+    """Download the latest firmware source and install it as a new version.
 
-    Returns True on success, False on failure.
+    The release is staged next to the installed versions and only becomes
+    current once it is fully installed, so builds keep running meanwhile.
+    Exits early when the latest release is already current, unless force is set.
+    Returns True on success, False on failure or cancellation.
     """
+    monitor = monitor or UpdateMonitor()
     logger.info("Starting firmware update process...")
-    temp_dir = tempfile.mkdtemp()
+    staging_dir: Path | None = None
 
     try:
-        firmware_dir = settings.firmware_dir
-        base_dir = settings.base_dir
-
         # Get latest release
-        release_info = get_latest_release_info()
+        monitor.report("download", "Fetching latest release info...")
+        release_info = get_latest_release_info(settings)
         if not release_info:
-            return False
+            return monitor.fail("Could not fetch release info from GitHub")
 
-        # Save version info
-        version_file = base_dir / "firmware_version.txt"
-        version_file.write_text(
-            f"Version: {release_info['version']}\nUpdated: {datetime.now().isoformat()}\n"
-        )
+        version = release_info["version"]
+        if not force and _is_current(settings, version):
+            logger.info(f"Firmware already up to date ({version})")
+            monitor.result = f"Already up to date ({version})."
+            return True
 
-        # Download source zip
+        # Download source zip (resumes a partial download of the same release)
         source_url = release_info["release_data"]["zipball_url"]
         logger.info(f"Downloading source from {source_url}...")
+        zip_path = download_archive(settings, source_url, firmware_store.version_dir_name(version), monitor)
 
-        zip_path = os.path.join(temp_dir, "firmware_source.zip")
-        resp = requests.get(source_url, stream=True, timeout=120)
-        resp.raise_for_status()
-
-        with open(zip_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        # Extract
+        # Extract into staging, on the same filesystem as the installed versions
+        monitor.report("extract", "Extracting firmware source...")
         logger.info("Extracting firmware source...")
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            top_dir = zf.namelist()[0].split("/")[0]
-            # Validate zip entries to prevent zip-slip attacks
-            for entry in zf.namelist():
-                target = os.path.realpath(os.path.join(temp_dir, entry))
-                if not target.startswith(os.path.realpath(temp_dir)):
-                    raise ValueError(f"Zip entry would escape target directory: {entry}")
-            zf.extractall(temp_dir)
-
-        extracted_dir = os.path.join(temp_dir, top_dir)
-
-        # Replace existing firmware directory
-        if firmware_dir.exists():
-            logger.info(f"Removing existing firmware: {firmware_dir}")
-            shutil.rmtree(str(firmware_dir))
-
-        logger.info(f"Moving firmware to {firmware_dir}")
-        shutil.move(extracted_dir, str(firmware_dir))
-
-        # Set up PlatformIO (no shell=True)
-        logger.info("Installing PlatformIO dependencies...")
-        result = subprocess.run(
-            ["pio", "pkg", "install"],
-            cwd=str(firmware_dir),
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode != 0:
-            logger.error(f"PlatformIO setup failed: {result.stderr}")
-            return False
+        staging_dir = firmware_store.create_staging_dir(settings)
+        tree = extract_archive(zip_path, staging_dir / "tree", monitor)
+
+        return install_staged_tree(settings, tree, version, monitor, mode)
 
-        logger.info("Firmware update completed successfully!")
-        return True
+    except UpdateCancelled:
+        logger.info("Firmware update cancelled")
+        return False
 
     except Exception as e:
-        logger.error(f"Firmware update error: {e}")
+        return monitor.fail(f"Firmware update error: {e}")
+
+    finally:
+        if staging_dir is not None:
+            shutil.rmtree(str(staging_dir), ignore_errors=True)
+
+
+def download_archive(
+    settings: Settings,
+    url: str,
+    name: str,
+    monitor: UpdateMonitor | None = None,
+    expected_sha256: str | None = None,
+) -> Path:
+    """Download url to firmware/.downloads/<name>.zip, resuming a partial download.
+
+    The SHA-256 is computed while streaming and recorded next to the archive,
+    so a cached archive is re-verified before reuse. If expected_sha256 is
+    given, a mismatch discards the download. Raises on any failure; a partial
+    file is kept for the next attempt unless its content is known to be bad.
+    """
+    monitor = monitor or UpdateMonitor()
+    downloads_dir = settings.firmware_dir / DOWNLOADS_DIR
+    downloads_dir.mkdir(parents=True, exist_ok=True)
+    archive = downloads_dir / f"{name}.zip"
+    part = downloads_dir / f"{name}.zip.part"
+    checksum_file = downloads_dir / f"{name}.zip.sha256"
+    etag_file = downloads_dir / f"{name}.zip.part.etag"
+    message = f"Downloading {name}..."
+
+    if archive.exists() and checksum_file.exists():
+        recorded = checksum_file.read_text().strip()
+        if _sha256_file(archive) == recorded and expected_sha256 in (None, recorded):
+            size = archive.stat().st_size
+            logger.info(f"Using cached download {archive}")
+            monitor.report("download", f"Using cached {name}", size, size)
+            return archive
+
+    hasher = hashlib.sha256()
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if etag_file.exists():
+            headers["If-Range"] = etag_file.read_text().strip()
+
+    resp = requests.get(url, headers=headers, stream=True, timeout=120)
+    if resp.status_code == 416:
+        # Nothing left to fetch for that range; start over rather than trust the part
+        resp.close()
+        part.unlink()
+        offset = 0
+        resp = requests.get(url, stream=True, timeout=120)
+    resp.raise_for_status()
+
+    if resp.status_code == 206:
+        logger.info(f"Resuming download of {name} at byte {offset}")
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                hasher.update(block)
+        mode = "ab"
+    else:
+        offset = 0
+        mode = "wb"
+        if resp.headers.get("ETag"):
+            etag_file.write_text(resp.headers["ETag"])
+
+    length = int(resp.headers.get("Content-Length") or 0)
+    total = offset + length if length else 0
+    done = offset
+    reported = 0
+    monitor.report("download", message, done, total)
+    with resp, open(part, mode) as f:
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            hasher.update(chunk)
+            done += len(chunk)
+            if done - reported >= PROGRESS_REPORT_BYTES:
+                reported = done
+                monitor.report("download", message, done, total)
+
+    if total and done != total:
+        raise IOError(f"Download of {name} incomplete: {done} of {total} bytes")
+
+    digest = hasher.hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        part.unlink()
+        etag_file.unlink(missing_ok=True)
+        raise ValueError(f"Checksum mismatch for {name}: expected {expected_sha256}, got {digest}")
+
+    part.replace(archive)
+    checksum_file.write_text(digest + "\n")
+    etag_file.unlink(missing_ok=True)
+    monitor.report("download", message, done, done)
+    logger.info(f"Downloaded {name} ({done} bytes, sha256 {digest})")
+
+    # Only the newest archive is worth keeping around
+    for stale in downloads_dir.iterdir():
+        if not stale.name.startswith(f"{name}.zip"):
+            stale.unlink(missing_ok=True)
+    return archive
+
+
+def _sha256_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def import_firmware(
+    settings: Settings,
+    source: str,
+    version: str | None = None,
+    ref: str | None = None,
+    expected_sha256: str | None = None,
+    monitor: UpdateMonitor | None = None,
+    mode: str | None = None,
+    force: bool = False,
+) -> bool:
+    """Install firmware from a local archive or git mirror under settings.firmware_import_dir.
+
+    source is a .zip/.tar[.gz|.xz|.bz2] file or a git repository (bare mirror or
+    working copy) relative to the import directory. A git source needs ref (a
+    tag or commit). The tree goes through the same staging, package install and
+    activation as update_firmware, including the early exit when version is
+    already current. An archive is checked against expected_sha256, or against
+    a <archive>.sha256 file next to it when present.
+    Returns True on success, False on failure or cancellation.
+    """
+    monitor = monitor or UpdateMonitor()
+    staging_dir: Path | None = None
+
+    try:
+        path = resolve_import_source(settings, source)
+        staging_dir = firmware_store.create_staging_dir(settings)
+
+        is_git = _is_git_repo(path)
+        if is_git and (not ref or ref.startswith("-")):
+            return monitor.fail(f"Importing from git mirror {source} requires a valid ref")
+        version = version or (ref if is_git else _archive_stem(path.name))
+        if not force and _is_current(settings, version):
+            monitor.result = f"Already up to date ({version})."
+            return True
+
+        if is_git:
+            monitor.report("extract", f"Exporting {ref} from git mirror...")
+            tarball = staging_dir / "export.tar"
+            returncode, stderr = _run_cancellable(
+                ["git", "-C", str(path), "archive", "--format=tar", f"--output={tarball}", ref, "--"],
+                path,
+                monitor,
+            )
+            if returncode != 0:
+                return monitor.fail(f"git archive failed: {stderr.strip()}")
+            archive = tarball
+        else:
+            expected = expected_sha256 or _read_checksum_file(path)
+            if expected:
+                monitor.report("verify", f"Verifying checksum of {path.name}...")
+                digest = _sha256_file(path)
+                if digest != expected.lower():
+                    return monitor.fail(f"Checksum mismatch for {path.name}: expected {expected}, got {digest}")
+            archive = path
+
+        monitor.report("extract", f"Extracting {path.name}...")
+        tree = extract_archive(archive, staging_dir / "tree", monitor)
+        if archive != path:
+            archive.unlink()
+
+        return install_staged_tree(settings, tree, version, monitor, mode)
+
+    except UpdateCancelled:
+        logger.info("Firmware import cancelled")
         return False
 
+    except Exception as e:
+        return monitor.fail(f"Firmware import error: {e}")
+
     finally:
-        logger.info(f"Cleaning up temp directory: {temp_dir}")
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        if staging_dir is not None:
+            shutil.rmtree(str(staging_dir), ignore_errors=True)
+
+
+def resolve_import_source(settings: Settings, source: str) -> Path:
+    """Resolve an import source name, refusing anything outside the import directory."""
+    import_dir = settings.firmware_import_dir.resolve()
+    path = (import_dir / source).resolve()
+    if path != import_dir and import_dir not in path.parents:
+        raise ValueError(f"Import source must be inside {import_dir}")
+    if not path.exists():
+        raise FileNotFoundError(f"Import source not found: {source}")
+    return path
+
+
+def list_import_sources(settings: Settings) -> list[dict]:
+    """Archives and git mirrors available in the import directory."""
+    import_dir = settings.firmware_import_dir
+    if not import_dir.is_dir():
+        return []
+    sources = []
+    for entry in sorted(import_dir.iterdir()):
+        if _is_git_repo(entry):
+            sources.append({"name": entry.name, "kind": "git"})
+        elif entry.is_file() and entry.name.endswith(ARCHIVE_SUFFIXES):
+            sources.append({"name": entry.name, "kind": "archive", "size": entry.stat().st_size})
+    return sources
+
+
+def extract_archive(archive: Path, dest: Path, monitor: UpdateMonitor | None = None) -> Path:
+    """Extract a zip or tar archive into dest and return the source tree root.
+
+    Entries that would land outside dest are rejected. Release archives wrap
+    everything in one top-level directory. Zips are extracted in a single
+    parallel pass (see archive_extractor) with that directory stripped, so
+    the tree lands directly in dest; for tars it is returned as the root.
+    """
+    monitor = monitor or UpdateMonitor()
+
+    if zipfile.is_zipfile(archive):
+        result = extract_zip(
+            archive, dest, strip_top_dir=True, check_cancelled=monitor.check_cancelled
+        )
+        logger.info(f"Extracted {result.files} files ({result.bytes_written} bytes) from {archive.name}")
+        return result.root
+
+    dest.mkdir(parents=True, exist_ok=True)
+    dest_root = os.path.realpath(dest)
+
+    def check(name: str) -> None:
+        target = os.path.realpath(os.path.join(dest_root, name))
+        if target != dest_root and not target.startswith(dest_root + os.sep):
+            raise ValueError(f"Archive entry would escape target directory: {name}")
+
+    with tarfile.open(archive, "r:*") as tf:
+        members = []
+        for member in tf.getmembers():
+            check(member.name)
+            if member.issym() or member.islnk():
+                check(os.path.join(os.path.dirname(member.name), member.linkname))
+            if member.isdev():
+                continue
+            members.append(member)
+        # The "data" filter (where available) additionally strips unsafe modes
+        extra = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        tf.extractall(dest, members=members, **extra)
+
+    entries = list(dest.iterdir())
+    if len(entries) == 1 and entries[0].is_dir():
+        return entries[0]
+    return dest
+
+
+def _is_current(settings: Settings, version: str) -> bool:
+    return firmware_store.current_version(settings) == firmware_store.version_dir_name(version)
+
+
+def _is_git_repo(path: Path) -> bool:
+    if not path.is_dir():
+        return False
+    return (path / ".git").exists() or ((path / "HEAD").is_file() and (path / "objects").is_dir())
+
+
+def _archive_stem(name: str) -> str:
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def _read_checksum_file(archive: Path) -> str | None:
+    """Digest from a sha256sum-style <archive>.sha256 file next to the archive."""
+    checksum_file = archive.with_name(archive.name + ".sha256")
+    if not checksum_file.is_file():
+        return None
+    content = checksum_file.read_text().split()
+    return content[0] if content else None
+
+
+def install_staged_tree(
+    settings: Settings,
+    tree: Path,
+    version: str,
+    monitor: UpdateMonitor | None = None,
+    mode: str | None = None,
+) -> bool:
+    """Pre-warm, install packages into and activate an extracted firmware tree.
+
+    In incremental mode (the default, see settings.firmware_update_mode) files
+    whose content matches the current version keep its mtimes, so SCons only
+    rebuilds what the release actually changed.
+
+    Returns True once the tree is the current version, False on failure.
+    Raises UpdateCancelled if the monitor is cancelled before activation.
+    """
+    monitor = monitor or UpdateMonitor()
+    mode = mode or settings.firmware_update_mode
+    if mode not in UPDATE_MODES:
+        return monitor.fail(f"Unknown firmware update mode: {mode}")
+
+    current = firmware_store.current_version(settings)
+    if mode == "incremental" and current is not None:
+        monitor.report("extract", "Comparing with the installed version...")
+        report = sync_unchanged_mtimes(firmware_store.tree_path(settings, current), tree, monitor)
+        monitor.sync_report = report
+        logger.info(f"Incremental update against {current}: {report.summary()}")
+
+    monitor.report("prewarm", "Seeding caches from the current version...")
+    _prewarm_tree(settings, tree)
+
+    # Set up PlatformIO (no shell=True)
+    monitor.report("install", "Installing PlatformIO dependencies...")
+    logger.info("Installing PlatformIO dependencies...")
+    returncode, stderr = _install_packages(tree, monitor)
+    if returncode != 0:
+        return monitor.fail(f"PlatformIO setup failed: {stderr}")
+
+    monitor.report("verify", "Verifying firmware tree...")
+    if not (tree / "platformio.ini").is_file():
+        return monitor.fail(f"Firmware source has no platformio.ini: {tree}")
+
+    # Last point a cancel takes effect — the switch itself is not interruptible
+    monitor.report("activate", f"Switching to {version}...")
+    firmware_store.activate(settings, tree, version)
+    _write_version_file(settings, version)
+    firmware_store.prune_versions(settings)
+
+    if monitor.sync_report is not None and not monitor.result:
+        monitor.result = f"Updated to {version}: {monitor.sync_report.summary()}."
+    logger.info("Firmware update completed successfully!")
+    return True
+
+
+def sync_unchanged_mtimes(installed: Path, staged: Path, monitor: UpdateMonitor | None = None) -> SyncReport:
+    """Give staged files that are byte-identical to the installed tree its mtimes.
+
+    Builds never see a half-updated tree, so rather than rewriting the live
+    version in place, the staged copy inherits timestamps for every file whose
+    content hash is unchanged. The result is what an in-place sync would leave
+    behind: only added and changed files look new to SCons.
+    """
+    monitor = monitor or UpdateMonitor()
+    report = SyncReport()
+    seen: set[str] = set()
+
+    for path in _iter_source_files(staged):
+        monitor.check_cancelled()
+        rel = path.relative_to(staged).as_posix()
+        seen.add(rel)
+        old = installed / rel
+        try:
+            old_stat = old.stat()
+        except OSError:
+            report.added += 1
+            continue
+        if old_stat.st_size == path.stat().st_size and _sha256_file(old) == _sha256_file(path):
+            os.utime(path, ns=(old_stat.st_atime_ns, old_stat.st_mtime_ns))
+            report.unchanged += 1
+        else:
+            report.changed += 1
+
+    for path in _iter_source_files(installed):
+        if path.relative_to(installed).as_posix() not in seen:
+            report.removed += 1
+    return report
+
+
+def _iter_source_files(root: Path):
+    """Regular files of a firmware tree, skipping build output and store bookkeeping."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == str(root):
+            dirnames[:] = [d for d in dirnames if d not in _SYNC_SKIP_DIRS]
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            if path.is_file() and not path.is_symlink():
+                yield path
+
+
+def _install_packages(tree: Path, monitor: UpdateMonitor) -> tuple[int, str]:
+    """Install the tree's PlatformIO platforms, toolchains and libraries."""
+    return _run_cancellable(["pio", "pkg", "install"], tree, monitor)
+
+
+def _run_cancellable(cmd: list[str], cwd: Path, monitor: UpdateMonitor) -> tuple[int, str]:
+    """Run a subprocess, killing it if the update is cancelled. Returns (returncode, stderr)."""
+    process = subprocess.Popen(cmd, cwd=str(cwd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=1)
+            return process.returncode, stderr
+        except subprocess.TimeoutExpired:
+            if monitor.cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                monitor.check_cancelled()
+
+
+def _prewarm_tree(settings: Settings, tree: Path) -> None:
+    """Seed a new tree with the current version's library and build caches.
+
+    Unchanged libraries then skip the download in `pio pkg install`, and SCons
+    finds matching content signatures for unchanged sources. Firmware images
+    are skipped — they carry baked-in PSKs.
+    """
+    version = firmware_store.current_version(settings)
+    if version is None:
+        return
+    previous_pio = firmware_store.tree_path(settings, version) / ".pio"
+    if not previous_pio.is_dir():
+        return
+
+    for sub in ("libdeps", "build"):
+        src = previous_pio / sub
+        if src.is_dir():
+            shutil.copytree(
+                str(src),
+                str(tree / ".pio" / sub),
+                ignore=shutil.ignore_patterns("firmware.*"),
+                symlinks=True,
+                dirs_exist_ok=True,
+            )
+    logger.info(f"Pre-warmed new firmware tree from version {version}")
+
+
+def _write_version_file(settings: Settings, version: str) -> None:
+    """Record the active firmware version for get_firmware_version()."""
+    version_file = settings.base_dir / "firmware_version.txt"
+    version_file.write_text(f"Version: {version}\nUpdated: {datetime.now().isoformat()}\n")
 
 
 def get_firmware_version(settings: Settings) -> dict:
@@ -0,0 +1,66 @@
+"""Memoized userPrefs.jsonc generation for the preview/generate endpoints.
+
+The builder UI re-requests a preview on every form change, mostly with
+inputs it has already sent. Generated output depends only on the form data,
+so results are kept in a small LRU keyed by the hash of the request in
+canonical JSON (sorted keys, compact separators) and served with an ETag of
+the generated content.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any
+
+from mtfwbuilder.services.jsonc_generator import generate_jsonc
+
+MAX_CACHED_CONFIGS = 256
+
+
+def request_digest(form_data: Any) -> str:
+    """Hash of form_data that is the same for any key order or whitespace."""
+    text = json.dumps(form_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class JsoncCache:
+    """Bounded LRU of generated configs: request digest -> (etag, content)."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_CONFIGS):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def generate(self, form_data: dict[str, Any]) -> tuple[str, str]:
+        """Return (etag, content) for form_data, generating only on a miss.
+
+        Errors from generate_jsonc propagate and nothing is cached for them.
+        """
+        key = request_digest(form_data)
+        cached = self._entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return cached
+
+        self.misses += 1
+        content = generate_jsonc(form_data)
+        cached = (f'"{hashlib.sha256(content.encode("utf-8")).hexdigest()[:20]}"', content)
+        self._entries[key] = cached
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return cached
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
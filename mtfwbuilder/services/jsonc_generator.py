@@ -1,158 +1,195 @@
 """JSONC configuration generator for Meshtastic userPrefs files.
 
-Migrated from utils/jsonc_generator.py — logic preserved exactly.
+Migrated from utils/jsonc_generator.py.
+
+The form-field → USERPREFS_* mapping is declared once in SCHEMA (and
+CHANNEL_SCHEMA for the per-channel `channel_<n>[<prop>]` fields) and compiled
+at import into a lookup table. Generation is then one pass over the input to
+pick out known fields, followed by emitting the collected values in schema
+order.
+
+export_schema() publishes the same tables for the browser-side renderer in
+static/js/jsonc-preview.js, which must produce byte-identical output.
 """
 
+import hashlib
 import json
+from dataclasses import dataclass
 from typing import Any
 
+# Value kinds
+VALUE = "value"  # emitted when non-empty
+PRESENT = "present"  # emitted whenever the field is sent, even empty
+BOOL = "bool"  # emitted whenever sent, as "true" only for "true"
+REGION = "region"  # LoRa region, prefixed with the protobuf enum name
+PSK = "psk"  # hex string or {…} byte list, formatted as a C byte list
+
+REGION_PREFIX = "meshtastic_Config_LoRaConfig_RegionCode_"
+CHANNELS_TO_WRITE_KEY = "USERPREFS_CHANNELS_TO_WRITE"
+CHANNEL_KEY_PREFIX = "USERPREFS_CHANNEL_"  # + f"{n}_{field.key}"
+
+
+@dataclass(frozen=True)
+class Field:
+    """One form field and the USERPREFS_* key it becomes."""
+
+    name: str
+    key: str
+    kind: str = VALUE
+    requires: tuple[str, ...] = ()  # form fields that must all be "true" for this one to be written
+
+
+_LORA = ("lora_enabled",)
+_GPS = ("gps_enabled",)
+_NETWORK = ("network_enabled",)
+
+# Output order is schema order
+SCHEMA: tuple[Field, ...] = (
+    Field("device_name", "USERPREFS_CONFIG_DEVICE_NAME"),
+    Field("owner_short_name", "USERPREFS_CONFIG_OWNER_SHORT_NAME"),
+    Field("owner_long_name", "USERPREFS_CONFIG_OWNER_LONG_NAME"),
+    Field("tz_string", "USERPREFS_TZ_STRING"),
+    Field("bluetooth_fixed_pin", "USERPREFS_FIXED_BLUETOOTH"),
+    # Channels are emitted here (see CHANNEL_SCHEMA)
+    Field("lora_region", "USERPREFS_CONFIG_LORA_REGION", REGION, _LORA),
+    Field("lora_modem_preset", "USERPREFS_LORACONFIG_MODEM_PRESET", VALUE, _LORA),
+    Field("lora_channel_num", "USERPREFS_LORACONFIG_CHANNEL_NUM", VALUE, _LORA),
+    Field("lora_ignore_mqtt", "USERPREFS_CONFIG_LORA_IGNORE_MQTT", BOOL, _LORA),
+    Field("gps_mode", "USERPREFS_CONFIG_GPS_MODE", VALUE, _GPS),
+    Field("gps_update_interval", "USERPREFS_CONFIG_GPS_UPDATE_INTERVAL", VALUE, _GPS),
+    Field("position_broadcast_interval", "USERPREFS_CONFIG_POSITION_BROADCAST_INTERVAL", VALUE, _GPS),
+    Field("fixed_lat", "USERPREFS_CONFIG_POSITION_FIXED_LAT", VALUE, _GPS + ("fixed_position",)),
+    Field("fixed_lon", "USERPREFS_CONFIG_POSITION_FIXED_LON", VALUE, _GPS + ("fixed_position",)),
+    Field("fixed_alt", "USERPREFS_CONFIG_POSITION_FIXED_ALT", VALUE, _GPS + ("fixed_position",)),
+    Field("smart_position_enabled", "USERPREFS_CONFIG_POSITION_SMART_ENABLED", BOOL, _GPS),
+    Field("admin_key_0", "USERPREFS_ADMIN_KEY_0"),
+    Field("admin_key_1", "USERPREFS_ADMIN_KEY_1"),
+    Field("admin_key_2", "USERPREFS_ADMIN_KEY_2"),
+    Field("network_protocols", "USERPREFS_CONFIG_NETWORK_ENABLED_PROTOCOLS", VALUE, _NETWORK),
+    Field("wifi_ssid", "USERPREFS_CONFIG_WIFI_SSID", VALUE, _NETWORK + ("wifi_enabled",)),
+    Field("wifi_psk", "USERPREFS_CONFIG_WIFI_PSK", VALUE, _NETWORK + ("wifi_enabled",)),
+    Field("mqtt_address", "USERPREFS_CONFIG_MQTT_SERVER", VALUE, _NETWORK + ("mqtt_enabled",)),
+    Field("mqtt_root_topic", "USERPREFS_CONFIG_MQTT_ROOT_TOPIC", VALUE, _NETWORK + ("mqtt_enabled",)),
+    Field("mqtt_username", "USERPREFS_CONFIG_MQTT_USERNAME", VALUE, _NETWORK + ("mqtt_enabled",)),
+    Field("mqtt_password", "USERPREFS_CONFIG_MQTT_PASSWORD", VALUE, _NETWORK + ("mqtt_enabled",)),
+    Field("mqtt_encryption_enabled", "USERPREFS_CONFIG_MQTT_ENCRYPTION_ENABLED", BOOL, _NETWORK + ("mqtt_enabled",)),
+    Field("mqtt_tls_enabled", "USERPREFS_CONFIG_MQTT_TLS_ENABLED", BOOL, _NETWORK + ("mqtt_enabled",)),
+    Field("oem_text", "USERPREFS_CONFIG_OEM_TEXT"),
+    Field("oem_font_size", "USERPREFS_CONFIG_OEM_FONT_SIZE"),
+    Field("oem_image_width", "USERPREFS_CONFIG_OEM_IMAGE_WIDTH"),
+    Field("oem_image_height", "USERPREFS_CONFIG_OEM_IMAGE_HEIGHT"),
+    Field("oem_image_data", "USERPREFS_CONFIG_OEM_IMAGE_DATA"),
+)
+
+# Per channel, from `channel_<n>[<prop>]`; keys are USERPREFS_CHANNEL_<n>_<suffix>
+CHANNEL_SCHEMA: tuple[Field, ...] = (
+    Field("name", "NAME", PRESENT),
+    Field("precision", "PRECISION", PRESENT),
+    Field("psk", "PSK", PSK),
+    Field("uplink_enabled", "UPLINK_ENABLED", BOOL),
+    Field("downlink_enabled", "DOWNLINK_ENABLED", BOOL),
+)
+
+# Compiled lookup tables: input name → slot in schema order
+_SLOTS: dict[str, int] = {f.name: i for i, f in enumerate(SCHEMA)}
+_CHANNEL_SLOTS: dict[str, int] = {f.name: i for i, f in enumerate(CHANNEL_SCHEMA)}
+_FIRST_CHANNEL_SLOT = _SLOTS["lora_region"]  # channels sit between the basic fields and LoRa
+_CHANNEL_KEYS: list[tuple[str, ...]] = []  # per channel index, USERPREFS keys in CHANNEL_SCHEMA order
+
+
+def _channel_keys(index: int) -> tuple[str, ...]:
+    while len(_CHANNEL_KEYS) <= index:
+        n = len(_CHANNEL_KEYS)
+        _CHANNEL_KEYS.append(tuple(f"{CHANNEL_KEY_PREFIX}{n}_{f.key}" for f in CHANNEL_SCHEMA))
+    return _CHANNEL_KEYS[index]
+
+
+def export_schema() -> dict[str, Any]:
+    """The field mapping as JSON for the client-side renderer, with a content version."""
+    body = {
+        "channels_to_write_key": CHANNELS_TO_WRITE_KEY,
+        "channel_key_prefix": CHANNEL_KEY_PREFIX,
+        "channels_before": SCHEMA[_FIRST_CHANNEL_SLOT].name,
+        "region_prefix": REGION_PREFIX,
+        "fields": [_field_json(f) for f in SCHEMA],
+        "channel_fields": [_field_json(f) for f in CHANNEL_SCHEMA],
+    }
+    version = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:12]
+    return {"version": version, **body}
+
+
+def _field_json(f: Field) -> dict[str, Any]:
+    return {"name": f.name, "key": f.key, "kind": f.kind, "requires": list(f.requires)}
+
+
+_MISSING = object()
+
 
 def generate_jsonc(config_data: dict[str, Any]) -> str:
     """Generate a userPrefs.jsonc string from form data."""
-    output: dict[str, str] = {}
-
     channels_to_write = config_data.get("channels_to_write", "1")
-    output["USERPREFS_CHANNELS_TO_WRITE"] = channels_to_write
-
-    _set_if_present(config_data, output, "device_name", "USERPREFS_CONFIG_DEVICE_NAME")
-    _set_if_present(config_data, output, "owner_short_name", "USERPREFS_CONFIG_OWNER_SHORT_NAME")
-    _set_if_present(config_data, output, "owner_long_name", "USERPREFS_CONFIG_OWNER_LONG_NAME")
-    _set_if_present(config_data, output, "tz_string", "USERPREFS_TZ_STRING")
-    _set_if_present(config_data, output, "bluetooth_fixed_pin", "USERPREFS_FIXED_BLUETOOTH")
-
     channel_count = int(channels_to_write)
-    for i in range(channel_count):
-        _process_channel_config(config_data, output, i)
 
-    _process_lora_config(config_data, output)
-    _process_gps_config(config_data, output)
-    _process_admin_keys(config_data, output)
-    _process_network_config(config_data, output)
-    _process_oem_config(config_data, output)
+    values: list[Any] = [_MISSING] * len(SCHEMA)
+    channels: dict[int, list[Any]] = {}
+
+    # Single pass: route each known input field to its slot
+    for name, value in config_data.items():
+        slot = _SLOTS.get(name)
+        if slot is not None:
+            values[slot] = value
+            continue
+        if name.startswith("channel_") and name.endswith("]"):
+            index, prop = _parse_channel_field(name)
+            if index is not None and index < channel_count:
+                channel_slot = _CHANNEL_SLOTS.get(prop)
+                if channel_slot is not None:
+                    if index not in channels:
+                        channels[index] = [_MISSING] * len(CHANNEL_SCHEMA)
+                    channels[index][channel_slot] = value
+
+    output: dict[str, Any] = {CHANNELS_TO_WRITE_KEY: channels_to_write}
+    for slot, field in enumerate(SCHEMA):
+        if slot == _FIRST_CHANNEL_SLOT:
+            for index in sorted(channels):
+                for channel_field, key, value in zip(CHANNEL_SCHEMA, _channel_keys(index), channels[index]):
+                    _emit(output, key, channel_field.kind, value)
+        value = values[slot]
+        if value is _MISSING:
+            continue
+        if field.requires and not all(config_data.get(gate) == "true" for gate in field.requires):
+            continue
+        _emit(output, field.key, field.kind, value)
 
     return json.dumps(output, indent=2)
 
 
-def _set_if_present(data: dict, output: dict, key: str, output_key: str) -> None:
-    """Set output_key if key exists and is non-empty in data."""
-    val = data.get(key)
-    if val:
-        output[output_key] = val
-
+def _parse_channel_field(name: str) -> tuple[int | None, str]:
+    """Split `channel_<n>[<prop>]` into (n, prop); n is None if malformed."""
+    number, bracket, rest = name[len("channel_"):].partition("[")
+    # Only canonical numbers match, as with the f"channel_{i}[" prefix it replaces
+    if not bracket or not (number.isascii() and number.isdigit()) or number != str(int(number)):
+        return None, ""
+    return int(number), rest[: rest.find("]")]
 
-def _process_channel_config(config_data: dict, output: dict, channel_index: int) -> None:
-    """Process configuration for a specific channel."""
-    channel_data: dict[str, str] = {}
-    prefix = f"channel_{channel_index}["
-    for key in config_data:
-        if key.startswith(prefix) and key.endswith("]"):
-            prop = key[key.find("[") + 1 : key.find("]")]
-            channel_data[prop] = config_data[key]
 
-    if not channel_data:
+def _emit(output: dict, key: str, kind: str, value: Any) -> None:
+    if value is _MISSING:
         return
-
-    if "name" in channel_data:
-        output[f"USERPREFS_CHANNEL_{channel_index}_NAME"] = channel_data["name"]
-    if "precision" in channel_data:
-        output[f"USERPREFS_CHANNEL_{channel_index}_PRECISION"] = channel_data["precision"]
-
-    if channel_data.get("psk"):
-        _process_channel_psk(channel_data["psk"], output, channel_index)
-
-    for setting in ("uplink_enabled", "downlink_enabled"):
-        if setting in channel_data:
-            key = f"USERPREFS_CHANNEL_{channel_index}_{setting.upper()}"
-            output[key] = "true" if channel_data[setting] == "true" else "false"
-
-
-def _process_channel_psk(psk_value: str, output: dict, channel_index: int) -> None:
-    """Process and format Pre-Shared Key for a channel."""
-    psk = psk_value.strip()
-    if psk.startswith("{") and psk.endswith("}"):
-        output[f"USERPREFS_CHANNEL_{channel_index}_PSK"] = psk
-    elif psk:
-        psk_bytes = [f"0x{psk[i:i+2]}" for i in range(0, len(psk), 2)]
-        output[f"USERPREFS_CHANNEL_{channel_index}_PSK"] = "{ " + ", ".join(psk_bytes) + " }"
-
-
-def _process_lora_config(config_data: dict, output: dict) -> None:
-    """Process LoRa radio configuration settings."""
-    if config_data.get("lora_enabled") != "true":
-        return
-
-    region = config_data.get("lora_region")
-    if region:
-        if region.startswith("meshtastic_Config_LoRaConfig_RegionCode_"):
-            output["USERPREFS_CONFIG_LORA_REGION"] = region
-        else:
-            output["USERPREFS_CONFIG_LORA_REGION"] = f"meshtastic_Config_LoRaConfig_RegionCode_{region}"
-
-    _set_if_present(config_data, output, "lora_modem_preset", "USERPREFS_LORACONFIG_MODEM_PRESET")
-    _set_if_present(config_data, output, "lora_channel_num", "USERPREFS_LORACONFIG_CHANNEL_NUM")
-
-    if "lora_ignore_mqtt" in config_data:
-        output["USERPREFS_CONFIG_LORA_IGNORE_MQTT"] = "true" if config_data["lora_ignore_mqtt"] == "true" else "false"
-
-
-def _process_gps_config(config_data: dict, output: dict) -> None:
-    """Process GPS and positioning configuration settings."""
-    if config_data.get("gps_enabled") != "true":
-        return
-
-    _set_if_present(config_data, output, "gps_mode", "USERPREFS_CONFIG_GPS_MODE")
-    _set_if_present(config_data, output, "gps_update_interval", "USERPREFS_CONFIG_GPS_UPDATE_INTERVAL")
-    _set_if_present(config_data, output, "position_broadcast_interval", "USERPREFS_CONFIG_POSITION_BROADCAST_INTERVAL")
-
-    if config_data.get("fixed_position") == "true":
-        _set_if_present(config_data, output, "fixed_lat", "USERPREFS_CONFIG_POSITION_FIXED_LAT")
-        _set_if_present(config_data, output, "fixed_lon", "USERPREFS_CONFIG_POSITION_FIXED_LON")
-        _set_if_present(config_data, output, "fixed_alt", "USERPREFS_CONFIG_POSITION_FIXED_ALT")
-
-    if "smart_position_enabled" in config_data:
-        output["USERPREFS_CONFIG_POSITION_SMART_ENABLED"] = (
-            "true" if config_data["smart_position_enabled"] == "true" else "false"
-        )
-
-
-def _process_admin_keys(config_data: dict, output: dict) -> None:
-    """Process admin keys (up to 3 keys supported)."""
-    for i in range(3):
-        _set_if_present(config_data, output, f"admin_key_{i}", f"USERPREFS_ADMIN_KEY_{i}")
-
-
-def _process_network_config(config_data: dict, output: dict) -> None:
-    """Process network and connectivity configuration."""
-    if config_data.get("network_enabled") != "true":
-        return
-
-    _set_if_present(config_data, output, "network_protocols", "USERPREFS_CONFIG_NETWORK_ENABLED_PROTOCOLS")
-
-    if config_data.get("wifi_enabled") == "true":
-        _set_if_present(config_data, output, "wifi_ssid", "USERPREFS_CONFIG_WIFI_SSID")
-        _set_if_present(config_data, output, "wifi_psk", "USERPREFS_CONFIG_WIFI_PSK")
-
-    if config_data.get("mqtt_enabled") == "true":
-        _process_mqtt_config(config_data, output)
-
-
-def _process_mqtt_config(config_data: dict, output: dict) -> None:
-    """Process MQTT-specific configuration settings."""
-    _set_if_present(config_data, output, "mqtt_address", "USERPREFS_CONFIG_MQTT_SERVER")
-    _set_if_present(config_data, output, "mqtt_root_topic", "USERPREFS_CONFIG_MQTT_ROOT_TOPIC")
-    _set_if_present(config_data, output, "mqtt_username", "USERPREFS_CONFIG_MQTT_USERNAME")
-    _set_if_present(config_data, output, "mqtt_password", "USERPREFS_CONFIG_MQTT_PASSWORD")
-
-    for field in ("mqtt_encryption_enabled", "mqtt_tls_enabled"):
-        if field in config_data:
-            key = "USERPREFS_CONFIG_" + field.upper()
-            output[key] = "true" if config_data[field] == "true" else "false"
-
-
-def _process_oem_config(config_data: dict, output: dict) -> None:
-    """Process OEM and branding configuration settings."""
-    _set_if_present(config_data, output, "oem_text", "USERPREFS_CONFIG_OEM_TEXT")
-    _set_if_present(config_data, output, "oem_font_size", "USERPREFS_CONFIG_OEM_FONT_SIZE")
-    _set_if_present(config_data, output, "oem_image_width", "USERPREFS_CONFIG_OEM_IMAGE_WIDTH")
-    _set_if_present(config_data, output, "oem_image_height", "USERPREFS_CONFIG_OEM_IMAGE_HEIGHT")
-    _set_if_present(config_data, output, "oem_image_data", "USERPREFS_CONFIG_OEM_IMAGE_DATA")
+    if kind == VALUE:
+        if value:
+            output[key] = value
+    elif kind == PRESENT:
+        output[key] = value
+    elif kind == BOOL:
+        output[key] = "true" if value == "true" else "false"
+    elif kind == REGION:
+        if value:
+            output[key] = value if value.startswith(REGION_PREFIX) else f"{REGION_PREFIX}{value}"
+    elif kind == PSK:
+        psk = value.strip() if value else ""
+        if psk.startswith("{") and psk.endswith("}"):
+            output[key] = psk
+        elif psk:
+            psk_bytes = [f"0x{psk[i:i+2]}" for i in range(0, len(psk), 2)]
+            output[key] = "{ " + ", ".join(psk_bytes) + " }"
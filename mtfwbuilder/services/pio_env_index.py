@@ -0,0 +1,212 @@
+"""Index of the PlatformIO environments a firmware tree can build.
+
+The firmware's platformio.ini pulls in per-architecture and per-variant .ini
+files through `[platformio] extra_configs`, and environments inherit options
+through `extends`. Resolving that is done once per installed firmware tree and
+cached, so a request for an environment the tree doesn't define can be
+rejected up front instead of failing minutes into a PlatformIO run.
+"""
+
+import configparser
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services import firmware_store
+
+logger = logging.getLogger("mtfwbuilder.pio_env_index")
+
+ENV_PREFIX = "env:"
+MAX_CACHED_INDEXES = 8
+
+_INTERPOLATION = re.compile(r"\$\{([^}]+)\}")
+_MAX_DEPTH = 16  # extends / ${...} nesting limit, guards against cycles
+
+
+@dataclass(frozen=True)
+class PioEnvironment:
+    """One `[env:<name>]` section, with inherited options resolved."""
+
+    name: str
+    platform: str = ""  # PlatformIO platform spec, e.g. platformio/espressif32@6.9.0
+    board: str = ""
+    flash_size: str = ""  # e.g. 8MB; empty when neither the env nor the board JSON says
+    variant_dir: str = ""  # variants/<dir>/… subdirectory the env is defined under, e.g. esp32s3
+    source: str = ""  # .ini file defining the env, relative to the tree
+
+
+@dataclass
+class EnvIndex:
+    """Environments defined by one firmware tree."""
+
+    version: str | None
+    key: tuple[str, int]  # (tree realpath, platformio.ini mtime_ns)
+    environments: dict[str, PioEnvironment]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.environments
+
+    def get(self, name: str) -> PioEnvironment | None:
+        return self.environments.get(name)
+
+
+_cache: dict[tuple[str, int], EnvIndex] = {}
+_cache_lock = threading.Lock()
+
+
+def get_index(settings: Settings, version: str | None = None) -> EnvIndex | None:
+    """Environment index for a firmware version (None = current).
+
+    Returns None when no firmware is installed. Raises KeyError for an
+    explicitly requested version that is not installed. Versioned trees never
+    change once installed, so an index is built at most once per version.
+    """
+    version, tree = firmware_store.resolve(settings, version)
+    ini = tree / "platformio.ini"
+    try:
+        key = (os.path.realpath(tree), ini.stat().st_mtime_ns)
+    except OSError:
+        return None
+
+    with _cache_lock:
+        index = _cache.get(key)
+    if index is not None:
+        return index
+
+    index = EnvIndex(version=version, key=key, environments=build_index(tree))
+    logger.info(f"Indexed {len(index.environments)} PlatformIO environments for firmware {version}")
+    with _cache_lock:
+        _cache[key] = index
+        while len(_cache) > MAX_CACHED_INDEXES:
+            _cache.pop(next(iter(_cache)))
+    return index
+
+
+def build_index(tree: Path) -> dict[str, PioEnvironment]:
+    """Parse platformio.ini and its extra_configs into environments by name."""
+    tree = Path(tree)
+    parser = _new_parser()
+    sources: dict[str, str] = {}
+
+    _read(parser, tree / "platformio.ini", tree, sources)
+    if parser.has_option("platformio", "extra_configs"):
+        for pattern in _split_list(parser.get("platformio", "extra_configs")):
+            for path in sorted(tree.glob(pattern)):
+                _read(parser, path, tree, sources)
+
+    resolver = _Resolver(parser)
+    environments: dict[str, PioEnvironment] = {}
+    for section in parser.sections():
+        if not section.startswith(ENV_PREFIX):
+            continue
+        name = section[len(ENV_PREFIX):].strip()
+        board = resolver.get(section, "board")
+        source = sources.get(section, "")
+        environments[name] = PioEnvironment(
+            name=name,
+            platform=resolver.get(section, "platform"),
+            board=board,
+            flash_size=resolver.get(section, "board_upload.flash_size") or _board_flash_size(tree, board),
+            variant_dir=_variant_dir(source),
+            source=source,
+        )
+    return environments
+
+
+def _new_parser() -> configparser.ConfigParser:
+    # Same dialect PlatformIO reads: ; and # comments, repeated sections merge
+    parser = configparser.ConfigParser(
+        interpolation=None,
+        strict=False,
+        inline_comment_prefixes=(";", "#"),
+        comment_prefixes=(";", "#"),
+    )
+    parser.optionxform = str
+    return parser
+
+
+def _read(parser: configparser.ConfigParser, path: Path, tree: Path, sources: dict[str, str]) -> None:
+    """Merge one .ini into parser, remembering which file first defined each section."""
+    before = set(parser.sections())
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            parser.read_file(f, source=str(path))
+    except (OSError, configparser.Error) as e:
+        logger.warning(f"Skipping unreadable PlatformIO config {path}: {e}")
+        return
+    relative = path.relative_to(tree).as_posix()
+    for section in parser.sections():
+        if section not in before:
+            sources.setdefault(section, relative)
+
+
+def _split_list(value: str) -> list[str]:
+    """PlatformIO list options are separated by newlines and/or commas."""
+    return [item.strip() for line in value.splitlines() for item in line.split(",") if item.strip()]
+
+
+def _variant_dir(source: str) -> str:
+    parts = source.split("/")
+    if len(parts) > 2 and parts[0] == "variants":
+        return parts[1]
+    return ""
+
+
+def _board_flash_size(tree: Path, board: str) -> str:
+    """Flash size from a board definition shipped in the tree's boards/ directory."""
+    if not board:
+        return ""
+    try:
+        data = json.loads((tree / "boards" / f"{board}.json").read_text())
+    except (OSError, ValueError):
+        return ""
+    return str(data.get("upload", {}).get("flash_size", ""))
+
+
+class _Resolver:
+    """Option lookup with PlatformIO's inheritance: section, then `extends`, then [env]."""
+
+    def __init__(self, parser: configparser.ConfigParser):
+        self.parser = parser
+
+    def get(self, section: str, option: str) -> str:
+        value = self._lookup(section, option, 0)
+        if value is None:
+            return ""
+        return self._interpolate(value, section, 0).strip()
+
+    def _lookup(self, section: str, option: str, depth: int) -> str | None:
+        if depth > _MAX_DEPTH or not self.parser.has_section(section):
+            return None
+        if self.parser.has_option(section, option):
+            return self.parser.get(section, option)
+        if self.parser.has_option(section, "extends"):
+            for parent in _split_list(self.parser.get(section, "extends")):
+                value = self._lookup(parent, option, depth + 1)
+                if value is not None:
+                    return value
+        if section.startswith(ENV_PREFIX) and depth == 0 and self.parser.has_option("env", option):
+            return self.parser.get("env", option)
+        return None
+
+    def _interpolate(self, value: str, section: str, depth: int) -> str:
+        if depth > _MAX_DEPTH or "${" not in value:
+            return value
+
+        def replace(match: re.Match) -> str:
+            ref_section, _, ref_option = match.group(1).partition(".")
+            if ref_section == "sysenv":
+                return os.environ.get(ref_option, "")
+            if ref_section == "this":
+                ref_section = section
+            resolved = self._lookup(ref_section, ref_option, 0)
+            if resolved is None:
+                return ""
+            return self._interpolate(resolved, ref_section, depth + 1)
+
+        return _INTERPOLATION.sub(replace, value)
@@ -0,0 +1,109 @@
+"""Stored config profiles: org base profiles with per-node overlays.
+
+A profile's config is one layer of form fields (the /api/v1/generate input).
+Base profiles hold what an org's nodes share; a node overlay names a base as
+its parent and holds only what differs. Resolving a profile merges its chain
+root first, each layer overriding its parent's fields (JSON null removes an
+inherited field). Resolved configs are memoized by the chain's
+(id, revision) pairs, so an edit anywhere up the chain is seen on the next
+resolve without any invalidation.
+"""
+
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from mtfwbuilder.database import MAX_PROFILE_DEPTH
+from mtfwbuilder.services.config_canonical import canonicalize
+from mtfwbuilder.services.jsonc_generator import generate_jsonc
+
+BASE = "base"
+NODE = "node"
+MAX_RESOLVED_PROFILES = 256
+
+
+class ProfileError(ValueError):
+    """A profile that can't be stored or resolved as asked."""
+
+
+@dataclass(frozen=True)
+class ResolvedProfile:
+    """A profile merged with its ancestors, ready to build."""
+
+    profile_id: int
+    config: dict[str, Any]  # merged form fields
+    content: str  # generated userPrefs.jsonc
+    config_hash: str  # canonical digest, the same as for an equivalent upload
+
+
+def merge_layers(layers: list[dict[str, Any]]) -> dict[str, Any]:
+    """Merge form-field layers, later ones overriding; None drops a field."""
+    merged: dict[str, Any] = {}
+    for layer in layers:
+        for key, value in layer.items():
+            if value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+    return merged
+
+
+def check_parent(profile_id: int | None, org: str, parent_chain: list[dict]) -> None:
+    """Raise ProfileError unless a profile of org may inherit from the last row of parent_chain.
+
+    parent_chain is the parent's own chain (root first); profile_id is None
+    for a profile that doesn't exist yet.
+    """
+    parent = parent_chain[-1]
+    if parent["kind"] != BASE:
+        raise ProfileError("Profiles can only inherit from a base profile")
+    if parent["org"] != org:
+        raise ProfileError(f"Profile {parent['id']} belongs to another org")
+    if profile_id is not None and any(row["id"] == profile_id for row in parent_chain):
+        raise ProfileError("A profile can't inherit from itself or its descendants")
+    if len(parent_chain) >= MAX_PROFILE_DEPTH:
+        raise ProfileError(f"Profiles can be nested at most {MAX_PROFILE_DEPTH} deep")
+
+
+def render(config: dict[str, Any]) -> tuple[str, str]:
+    """(userPrefs.jsonc, canonical hash) for merged form fields."""
+    content = generate_jsonc(config)
+    return content, canonicalize(content).digest
+
+
+class ProfileCache:
+    """Bounded LRU of resolved profiles, keyed by their chain's (id, revision) pairs."""
+
+    def __init__(self, max_entries: int = MAX_RESOLVED_PROFILES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, ResolvedProfile] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, chain: list[dict]) -> ResolvedProfile:
+        """Resolve the last profile of chain (database.get_profile_chain order).
+
+        Raises ProfileError for a chain cut off at MAX_PROFILE_DEPTH, and
+        whatever generate_jsonc raises for an unusable merged config.
+        """
+        if chain[0]["parent_id"] is not None:
+            raise ProfileError(f"Profile {chain[-1]['id']} is nested more than {MAX_PROFILE_DEPTH} deep")
+        key = tuple((row["id"], row["revision"]) for row in chain)
+        resolved = self._entries.get(key)
+        if resolved is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return resolved
+
+        self.misses += 1
+        config = merge_layers([json.loads(row["config_json"]) for row in chain])
+        content, config_hash = render(config)
+        resolved = ResolvedProfile(profile_id=chain[-1]["id"], config=config, content=content, config_hash=config_hash)
+        self._entries[key] = resolved
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return resolved
+
+    def stats(self) -> dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,301 @@
+"""Background firmware update jobs with streamed progress.
+
+One update runs at a time, in a worker thread. Progress events are recorded
+on the job so any number of SSE clients (including late joiners) can replay
+and follow them.
+
+With several uvicorn workers, the job runs in the worker that started it.
+An flock on temp_dir/update_jobs/lock (holding the job ID) keeps other
+workers from starting a second update, and each job's events are appended
+to update_jobs/<job_id>.jsonl, so any worker can stream its progress; a
+cancel request from another worker drops a <job_id>.cancel file the running
+job watches for.
+"""
+
+import asyncio
+import fcntl
+import functools
+import json
+import logging
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import IO, Callable
+
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services.firmware_updater import UpdateMonitor, update_firmware
+
+logger = logging.getLogger("mtfwbuilder.update_jobs")
+
+# Finished jobs kept for late progress lookups
+MAX_FINISHED_JOBS = 10
+
+JOBS_DIR = "update_jobs"
+LOCK_FILE = "lock"
+# How often jobs check for a cancel file and other workers' followers for new events
+POLL_SECONDS = 0.5
+_JOB_ID = re.compile(r"^update_[0-9a-f]{12}$")
+
+# Runner signature: (settings, monitor) -> success
+UpdateRunner = Callable[[Settings, UpdateMonitor], bool]
+
+_jobs: dict[str, "UpdateJob"] = {}
+_active_job: "UpdateJob | None" = None
+
+
+class UpdateInProgress(Exception):
+    """Raised when an update is requested while another is still running."""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Firmware update {job_id} is already running")
+        self.job_id = job_id
+
+
+@dataclass
+class UpdateEvent:
+    """Progress event sent to SSE clients."""
+
+    status: str  # running, complete, failed, cancelled
+    phase: str  # download, extract, prewarm, install, verify, activate, done
+    message: str = ""
+    bytes_done: int = 0
+    bytes_total: int = 0
+    error: str = ""
+
+
+@dataclass
+class UpdateJob:
+    """State for one background firmware update."""
+
+    job_id: str
+    description: str
+    monitor: UpdateMonitor = field(default_factory=UpdateMonitor)
+    status: str = "running"
+    events: list[UpdateEvent] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    _changed: asyncio.Event = field(default_factory=asyncio.Event)
+    _task: asyncio.Task | None = None
+    _events_path: Path | None = None
+    _lock: IO | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    def cancel(self) -> bool:
+        """Request cancellation. Returns False if the job already finished."""
+        if self.done:
+            return False
+        self.monitor.cancel_event.set()
+        return True
+
+    def _add_event(self, event: UpdateEvent) -> None:
+        self.events.append(event)
+        self._changed.set()
+        if self._events_path is not None:
+            with open(self._events_path, "a") as f:
+                f.write(json.dumps(asdict(event)) + "\n")
+
+    async def follow(self):
+        """Yield every event so far, then new ones until the job finishes."""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                return
+            self._changed.clear()
+            if index == len(self.events) and not self.done:
+                await self._changed.wait()
+
+
+@dataclass
+class RemoteUpdateJob:
+    """A job running in another worker, followed through its events file."""
+
+    job_id: str
+    jobs_dir: Path
+
+    @property
+    def events_path(self) -> Path:
+        return self.jobs_dir / f"{self.job_id}.jsonl"
+
+    def _read_events(self) -> list[UpdateEvent]:
+        with open(self.events_path) as f:
+            lines = f.read().splitlines()
+        # The last line may still be being written
+        events = []
+        for line in lines:
+            try:
+                events.append(UpdateEvent(**json.loads(line)))
+            except (json.JSONDecodeError, TypeError):
+                break
+        return events
+
+    @property
+    def status(self) -> str:
+        events = self._read_events()
+        if events and events[-1].status != "running":
+            return events[-1].status
+        return "running" if _running_job_id(self.jobs_dir) == self.job_id else "failed"
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    def cancel(self) -> bool:
+        if self.done:
+            return False
+        (self.jobs_dir / f"{self.job_id}.cancel").touch()
+        return True
+
+    async def follow(self):
+        index = 0
+        while True:
+            events = self._read_events()
+            for event in events[index:]:
+                yield event
+            index = len(events)
+            if events and events[-1].status != "running":
+                return
+            if _running_job_id(self.jobs_dir) != self.job_id:
+                yield UpdateEvent(status="failed", phase="done", error="The worker running this update exited.")
+                return
+            await asyncio.sleep(POLL_SECONDS)
+
+
+def get_job(job_id: str, settings: Settings | None = None) -> "UpdateJob | RemoteUpdateJob | None":
+    """Look up a running or recently finished job, started by this worker or (with settings) any other."""
+    job = _jobs.get(job_id)
+    if job is not None or settings is None or not _JOB_ID.match(job_id):
+        return job
+    jobs_dir = _jobs_dir(settings)
+    if not (jobs_dir / f"{job_id}.jsonl").exists():
+        return None
+    return RemoteUpdateJob(job_id=job_id, jobs_dir=jobs_dir)
+
+
+def active_job() -> UpdateJob | None:
+    """The job currently running in this worker, if any."""
+    if _active_job is not None and not _active_job.done:
+        return _active_job
+    return None
+
+
+def start_update_job(
+    settings: Settings,
+    runner: UpdateRunner | None = None,
+    description: str = "Update from GitHub",
+) -> UpdateJob:
+    """Start a firmware update in the background. Raises UpdateInProgress if one is running."""
+    global _active_job
+
+    running = active_job()
+    if running is not None:
+        raise UpdateInProgress(running.job_id)
+
+    job_id = f"update_{uuid.uuid4().hex[:12]}"
+    jobs_dir = _jobs_dir(settings)
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    lock = open(jobs_dir / LOCK_FILE, "a+")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.seek(0)
+        other = lock.read().strip()
+        lock.close()
+        raise UpdateInProgress(other or "in another worker")
+    lock.truncate(0)
+    lock.write(job_id)
+    lock.flush()
+
+    runner = runner or update_firmware
+    job = UpdateJob(job_id=job_id, description=description, _events_path=jobs_dir / f"{job_id}.jsonl", _lock=lock)
+    job._events_path.touch()
+    loop = asyncio.get_running_loop()
+
+    def on_progress(phase: str, message: str, done: int, total: int) -> None:
+        event = UpdateEvent(status="running", phase=phase, message=message, bytes_done=done, bytes_total=total)
+        loop.call_soon_threadsafe(job._add_event, event)
+
+    job.monitor.on_progress = on_progress
+    _active_job = job
+    _jobs[job.job_id] = job
+    _trim_finished_jobs(jobs_dir)
+
+    job._task = asyncio.create_task(_run_job(job, functools.partial(runner, settings, job.monitor)))
+    logger.info(f"Firmware update job {job.job_id} started: {description}")
+    return job
+
+
+def _jobs_dir(settings: Settings) -> Path:
+    return settings.temp_dir / JOBS_DIR
+
+
+def _running_job_id(jobs_dir: Path) -> str | None:
+    """ID of the job holding the update lock in any worker, or None if no update runs."""
+    try:
+        lock = open(jobs_dir / LOCK_FILE)
+    except FileNotFoundError:
+        return None
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return lock.read().strip()
+    return None
+
+
+async def _watch_cancel_file(job: UpdateJob) -> None:
+    """Pass a cancel request made through another worker on to the job."""
+    cancel_path = job._events_path.with_suffix(".cancel")
+    while not job.monitor.cancel_event.is_set():
+        if cancel_path.exists():
+            job.cancel()
+            return
+        await asyncio.sleep(POLL_SECONDS)
+
+
+async def _run_job(job: UpdateJob, run: Callable[[], bool]) -> None:
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.create_task(_watch_cancel_file(job))
+    try:
+        success = await loop.run_in_executor(None, run)
+    except Exception as e:
+        job.monitor.error = str(e)
+        success = False
+    finally:
+        watcher.cancel()
+
+    if success:
+        job.status = "complete"
+        message = job.monitor.result or "Firmware updated successfully."
+        event = UpdateEvent(status="complete", phase="done", message=message)
+    elif job.monitor.cancel_event.is_set():
+        job.status = "cancelled"
+        event = UpdateEvent(status="cancelled", phase="done", message="Firmware update cancelled.")
+    else:
+        job.status = "failed"
+        error = job.monitor.error or "Firmware update failed. Check logs for details."
+        event = UpdateEvent(status="failed", phase="done", error=error)
+
+    job.finished_at = time.time()
+    job._add_event(event)
+    job._events_path.with_suffix(".cancel").unlink(missing_ok=True)
+    job._lock.close()  # lets the next update start, in any worker
+    logger.info(f"Firmware update job {job.job_id} finished: {job.status}")
+
+
+def _trim_finished_jobs(jobs_dir: Path) -> None:
+    finished = sorted((j for j in _jobs.values() if j.done), key=lambda j: j.started_at)
+    for job in finished[: max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+        _jobs.pop(job.job_id, None)
+
+    # Events files of every worker's jobs, oldest first; the newest are the running job's
+    logs = sorted(jobs_dir.glob("update_*.jsonl"), key=lambda p: p.stat().st_mtime)
+    for path in logs[: max(len(logs) - MAX_FINISHED_JOBS - 1, 0)]:
+        path.unlink(missing_ok=True)
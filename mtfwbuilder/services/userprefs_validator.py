@@ -0,0 +1,342 @@
+"""Typed validation of userPrefs before a build is queued.
+
+The firmware's build script turns each USERPREFS_* value into a -D flag:
+byte lists, numbers, true/false and meshtastic_* enum names are passed as
+C expressions, anything else as a string literal. A mistyped value (an
+odd-length hex PSK, an unknown region, "48,85" for a latitude) is therefore
+only caught by the compiler, minutes into `pio run`. PREFS_SCHEMA and
+CHANNEL_PREFS_SCHEMA type every key the generator writes, with the size
+limits of the firmware's protobuf fields, and validate() checks a config
+against them plus a few cross-field rules in well under a millisecond.
+
+Enum names are read from the firmware's generated protobuf header when the
+tree has one, so a firmware that adds a region accepts it; otherwise the
+built-in lists below are used.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services import firmware_store
+from mtfwbuilder.services.jsonc_generator import (
+    CHANNEL_KEY_PREFIX,
+    CHANNEL_SCHEMA,
+    CHANNELS_TO_WRITE_KEY,
+    REGION_PREFIX,
+    SCHEMA,
+)
+
+logger = logging.getLogger("mtfwbuilder.userprefs_validator")
+
+MODEM_PRESET_PREFIX = "meshtastic_Config_LoRaConfig_ModemPreset_"
+GPS_MODE_PREFIX = "meshtastic_Config_PositionConfig_GpsMode_"
+
+# Used when the firmware tree has no generated header to read them from
+DEFAULT_ENUMS: dict[str, frozenset[str]] = {
+    REGION_PREFIX: frozenset(
+        "UNSET US EU_433 EU_868 CN JP ANZ KR TW RU IN NZ_865 TH LORA_24 UA_433 UA_868 MY_433 MY_919 "
+        "SG_923 PH_433 PH_868 PH_915 ANZ_433 KZ_433 KZ_863 NP_865 BR_902".split()
+    ),
+    MODEM_PRESET_PREFIX: frozenset(
+        "LONG_FAST LONG_SLOW VERY_LONG_SLOW MEDIUM_SLOW MEDIUM_FAST SHORT_SLOW SHORT_FAST LONG_MODERATE "
+        "SHORT_TURBO".split()
+    ),
+    GPS_MODE_PREFIX: frozenset("DISABLED ENABLED NOT_PRESENT".split()),
+}
+PROTOBUF_HEADER = Path("src/mesh/generated/meshtastic/config.pb.h")
+
+MAX_CHANNELS = 8
+UINT32_MAX = 2**32 - 1
+INT32_MIN, INT32_MAX = -(2**31), 2**31 - 1
+PSK_LENGTHS = (0, 1, 16, 32)  # none, default key index, AES-128, AES-256
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_INTEGER = re.compile(r"^-?[0-9]+$")
+# What the build script passes through unquoted as a number
+_NUMBER = re.compile(r"^-?([0-9]+\.?[0-9]*|\.[0-9]+)$")
+_BYTE_LIST = re.compile(r"^\{\s*(.*?)\s*,?\s*\}$", re.DOTALL)
+_BYTE = re.compile(r"^0[xX]([0-9a-fA-F]{1,2})$")
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]")
+_CHANNEL_KEY = re.compile(rf"^{CHANNEL_KEY_PREFIX}([0-9]+)_([A-Z_]+)$")
+
+
+@dataclass(frozen=True)
+class FieldError:
+    """One invalid value, by USERPREFS_* key and, when known, the form field it came from."""
+
+    key: str
+    message: str
+    field: str | None = None
+
+    def to_dict(self) -> dict[str, str | None]:
+        return {"key": self.key, "field": self.field, "message": self.message}
+
+
+# A checker returns an error message, or None for a valid value
+Checker = Callable[[str, dict[str, frozenset[str]]], str | None]
+
+
+def _string(max_bytes: int | None = None, min_chars: int = 0) -> Checker:
+    def check(value, enums):
+        if _CONTROL.search(value):
+            return "must not contain control characters"
+        if max_bytes is not None and len(value.encode("utf-8")) > max_bytes:
+            return f"must be at most {max_bytes} bytes"
+        if value and len(value) < min_chars:
+            return f"must be at least {min_chars} characters"
+        return None
+
+    return check
+
+
+def _integer(low: int, high: int) -> Checker:
+    def check(value, enums):
+        if not _INTEGER.match(value):
+            return "must be a whole number"
+        if not low <= int(value) <= high:
+            return f"must be between {low} and {high}"
+        return None
+
+    return check
+
+
+def _number(low: float, high: float) -> Checker:
+    def check(value, enums):
+        if not _NUMBER.match(value):
+            return "must be a plain decimal number, like -12.345"
+        if not low <= float(value) <= high:
+            return f"must be between {low:g} and {high:g}"
+        return None
+
+    return check
+
+
+def _boolean(value, enums):
+    return None if value in ("true", "false") else 'must be "true" or "false"'
+
+
+def _enum(prefix: str) -> Checker:
+    def check(value, enums):
+        allowed = enums.get(prefix) or DEFAULT_ENUMS[prefix]
+        if value.startswith(prefix) and value[len(prefix):] in allowed:
+            return None
+        return f"must be one of {', '.join(sorted(allowed))} (as {prefix}<NAME>)"
+
+    return check
+
+
+def _bytes(*lengths: int) -> Checker:
+    def check(value, enums):
+        items, error = parse_byte_list(value)
+        if error:
+            return error
+        if lengths and len(items) not in lengths:
+            expected = " or ".join(str(n) for n in lengths)
+            return f"must be {expected} bytes, got {len(items)}"
+        return None
+
+    return check
+
+
+def _fixed_pin(value, enums):
+    if not re.fullmatch(r"[0-9]{6}", value) or value.startswith("0"):
+        return "must be a 6-digit PIN not starting with 0"
+    return None
+
+
+# USERPREFS_* key -> checker, for every key in jsonc_generator.SCHEMA.
+# String limits are the firmware's protobuf max_size less the terminating NUL.
+PREFS_SCHEMA: dict[str, Checker] = {
+    CHANNELS_TO_WRITE_KEY: _integer(0, MAX_CHANNELS),
+    "USERPREFS_CONFIG_DEVICE_NAME": _string(),
+    "USERPREFS_CONFIG_OWNER_SHORT_NAME": _string(4),
+    "USERPREFS_CONFIG_OWNER_LONG_NAME": _string(39),
+    "USERPREFS_TZ_STRING": _string(64),
+    "USERPREFS_FIXED_BLUETOOTH": _fixed_pin,
+    "USERPREFS_CONFIG_LORA_REGION": _enum(REGION_PREFIX),
+    "USERPREFS_LORACONFIG_MODEM_PRESET": _enum(MODEM_PRESET_PREFIX),
+    "USERPREFS_LORACONFIG_CHANNEL_NUM": _integer(0, UINT32_MAX),
+    "USERPREFS_CONFIG_LORA_IGNORE_MQTT": _boolean,
+    "USERPREFS_CONFIG_GPS_MODE": _enum(GPS_MODE_PREFIX),
+    "USERPREFS_CONFIG_GPS_UPDATE_INTERVAL": _integer(0, UINT32_MAX),
+    "USERPREFS_CONFIG_POSITION_BROADCAST_INTERVAL": _integer(0, UINT32_MAX),
+    "USERPREFS_CONFIG_POSITION_FIXED_LAT": _number(-90, 90),
+    "USERPREFS_CONFIG_POSITION_FIXED_LON": _number(-180, 180),
+    "USERPREFS_CONFIG_POSITION_FIXED_ALT": _number(INT32_MIN, INT32_MAX),
+    "USERPREFS_CONFIG_POSITION_SMART_ENABLED": _boolean,
+    "USERPREFS_ADMIN_KEY_0": _bytes(0, 32),
+    "USERPREFS_ADMIN_KEY_1": _bytes(0, 32),
+    "USERPREFS_ADMIN_KEY_2": _bytes(0, 32),
+    "USERPREFS_CONFIG_NETWORK_ENABLED_PROTOCOLS": _integer(0, UINT32_MAX),
+    "USERPREFS_CONFIG_WIFI_SSID": _string(32),
+    "USERPREFS_CONFIG_WIFI_PSK": _string(64, min_chars=8),
+    "USERPREFS_CONFIG_MQTT_SERVER": _string(63),
+    "USERPREFS_CONFIG_MQTT_ROOT_TOPIC": _string(31),
+    "USERPREFS_CONFIG_MQTT_USERNAME": _string(63),
+    "USERPREFS_CONFIG_MQTT_PASSWORD": _string(63),
+    "USERPREFS_CONFIG_MQTT_ENCRYPTION_ENABLED": _boolean,
+    "USERPREFS_CONFIG_MQTT_TLS_ENABLED": _boolean,
+    "USERPREFS_CONFIG_OEM_TEXT": _string(),
+    "USERPREFS_CONFIG_OEM_FONT_SIZE": _integer(0, 255),
+    "USERPREFS_CONFIG_OEM_IMAGE_WIDTH": _integer(1, 1024),
+    "USERPREFS_CONFIG_OEM_IMAGE_HEIGHT": _integer(1, 1024),
+    "USERPREFS_CONFIG_OEM_IMAGE_DATA": _bytes(),
+}
+
+# Per-channel key suffix (USERPREFS_CHANNEL_<n>_<suffix>) -> checker
+CHANNEL_PREFS_SCHEMA: dict[str, Checker] = {
+    "NAME": _string(11),
+    "PRECISION": _integer(0, 32),
+    "PSK": _bytes(*PSK_LENGTHS),
+    "UPLINK_ENABLED": _boolean,
+    "DOWNLINK_ENABLED": _boolean,
+}
+
+# USERPREFS_* key -> the form field that produces it, for pointing errors at inputs
+_FORM_FIELDS: dict[str, str] = {f.key: f.name for f in SCHEMA}
+_FORM_FIELDS[CHANNELS_TO_WRITE_KEY] = "channels_to_write"
+_CHANNEL_FORM_FIELDS: dict[str, str] = {f.key: f.name for f in CHANNEL_SCHEMA}
+
+
+def parse_byte_list(value: str) -> tuple[list[int], str | None]:
+    """Bytes of a `{ 0x.., 0x.. }` C initializer, or an error message."""
+    match = _BYTE_LIST.match(value.strip())
+    if not match:
+        return [], "must be a byte list like { 0x01, 0x02 }"
+    body = match.group(1)
+    if not body:
+        return [], None
+    tokens = [token.strip() for token in body.split(",")]
+    digits = []
+    for token in tokens:
+        byte = _BYTE.match(token)
+        if not byte:
+            return [], f"{token!r} is not a byte like 0x1f"
+        digits.append(byte.group(1))
+    if len(digits) > 1 and any(len(d) == 1 for d in digits):
+        return [], "every byte must have two hex digits (was the key an odd number of hex characters?)"
+    return [int(d, 16) for d in digits], None
+
+
+def validate(prefs: dict[str, str], enums: dict[str, frozenset[str]] | None = None) -> list[FieldError]:
+    """All errors in a parsed userPrefs config (see config_canonical.parse_prefs)."""
+    enums = enums or {}
+    errors: list[FieldError] = []
+    channel_indexes: set[int] = set()
+
+    for key, value in prefs.items():
+        if not _IDENTIFIER.match(key):
+            errors.append(FieldError(key, "is not a valid preference name"))
+            continue
+        check = PREFS_SCHEMA.get(key)
+        field = _FORM_FIELDS.get(key)
+        if check is None:
+            channel = _CHANNEL_KEY.match(key)
+            if not channel:
+                continue  # a preference this builder doesn't know; the firmware may
+            index, suffix = int(channel.group(1)), channel.group(2)
+            check = CHANNEL_PREFS_SCHEMA.get(suffix)
+            if check is None:
+                continue
+            channel_indexes.add(index)
+            form_name = _CHANNEL_FORM_FIELDS.get(suffix)
+            field = f"channel_{index}[{form_name}]" if form_name else None
+        message = check(value, enums)
+        if message:
+            errors.append(FieldError(key, message, field))
+
+    errors.extend(_check_channel_count(prefs, channel_indexes))
+    errors.extend(_check_fixed_position(prefs))
+    errors.extend(_check_oem_image(prefs))
+    return errors
+
+
+def _check_channel_count(prefs: dict[str, str], indexes: set[int]) -> list[FieldError]:
+    count_value = prefs.get(CHANNELS_TO_WRITE_KEY)
+    if count_value is None:
+        if indexes:
+            return [FieldError(CHANNELS_TO_WRITE_KEY, "is required when channel settings are present")]
+        return []
+    if not _INTEGER.match(count_value):
+        return []  # reported by the schema check
+    count = int(count_value)
+    field = "channels_to_write"
+    errors = []
+    extra = sorted(i for i in indexes if i >= count)
+    if extra:
+        errors.append(FieldError(CHANNELS_TO_WRITE_KEY, f"is {count} but there are settings for channel {extra[0]}", field))
+    # Channel 0 without settings is the firmware's default primary; a secondary one is a mistake
+    missing = [i for i in range(1, min(count, MAX_CHANNELS)) if i not in indexes]
+    if missing:
+        errors.append(FieldError(CHANNELS_TO_WRITE_KEY, f"is {count} but channel {missing[0]} has no settings", field))
+    return errors
+
+
+def _check_fixed_position(prefs: dict[str, str]) -> list[FieldError]:
+    lat = "USERPREFS_CONFIG_POSITION_FIXED_LAT"
+    lon = "USERPREFS_CONFIG_POSITION_FIXED_LON"
+    if (lat in prefs) != (lon in prefs):
+        missing = lon if lat in prefs else lat
+        return [FieldError(missing, "is required with a fixed position", _FORM_FIELDS[missing])]
+    return []
+
+
+def _check_oem_image(prefs: dict[str, str]) -> list[FieldError]:
+    data_key = "USERPREFS_CONFIG_OEM_IMAGE_DATA"
+    width, height = prefs.get("USERPREFS_CONFIG_OEM_IMAGE_WIDTH"), prefs.get("USERPREFS_CONFIG_OEM_IMAGE_HEIGHT")
+    if data_key not in prefs:
+        return []
+    field = _FORM_FIELDS[data_key]
+    if width is None or height is None:
+        return [FieldError(data_key, "needs USERPREFS_CONFIG_OEM_IMAGE_WIDTH and _HEIGHT", field)]
+    items, error = parse_byte_list(prefs[data_key])
+    if error or not (_INTEGER.match(width) and _INTEGER.match(height)):
+        return []  # reported by the schema check
+    expected = math.ceil(int(width) / 8) * int(height)  # XBM rows are padded to whole bytes
+    if len(items) != expected:
+        return [FieldError(data_key, f"has {len(items)} bytes, a {width}x{height} XBM image needs {expected}", field)]
+    return []
+
+
+_enum_cache: dict[tuple[str, int], dict[str, frozenset[str]]] = {}
+_enum_cache_lock = threading.Lock()
+
+
+def firmware_enums(settings: Settings, version: str | None = None) -> dict[str, frozenset[str]]:
+    """Enum names the firmware version defines, from its generated protobuf header.
+
+    Returns {} when the header is missing (validate() then uses DEFAULT_ENUMS).
+    Raises KeyError for an explicitly requested version that is not installed.
+    """
+    _, tree = firmware_store.resolve(settings, version)
+    header = tree / PROTOBUF_HEADER
+    try:
+        key = (os.path.realpath(header), header.stat().st_mtime_ns)
+    except OSError:
+        return {}
+
+    with _enum_cache_lock:
+        enums = _enum_cache.get(key)
+    if enums is None:
+        enums = parse_enums(header.read_text(encoding="utf-8", errors="replace"))
+        logger.info(f"Read {sum(len(v) for v in enums.values())} enum names from {header}")
+        with _enum_cache_lock:
+            _enum_cache[key] = enums
+    return enums
+
+
+def parse_enums(header: str) -> dict[str, frozenset[str]]:
+    """Members of the validated enums from a nanopb header (`prefix_NAME = n,` lines)."""
+    enums = {}
+    for prefix in DEFAULT_ENUMS:
+        names = re.findall(rf"(?<![A-Za-z0-9_]){re.escape(prefix)}([A-Za-z0-9_]+)\s*=", header)
+        if names:
+            enums[prefix] = frozenset(names)
+    return enums
@@ -0,0 +1,186 @@
+"""Fingerprinted, precompressed static assets.
+
+At startup (or ahead of time with `python -m mtfwbuilder.static_assets`)
+every file under static/ is content-hashed and written to a build directory
+as `<name>.<hash><ext>` plus .gz and, when the optional brotli package is
+installed, .br variants. Templates link to those names with static_url(), and
+PrecompressedStaticFiles serves them with the best encoding the client
+accepts and a one-year immutable cache lifetime — a changed file gets a new
+URL. Unfingerprinted paths are still served from static/ as before.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from mtfwbuilder.http_cache import etag_matches
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger("mtfwbuilder.static_assets")
+
+STATIC_PREFIX = "/static/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+HASH_LENGTH = 12
+
+# Only text-like assets are worth compressing; images and fonts already are
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html", ".xml"}
+# Preference among encodings the client accepts equally
+ENCODING_PREFERENCE = ("br", "gzip")
+_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+@dataclass
+class Asset:
+    """One static file and its built variants."""
+
+    path: str  # logical path under static/, e.g. js/main.js
+    url_path: str  # fingerprinted path, e.g. js/main.3f2a9c1d0b7e.js
+    etag: str
+    media_type: str
+    files: dict[str, Path] = field(default_factory=dict)  # encoding ("identity", "gzip", "br") -> file
+
+
+class StaticAssets:
+    """Manifest of built assets, shared by static_url() and the static mount."""
+
+    def __init__(self, static_dir: Path):
+        self.static_dir = Path(static_dir)
+        self.version = ""  # changes whenever the manifest is rebuilt with different content
+        self._by_path: dict[str, Asset] = {}
+        self._by_url: dict[str, Asset] = {}
+
+    def build(self, out_dir: Path) -> int:
+        """Fingerprint and compress every static file into out_dir. Returns the asset count.
+
+        Output is content-addressed, so files already built by an earlier
+        run (or at image build time) are reused rather than rewritten.
+        """
+        out_dir = Path(out_dir)
+        by_path: dict[str, Asset] = {}
+        for source in sorted(p for p in self.static_dir.rglob("*") if p.is_file()):
+            relative = source.relative_to(self.static_dir).as_posix()
+            if any(part.startswith(".") for part in relative.split("/")):
+                continue
+            by_path[relative] = _build_asset(source, relative, out_dir)
+
+        self._by_path = by_path
+        self._by_url = {asset.url_path: asset for asset in by_path.values()}
+        self.version = hashlib.sha256("".join(a.url_path for a in by_path.values()).encode()).hexdigest()[:12]
+        return len(by_path)
+
+    def url(self, path: str) -> str:
+        """URL for a static file: fingerprinted once built, the plain path before."""
+        asset = self._by_path.get(path.lstrip("/"))
+        return STATIC_PREFIX + (asset.url_path if asset else path.lstrip("/"))
+
+    def lookup(self, url_path: str) -> Asset | None:
+        return self._by_url.get(url_path)
+
+
+def _build_asset(source: Path, relative: str, out_dir: Path) -> Asset:
+    data = source.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    stem, dot, ext = relative.rpartition(".")
+    url_path = f"{stem}.{digest[:HASH_LENGTH]}.{ext}" if dot and "/" not in ext else f"{relative}.{digest[:HASH_LENGTH]}"
+    media_type = mimetypes.guess_type(relative)[0] or "application/octet-stream"
+    asset = Asset(path=relative, url_path=url_path, etag=f'"{digest[:20]}"', media_type=media_type)
+
+    target = out_dir / url_path
+    _write_once(target, lambda: data)
+    asset.files["identity"] = target
+
+    if source.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+        variants = {"gzip": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = lambda: brotli.compress(data, quality=11)
+        for encoding, compress in variants.items():
+            path = target.with_name(target.name + _ENCODING_SUFFIXES[encoding])
+            if not path.exists():
+                compressed = compress()
+                if len(compressed) >= len(data):
+                    continue  # not worth serving
+                _write_once(path, lambda: compressed)
+            asset.files[encoding] = path
+    return asset
+
+
+def _write_once(path: Path, content) -> None:
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(content())
+    os.replace(tmp, path)
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """Best encoding from available for an Accept-Encoding header ("identity" if none)."""
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in ENCODING_PREFERENCE:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if encoding in available and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves fingerprinted assets precompressed and immutable."""
+
+    def __init__(self, *, assets: StaticAssets, **kwargs):
+        super().__init__(**kwargs)
+        self.assets = assets
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self.assets.lookup(path) if scope["method"] in ("GET", "HEAD") else None
+        if asset is None:
+            return await super().get_response(path, scope)
+
+        request = Request(scope)
+        headers = {"ETag": asset.etag, "Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding"}
+        if etag_matches(request, asset.etag):
+            return Response(status_code=304, headers=headers)
+
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), asset.files)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return FileResponse(asset.files[encoding], media_type=asset.media_type, headers=headers)
+
+
+def main() -> None:
+    """Prebuild assets, e.g. at image build time: python -m mtfwbuilder.static_assets [OUT_DIR]"""
+    from mtfwbuilder.config import Settings
+
+    settings = Settings()
+    out_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else settings.static_build_dir
+    count = StaticAssets(settings.base_dir / "static").build(out_dir)
+    print(f"Built {count} static assets into {out_dir}{'' if brotli else ' (gzip only; brotli not installed)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+/*
+ * Client-side userPrefs.jsonc preview.
+ *
+ * Renders exactly the text generate_jsonc() in
+ * mtfwbuilder/services/jsonc_generator.py would, from the field mapping served
+ * at /api/v1/generator-schema, so previews need no server round-trip.
+ * Inputs it can't reproduce byte for byte (non-string values, channel counts
+ * only Python's int() understands) make render() return null; callers then
+ * ask the server. tests/test_jsonc_preview_js.py checks parity on randomized
+ * inputs.
+ */
+(function (root) {
+    'use strict';
+
+    // Characters Python's str.isspace() accepts (what str.strip() and int() trim)
+    const PY_WHITESPACE = new Set([
+        0x09, 0x0a, 0x0b, 0x0c, 0x0d, 0x1c, 0x1d, 0x1e, 0x1f, 0x20, 0x85, 0xa0, 0x1680,
+        0x2000, 0x2001, 0x2002, 0x2003, 0x2004, 0x2005, 0x2006, 0x2007, 0x2008, 0x2009, 0x200a,
+        0x2028, 0x2029, 0x202f, 0x205f, 0x3000,
+    ]);
+    const SHORT_ESCAPES = { '"': '\\"', '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b', '\f': '\\f' };
+    // Larger channel counts/indexes could lose precision as JS numbers
+    const MAX_DIGITS = 15;
+
+    let schemaPromise = null;
+
+    function pyStrip(s) {
+        let start = 0;
+        let end = s.length;
+        while (start < end && PY_WHITESPACE.has(s.charCodeAt(start))) start++;
+        while (end > start && PY_WHITESPACE.has(s.charCodeAt(end - 1))) end--;
+        return s.slice(start, end);
+    }
+
+    // json.dumps(s) with Python's default ensure_ascii=True
+    function dumpString(s) {
+        let out = '"';
+        for (let i = 0; i < s.length; i++) {
+            const ch = s[i];
+            const code = s.charCodeAt(i);
+            if (SHORT_ESCAPES[ch] !== undefined) {
+                out += SHORT_ESCAPES[ch];
+            } else if (code >= 0x20 && code <= 0x7e) {
+                out += ch;
+            } else {
+                out += '\\u' + code.toString(16).padStart(4, '0');
+            }
+        }
+        return out + '"';
+    }
+
+    // int(value) for the cases JS can mirror exactly; null otherwise
+    function parseCount(value) {
+        const text = pyStrip(value);
+        if (!/^[+-]?[0-9]+$/.test(text) || text.replace(/^[+-]/, '').length > MAX_DIGITS) return null;
+        return parseInt(text, 10);
+    }
+
+    // Split `channel_<n>[<prop>]` into [n, prop]; null if malformed
+    function parseChannelField(name) {
+        const rest = name.slice('channel_'.length);
+        const bracket = rest.indexOf('[');
+        if (bracket === -1) return null;
+        const number = rest.slice(0, bracket);
+        if (!/^(0|[1-9][0-9]*)$/.test(number) || number.length > MAX_DIGITS) return null;
+        const tail = rest.slice(bracket + 1);
+        const close = tail.indexOf(']');
+        return [parseInt(number, 10), close === -1 ? tail.slice(0, -1) : tail.slice(0, close)];
+    }
+
+    // The value generate_jsonc writes for a field, or undefined to omit it
+    function emitValue(kind, value, regionPrefix) {
+        switch (kind) {
+            case 'value':
+                return value ? value : undefined;
+            case 'present':
+                return value;
+            case 'bool':
+                return value === 'true' ? 'true' : 'false';
+            case 'region':
+                if (!value) return undefined;
+                return value.startsWith(regionPrefix) ? value : regionPrefix + value;
+            case 'psk': {
+                const psk = pyStrip(value);
+                if (psk.startsWith('{') && psk.endsWith('}')) return psk;
+                if (!psk) return undefined;
+                const chars = Array.from(psk); // Python slices by code point
+                const bytes = [];
+                for (let i = 0; i < chars.length; i += 2) {
+                    bytes.push('0x' + chars.slice(i, i + 2).join(''));
+                }
+                return '{ ' + bytes.join(', ') + ' }';
+            }
+            default:
+                throw new Error('Unknown field kind: ' + kind);
+        }
+    }
+
+    function compile(schema) {
+        if (!schema._compiled) {
+            schema._compiled = {
+                slots: new Map(schema.fields.map((field, i) => [field.name, i])),
+                channelSlots: new Map(schema.channel_fields.map((field, i) => [field.name, i])),
+                channelsBefore: schema.fields.findIndex(field => field.name === schema.channels_before),
+            };
+        }
+        return schema._compiled;
+    }
+
+    /**
+     * userPrefs.jsonc text for form data, identical to generate_jsonc(data),
+     * or null when only the server can produce it.
+     */
+    function render(schema, data) {
+        if (data === null || typeof data !== 'object' || Array.isArray(data)) return null;
+        const { slots, channelSlots, channelsBefore } = compile(schema);
+
+        const channelsToWrite = Object.prototype.hasOwnProperty.call(data, 'channels_to_write')
+            ? data.channels_to_write
+            : '1';
+        if (typeof channelsToWrite !== 'string') return null;
+        const channelCount = parseCount(channelsToWrite);
+        if (channelCount === null) return null;
+
+        const values = new Array(schema.fields.length);
+        const channels = new Map();
+        for (const name of Object.keys(data)) {
+            const value = data[name];
+            const slot = slots.get(name);
+            if (slot !== undefined) {
+                if (typeof value !== 'string') return null;
+                values[slot] = value;
+                continue;
+            }
+            if (name.startsWith('channel_') && name.endsWith(']')) {
+                const parsed = parseChannelField(name);
+                if (parsed === null || parsed[0] >= channelCount) continue;
+                const channelSlot = channelSlots.get(parsed[1]);
+                if (channelSlot === undefined) continue;
+                if (typeof value !== 'string') return null;
+                if (!channels.has(parsed[0])) channels.set(parsed[0], new Array(schema.channel_fields.length));
+                channels.get(parsed[0])[channelSlot] = value;
+            }
+        }
+
+        const output = [[schema.channels_to_write_key, channelsToWrite]];
+        const emit = (key, kind, value) => {
+            if (value === undefined) return;
+            const text = emitValue(kind, value, schema.region_prefix);
+            if (text !== undefined) output.push([key, text]);
+        };
+        schema.fields.forEach((field, slot) => {
+            if (slot === channelsBefore) {
+                for (const index of Array.from(channels.keys()).sort((a, b) => a - b)) {
+                    const channel = channels.get(index);
+                    schema.channel_fields.forEach((channelField, i) => {
+                        emit(schema.channel_key_prefix + index + '_' + channelField.key, channelField.kind, channel[i]);
+                    });
+                }
+            }
+            const value = values[slot];
+            if (value === undefined) return;
+            if (field.requires.some(gate => data[gate] !== 'true')) return;
+            emit(field.key, field.kind, value);
+        });
+
+        return '{\n' + output.map(([key, value]) => '  ' + dumpString(key) + ': ' + dumpString(value)).join(',\n') + '\n}';
+    }
+
+    // The schema, fetched once per page (revalidated by the browser via its ETag)
+    function loadSchema() {
+        if (schemaPromise === null) {
+            schemaPromise = fetch('/api/v1/generator-schema')
+                .then(response => (response.ok ? response.json() : null))
+                .catch(() => null);
+        }
+        return schemaPromise;
+    }
+
+    const api = { render: render, loadSchema: loadSchema };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.JsoncPreview = api;
+    }
+})(typeof window !== 'undefined' ? window : this);
@@ -1,3 +1,63 @@
+// Previews are rendered in the browser from the generator schema
+// (jsonc-preview.js). Only inputs the renderer can't reproduce exactly go to
+// the server, which sends an ETag per preview: a repeat of the last request
+// is answered from here outright, and older entries are revalidated with
+// If-None-Match (304 = unchanged).
+const previewCache = new Map();
+const PREVIEW_CACHE_SIZE = 20;
+let lastPreviewBody = null;
+
+function fetchPreview(formData) {
+    const body = typeof formData === 'string' ? formData : JSON.stringify(formData);
+    return JsoncPreview.loadSchema().then(schema => {
+        if (schema) {
+            let content = null;
+            try {
+                content = JsoncPreview.render(schema, JSON.parse(body));
+            } catch (error) {
+                console.error('Local preview failed, asking the server:', error);
+            }
+            if (content !== null) {
+                return { success: true, content: content };
+            }
+        }
+        return fetchServerPreview(body);
+    });
+}
+
+function fetchServerPreview(body) {
+    const cached = previewCache.get(body);
+    if (cached && body === lastPreviewBody) {
+        return Promise.resolve(cached.data);
+    }
+
+    const headers = { 'Content-Type': 'application/json' };
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+    return fetch('/api/v1/preview', { method: 'POST', headers: headers, body: body })
+        .then(response => {
+            if (response.status === 304 && cached) {
+                return cached.data;
+            }
+            const etag = response.headers.get('ETag');
+            return response.json().then(data => {
+                if (data.success && etag) {
+                    previewCache.delete(body);
+                    previewCache.set(body, { etag: etag, data: data });
+                    if (previewCache.size > PREVIEW_CACHE_SIZE) {
+                        previewCache.delete(previewCache.keys().next().value);
+                    }
+                }
+                return data;
+            });
+        })
+        .then(data => {
+            lastPreviewBody = data.success ? body : null;
+            return data;
+        });
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     // Dark mode toggle
     const darkModeToggle = document.getElementById('darkModeToggle');
@@ -119,14 +179,7 @@ document.addEventListener('DOMContentLoaded', function() {
             
             loader.style.display = 'block';
             
-            fetch('/preview', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(formData)
-            })
-            .then(response => response.json())
+            fetchPreview(formData)
             .then(data => {
                 loader.style.display = 'none';
                 
@@ -1,5 +1,6 @@
 """Shared test fixtures."""
 
+import asyncio
 import os
 import tempfile
 from pathlib import Path
@@ -7,6 +8,22 @@ from pathlib import Path
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def isolated_rate_limits(tmp_path, monkeypatch):
+    """Fresh token buckets per test, so tests don't spend each other's quotas."""
+    monkeypatch.setenv("MTFW_RATE_LIMIT_PATH", str(tmp_path / "rate_limits.db"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_database(tmp_path, monkeypatch):
+    """A fresh database per test: build records and cached failures are stored there."""
+    from mtfwbuilder.config import Settings
+    from mtfwbuilder.database import init_db
+
+    monkeypatch.setenv("MTFW_DATABASE_PATH", str(tmp_path / "mtfwbuilder.db"))
+    asyncio.run(init_db(Settings()))
+
+
 @pytest.fixture
 def variants_path():
     """Path to the real variants.yaml file."""
@@ -18,6 +18,7 @@ from mtfwbuilder.services.build_service import (
     _scrub_firmware_tree,
 )
 from mtfwbuilder.services.cleanup_service import cleanup_old_builds, cleanup_build_directory
+from mtfwbuilder.services.failure_cache import CachedFailure, is_deterministic
 from mtfwbuilder.services.device_registry import DeviceRegistry, DeviceVariant
 
 
@@ -28,13 +29,33 @@ class TestBuildId:
         bid = generate_build_id()
         assert bid.startswith("build_")
         parts = bid.split("_")
-        assert len(parts) == 4  # build, timestamp, pid, counter
-        assert parts[1].isdigit()
+        assert len(parts) == 4  # build, seconds, microseconds, random
+        assert parts[1].isdigit() and parts[2].isdigit()
 
     def test_build_ids_unique(self):
         ids = {generate_build_id() for _ in range(10)}
         assert len(ids) == 10
 
+    def test_build_ids_sort_by_time(self):
+        with patch("mtfwbuilder.services.build_service.time.time_ns", side_effect=[1_700_000_000_000_999_000, 1_700_000_001_000_001_000]):
+            first, second = generate_build_id(), generate_build_id()
+        assert first.startswith("build_1700000000_999999_") or first.startswith("build_1700000000_000999_")
+        assert sorted([second, first]) == [first, second]
+
+
+class TestPredictedDuration:
+    def test_moving_average_per_variant(self, temp_dir, monkeypatch):
+        from mtfwbuilder.config import Settings
+        from mtfwbuilder.services import build_service
+
+        monkeypatch.setattr(build_service, "_build_durations", {})
+        settings = Settings(temp_dir=temp_dir, build_estimate_seconds=300)
+        assert build_service.predicted_duration("tbeam", settings) == 300
+        build_service._record_duration("tbeam", 100)
+        build_service._record_duration("tbeam", 200)
+        assert build_service.predicted_duration("tbeam", settings) == pytest.approx(130)
+        assert build_service.predicted_duration("rak4631", settings) == 300
+
 
 class TestProgressParsing:
     """Tests for PlatformIO stdout line parsing."""
@@ -108,6 +129,17 @@ class TestBuildContext:
         )
         assert ctx.build_log == []
 
+    def test_cache_key_identifies_output(self, temp_dir):
+        from mtfwbuilder.config import Settings
+
+        settings = Settings(temp_dir=temp_dir)
+        variant = DeviceVariant(id="tbeam", name="T-Beam", manufacturer="LILYGO", architecture="esp32")
+        make = lambda build_id, digest: BuildContext(  # noqa: E731
+            build_id=build_id, variant=variant, config_content="{}", settings=settings, config_hash=digest
+        )
+        assert make("build_1_1", "abc").cache_key == make("build_2_2", "abc").cache_key
+        assert make("build_1_1", "abc").cache_key != make("build_1_1", "def").cache_key
+
 
 class TestScrubFirmwareTree:
     """Tests for sensitive file cleanup."""
@@ -187,6 +219,61 @@ class TestCleanupService:
         assert recent.exists()
 
 
+class TestFailureCache:
+    """Tests for the negative cache of deterministic build failures."""
+
+    COMPILE_ERROR = ["Compiling .pio/build/tbeam/src/main.cpp.o", "src/main.cpp:12:5: error: 'foo' was not declared"]
+
+    def test_compile_error_is_deterministic(self):
+        assert is_deterministic(1, self.COMPILE_ERROR)
+        assert is_deterministic(1, ["firmware.elf section `.text' will not fit in region `FLASH'"])
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            "xtensa-esp32-elf-g++: fatal error: Killed signal terminated program cc1plus",
+            "virtual memory exhausted: Cannot allocate memory",
+            "OSError: [Errno 28] No space left on device",
+            "HTTPClientError: could not resolve host",
+        ],
+    )
+    def test_environmental_failures_not_cached(self, line):
+        assert not is_deterministic(1, [*self.COMPILE_ERROR, line])
+
+    def test_signal_or_unexplained_exit_not_cached(self):
+        assert not is_deterministic(-9, self.COMPILE_ERROR)
+        assert not is_deterministic(1, ["*** [.pio/build/tbeam/firmware.elf] Error 1"])
+
+    @pytest.mark.asyncio
+    async def test_served_from_build_records_until_expired(self, temp_dir):
+        from mtfwbuilder import database
+        from mtfwbuilder.config import Settings
+
+        settings = Settings(temp_dir=temp_dir)
+        db = await database.get_db(settings)
+        try:
+            await database.record_build(db, "build_1", "tbeam", "esp32", "bin", cache_key="k")
+            log = "\n".join(str(i) for i in range(80))
+            await database.update_build_status(db, "build_1", "failed", build_log=log, error_message="error: foo", deterministic=True)
+            await database.record_build(db, "build_2", "tbeam", "esp32", "bin", cache_key="k2")
+            await database.update_build_status(db, "build_2", "failed", error_message="Killed")
+
+            failure = CachedFailure.from_row(await database.get_cached_failure(db, "k", ttl=60), ttl=60)
+            assert (failure.error, failure.build_id, failure.log_tail[0]) == ("error: foo", "build_1", "30")
+            assert 0 < failure.to_dict()["retry_after"] <= 61
+            assert await database.get_cached_failure(db, "k2", ttl=60) is None  # not deterministic
+            assert await database.get_cached_failure(db, "k", ttl=0) is None  # caching disabled
+            assert await database.failure_stats(db, ttl=60) == {"entries": 1, "hits": 1}
+
+            await db.execute("UPDATE builds SET completed_at = datetime('now', '-61 seconds')")
+            assert await database.get_cached_failure(db, "k", ttl=60) is None
+            assert await database.get_cached_failure(db, "k", ttl=120) is not None
+            assert await database.forget_failures(db) == 1
+            assert await database.get_cached_failure(db, "k", ttl=120) is None
+        finally:
+            await db.close()
+
+
 class TestFirmwareRoutes:
     """Tests for firmware builder API routes."""
 
@@ -256,3 +343,179 @@ class TestFirmwareRoutes:
         data = resp.json()
         assert data["success"] is True
         assert "version" in data
+
+    @pytest.mark.asyncio
+    async def test_build_unknown_firmware_version(self, client):
+        config = json.dumps({"device_name": "TestNode"})
+        resp = await client.post(
+            "/api/v1/build-firmware",
+            data={"variant": "tbeam", "config_source": "current", "config_json": config, "firmware_version": "v0.0.0"},
+        )
+        assert resp.status_code == 400
+        assert "not installed" in resp.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_firmware_versions(self, client):
+        resp = await client.get("/api/v1/firmware-versions")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["success"] is True
+        assert isinstance(data["versions"], list)
+
+    @pytest.mark.asyncio
+    async def test_cached_failure_answered_without_building(self, client):
+        from mtfwbuilder import database
+        from mtfwbuilder.auth import SESSION_COOKIE, create_session_token
+        from mtfwbuilder.services import firmware_store
+        from mtfwbuilder.services.build_service import cache_key
+        from mtfwbuilder.services.config_canonical import canonicalize
+        from mtfwbuilder.services.jsonc_generator import generate_jsonc
+
+        app = client._transport.app
+        settings = app.state.settings
+        config = {"device_name": "TestNode"}
+        version, _ = firmware_store.resolve(settings, None)
+        key = cache_key(version, "tbeam", canonicalize(generate_jsonc(config)).digest)
+        db = await database.get_db(settings)
+        await database.record_build(db, "build_0", "tbeam", "esp32", "bin", cache_key=key)
+        await database.update_build_status(
+            db, "build_0", "failed", build_log="line\nerror: boom", error_message="main.cpp:1:1: error: boom", deterministic=True
+        )
+        form = {"variant": "tbeam", "config_source": "current", "config_json": json.dumps(config)}
+
+        resp = await client.post("/api/v1/build-firmware", data=form)
+        assert resp.status_code == 422
+        detail = resp.json()["detail"]
+        assert detail["cached"] is True
+        assert detail["error"] == "main.cpp:1:1: error: boom"
+        assert detail["log"] == "line\nerror: boom"
+        assert 0 < int(resp.headers["Retry-After"]) <= 601
+        assert app.state.active_builds == {}
+
+        resp = await client.post("/api/v1/build-firmware", data={**form, "force_rebuild": "1"})
+        assert resp.status_code == 403
+
+        client.cookies.set(SESSION_COOKIE, create_session_token(settings))
+        resp = await client.post("/api/v1/build-firmware", data={**form, "force_rebuild": "1"})
+        assert resp.status_code == 200
+        assert await database.get_cached_failure(db, key, ttl=600) is None
+        await db.close()
+
+    @pytest.mark.asyncio
+    async def test_deterministic_failure_recorded(self, client):
+        from mtfwbuilder import database
+        from mtfwbuilder.services import build_service
+
+        app = client._transport.app
+        form = {"variant": "tbeam", "config_source": "current", "config_json": '{"device_name": "Fail"}'}
+        build_id = (await client.post("/api/v1/build-firmware", data=form)).json()["build_id"]
+        ctx = app.state.active_builds[build_id]
+
+        async def failing_build(ctx):
+            ctx.build_log.append("src/main.cpp:1:1: error: boom")
+            ctx.deterministic_failure = True
+            yield BuildProgress(status="failed", error="src/main.cpp:1:1: error: boom")
+
+        with patch.object(build_service, "build_firmware", failing_build):
+            resp = await client.get(f"/api/v1/build-progress/{build_id}")
+        assert "error: boom" in resp.text
+        db = await database.get_db(app.state.settings)
+        try:
+            assert (await database.get_cached_failure(db, ctx.cache_key, ttl=60))["id"] == build_id
+        finally:
+            await db.close()
+        shutil.rmtree(ctx.build_dir, ignore_errors=True)
+
+
+class TestMultipleWorkers:
+    """Two apps sharing settings stand in for two uvicorn workers."""
+
+    @pytest.fixture
+    async def workers(self, temp_dir):
+        from mtfwbuilder.config import Settings
+        from mtfwbuilder.services.build_service import init_build_system
+        from mtfwbuilder.services.device_registry import DeviceRegistry
+
+        settings = Settings(temp_dir=temp_dir, max_queue_size=2)
+        clients = []
+        for _ in range(2):
+            app = create_app()
+            app.state.settings = settings
+            app.state.device_registry = DeviceRegistry(settings.devices_file)
+            app.state.active_builds = {}
+            init_build_system(settings)
+            clients.append(AsyncClient(transport=ASGITransport(app=app), base_url="http://test"))
+        yield clients
+        for c in clients:
+            await c.aclose()
+
+    FORM = {"variant": "tbeam", "config_source": "current", "config_json": '{"device_name": "W"}'}
+
+    @staticmethod
+    async def _quick_build(ctx):
+        ctx.build_log.append("[SUCCESS]")
+        yield BuildProgress(status="complete", message="Build complete!", download_url=f"/dl/{ctx.build_id}")
+
+    @pytest.mark.asyncio
+    async def test_build_runs_and_replays_on_any_worker(self, workers):
+        from mtfwbuilder.services import build_service
+
+        first, second = workers
+        build_id = (await first.post("/api/v1/build-firmware", data=self.FORM)).json()["build_id"]
+
+        with patch.object(build_service, "build_firmware", self._quick_build) as _:
+            resp = await second.get(f"/api/v1/build-progress/{build_id}")
+        assert resp.status_code == 200
+        assert '"status":"complete"' in resp.text
+
+        # Claimed: the queuing worker doesn't run it again, it replays the outcome
+        resp = await first.get(f"/api/v1/build-progress/{build_id}")
+        assert resp.status_code == 200
+        assert '"status":"complete"' in resp.text
+        assert f"/api/v1/download-firmware/{build_id}?variant=tbeam" in resp.text
+        assert "[SUCCESS]" in resp.text
+
+        assert (await second.get("/api/v1/build-progress/build_0_000000_nope")).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_running_build_not_started_twice(self, workers):
+        from mtfwbuilder import database
+
+        first, second = workers
+        build_id = (await first.post("/api/v1/build-firmware", data=self.FORM)).json()["build_id"]
+        db = await database.get_db(first._transport.app.state.settings)
+        try:
+            assert await database.claim_build(db, build_id)
+        finally:
+            await db.close()
+        assert (await second.get(f"/api/v1/build-progress/{build_id}")).status_code == 409
+
+    @pytest.mark.asyncio
+    async def test_queue_limit_is_global(self, workers):
+        first, second = workers
+        assert (await first.post("/api/v1/build-firmware", data=self.FORM)).status_code == 200
+        assert (await second.post("/api/v1/build-firmware", data=self.FORM)).status_code == 200
+        resp = await first.post("/api/v1/build-firmware", data=self.FORM)
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"]
+
+    @pytest.mark.asyncio
+    async def test_build_slot_shared(self, temp_dir):
+        """A build waits for the slot while another process holds build.lock."""
+        import fcntl
+
+        from mtfwbuilder.config import Settings
+        from mtfwbuilder.services import build_service
+
+        settings = Settings(temp_dir=temp_dir)
+        build_service.init_build_system(settings)
+        variant = DeviceVariant(id="tbeam", name="T-Beam", manufacturer="LILYGO", architecture="esp32")
+        ctx = BuildContext(build_id="build_1_000000_aa", variant=variant, config_content="{}", settings=settings)
+
+        with open(temp_dir / build_service.BUILD_LOCK_FILE, "a") as other_worker:
+            fcntl.flock(other_worker, fcntl.LOCK_EX)
+            events = build_service.build_firmware(ctx)
+            assert (await anext(events)).status == "queued"
+        # Released: the build gets the slot (and fails, no firmware installed)
+        assert (await anext(events)).status == "compiling"
+        await events.aclose()
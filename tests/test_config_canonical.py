@@ -0,0 +1,56 @@
+"""Tests for canonical config normalization and hashing."""
+
+import json
+
+import pytest
+
+from mtfwbuilder.services.config_canonical import canonicalize, strip_jsonc
+from mtfwbuilder.services.jsonc_generator import generate_jsonc
+
+
+class TestStripJsonc:
+    def test_removes_comments(self):
+        text = '{\n  // line comment\n  "A": "1", /* block */ "B": "2"\n}'
+        assert json.loads(strip_jsonc(text)) == {"A": "1", "B": "2"}
+
+    def test_removes_trailing_commas(self):
+        assert json.loads(strip_jsonc('{"A": "1", "B": ["x", ],\n}')) == {"A": "1", "B": ["x"]}
+
+    def test_comment_markers_inside_strings_kept(self):
+        text = '{"URL": "mqtt://host/*x*/", "Q": "say \\"//hi\\", ok"}'
+        assert json.loads(strip_jsonc(text)) == {"URL": "mqtt://host/*x*/", "Q": 'say "//hi", ok'}
+
+    def test_unterminated_comment(self):
+        with pytest.raises(ValueError):
+            strip_jsonc('{"A": "1" /* oops')
+
+
+class TestCanonicalize:
+    def test_generated_and_uploaded_hash_the_same(self, sample_config_data):
+        generated = generate_jsonc(sample_config_data)
+        prefs = json.loads(generated)
+        # Hand-edited upload: reversed key order, comments, compact layout, trailing comma
+        uploaded = "// my node\n{" + ",".join(f"{json.dumps(k)}:{json.dumps(v)}" for k, v in reversed(prefs.items())) + ",}"
+        assert canonicalize(generated).digest == canonicalize(uploaded).digest
+
+    def test_different_values_hash_differently(self):
+        assert canonicalize('{"A": "1"}').digest != canonicalize('{"A": "2"}').digest
+
+    def test_scalars_as_strings(self):
+        prefs = canonicalize('{"A": true, "B": false, "C": 3, "D": 1.5}').prefs
+        assert prefs == {"A": "true", "B": "false", "C": "3", "D": "1.5"}
+        assert canonicalize('{"A": true}').digest == canonicalize('{"A": "true"}').digest
+
+    def test_byte_lists_normalized(self):
+        a = canonicalize('{"PSK": "{0xDE,0xad, 0x1}"}')
+        b = canonicalize('{"PSK": "{ 0xde, 0xad, 0x01 }"}')
+        assert a.prefs["PSK"] == "{ 0xde, 0xad, 0x01 }"
+        assert a.digest == b.digest
+
+    def test_other_strings_untouched(self):
+        assert canonicalize('{"NAME": "  Spaced Node "}').prefs["NAME"] == "  Spaced Node "
+
+    @pytest.mark.parametrize("text", ["", "[1, 2]", '{"A": {"nested": 1}}', '{"A": null}', "{not json}"])
+    def test_invalid(self, text):
+        with pytest.raises(ValueError):
+            canonicalize(text)
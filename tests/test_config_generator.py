@@ -280,3 +280,84 @@ class TestOutputFormat:
         output = generate_jsonc({"device_name": "Test"})
         assert "\n" in output
         assert "  " in output
+
+
+class TestTableDrivenOutput:
+    """The schema-driven generator must match the procedural output byte for byte."""
+
+    def test_output_order_and_bytes(self):
+        # Input deliberately out of schema order
+        data = {
+            "mqtt_tls_enabled": "false",
+            "channel_1[psk]": "{ 0x01 }",
+            "channels_to_write": "2",
+            "channel_1[name]": "",
+            "owner_short_name": "TST",
+            "channel_0[uplink_enabled]": "true",
+            "channel_0[name]": "Primary",
+            "channel_0[psk]": "0a0b",
+            "channel_2[name]": "ignored",
+            "lora_region": "EU_868",
+            "lora_enabled": "true",
+            "network_enabled": "true",
+            "mqtt_enabled": "true",
+            "mqtt_address": "m",
+            "device_name": "Node",
+            "oem_text": "Hi",
+            "gps_mode": "ENABLED",
+        }
+        assert generate_jsonc(data) == (
+            '{\n  "USERPREFS_CHANNELS_TO_WRITE": "2",\n  "USERPREFS_CONFIG_DEVICE_NAME": "Node",\n'
+            '  "USERPREFS_CONFIG_OWNER_SHORT_NAME": "TST",\n  "USERPREFS_CHANNEL_0_NAME": "Primary",\n'
+            '  "USERPREFS_CHANNEL_0_PSK": "{ 0x0a, 0x0b }",\n  "USERPREFS_CHANNEL_0_UPLINK_ENABLED": "true",\n'
+            '  "USERPREFS_CHANNEL_1_NAME": "",\n  "USERPREFS_CHANNEL_1_PSK": "{ 0x01 }",\n'
+            '  "USERPREFS_CONFIG_LORA_REGION": "meshtastic_Config_LoRaConfig_RegionCode_EU_868",\n'
+            '  "USERPREFS_CONFIG_MQTT_SERVER": "m",\n  "USERPREFS_CONFIG_MQTT_TLS_ENABLED": "false",\n'
+            '  "USERPREFS_CONFIG_OEM_TEXT": "Hi"\n}'
+        )
+
+    def test_matches_procedural_generator_on_fleet_config(self):
+        from utils.jsonc_generator import generate_jsonc as procedural_generate_jsonc
+
+        config = {"channels_to_write": "8", "lora_enabled": "true", "lora_region": "US", "gps_enabled": "true"}
+        for i in range(8):
+            config[f"channel_{i}[name]"] = f"Ch{i}"
+            config[f"channel_{i}[psk]"] = "deadbeef" * 8
+            config[f"channel_{i}[downlink_enabled]"] = "false"
+        config.update({f"fleet_meta_{i}": "x" for i in range(200)})
+        assert generate_jsonc(config) == procedural_generate_jsonc(config)
+
+    @pytest.mark.parametrize("key", ["channel_01[name]", "channel_x[name]", "channel_1[name", "channel_²[name]"])
+    def test_malformed_channel_keys_ignored(self, key):
+        result = json.loads(generate_jsonc({"channels_to_write": "3", key: "X"}))
+        assert result == {"USERPREFS_CHANNELS_TO_WRITE": "3"}
+
+    def test_non_numeric_channel_count_raises(self):
+        with pytest.raises(ValueError):
+            generate_jsonc({"channels_to_write": "many"})
+
+
+class TestJsoncCache:
+    """Tests for the memoized generator behind /preview and /generate."""
+
+    def test_least_recently_used_evicted(self):
+        from mtfwbuilder.services.jsonc_cache import JsoncCache
+
+        cache = JsoncCache(max_entries=2)
+        cache.generate({"device_name": "A"})
+        cache.generate({"device_name": "B"})
+        cache.generate({"device_name": "A"})  # A is now most recent
+        cache.generate({"device_name": "C"})  # evicts B
+        cache.generate({"device_name": "A"})
+        cache.generate({"device_name": "B"})
+        assert (cache.hits, cache.misses) == (2, 4)
+        assert cache.stats() == {"entries": 2, "hits": 2, "misses": 4, "hit_ratio": 0.3333}
+
+    def test_etag_tracks_content(self):
+        from mtfwbuilder.services.jsonc_cache import JsoncCache
+
+        cache = JsoncCache()
+        etag_a, content_a = cache.generate({"device_name": "A", "unused": "1"})
+        etag_b, content_b = cache.generate({"device_name": "A", "unused": "2"})
+        assert content_a == content_b
+        assert etag_a == etag_b  # different requests, same output, same validator
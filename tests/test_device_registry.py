@@ -1,12 +1,18 @@
 """Tests for device variant registry."""
 
+import asyncio
+import os
 import tempfile
 from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
 
 import pytest
 import yaml
 
-from mtfwbuilder.services.device_registry import DeviceRegistry, DeviceVariant
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services import device_registry
+from mtfwbuilder.services.device_registry import DeviceRegistry, DeviceVariant, reload_registry, watch_registry
 
 
 class TestDeviceRegistryLoad:
@@ -147,3 +153,125 @@ class TestFirmwareFormat:
         registry = DeviceRegistry(variants_path)
         for v in registry.all_variants:
             assert v.firmware_format in ("bin", "uf2"), f"{v.id}: {v.firmware_format}"
+
+
+class TestDeviceRegistryFilter:
+    """Tests for indexed filtering."""
+
+    def test_filter_matches_linear_scan(self, variants_path):
+        registry = DeviceRegistry(variants_path)
+        for manufacturer, architecture, pio_platform in [
+            ("LILYGO", None, None),
+            (None, "nrf52", None),
+            ("RAK", "nrf52", "nrf52840"),
+            (None, "esp32", "esp32s3"),
+            ("Nobody", None, None),
+        ]:
+            expected = [
+                v
+                for v in registry.all_variants
+                if (manufacturer is None or v.manufacturer == manufacturer)
+                and (architecture is None or v.architecture == architecture)
+                and (pio_platform is None or v.pio_platform == pio_platform)
+            ]
+            assert registry.filter(manufacturer, architecture, pio_platform) == expected
+
+    def test_no_filter_returns_all(self, variants_path):
+        registry = DeviceRegistry(variants_path)
+        assert registry.filter() == registry.all_variants
+
+
+def _write_variants(path: Path, *ids: str) -> None:
+    path.write_text(yaml.dump([{"id": i, "name": i, "manufacturer": "X", "architecture": "esp32"} for i in ids]))
+
+
+def _bump_mtime(path: Path) -> None:
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+class TestRegistryCache:
+    """Tests for the compiled registry cache."""
+
+    def test_cache_reused_without_parsing(self, variants_path, temp_dir):
+        cache = temp_dir / "cache"
+        first = DeviceRegistry(variants_path, cache)
+        assert len(list(cache.glob("variants-*.marshal"))) == 1
+
+        with patch.object(device_registry.yaml, "load", side_effect=AssertionError("parsed")):
+            cached = DeviceRegistry(variants_path, cache)
+        assert cached.all_variants == first.all_variants
+        assert cached.by_manufacturer == first.by_manufacturer
+
+    def test_cache_keyed_by_content(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        cache = temp_dir / "cache"
+        _write_variants(path, "a")
+        DeviceRegistry(path, cache)
+        _write_variants(path, "a", "b")
+        assert DeviceRegistry(path, cache).count == 2
+        # Only the cache for the current contents is kept
+        assert len(list(cache.glob("variants-*.marshal"))) == 1
+
+    def test_corrupt_cache_falls_back_to_yaml(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        cache = temp_dir / "cache"
+        _write_variants(path, "a")
+        DeviceRegistry(path, cache)
+        next(cache.glob("variants-*.marshal")).write_bytes(b"garbage")
+        assert DeviceRegistry(path, cache).exists("a")
+
+
+class TestRegistryReload:
+    """Tests for hot reloading variants.yaml."""
+
+    def test_unchanged_file_not_reloaded(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        _write_variants(path, "a")
+        assert reload_registry(DeviceRegistry(path)) is None
+
+    def test_change_bumps_version(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        _write_variants(path, "a")
+        current = DeviceRegistry(path)
+        _write_variants(path, "a", "b")
+        _bump_mtime(path)
+        reloaded = reload_registry(current)
+        assert reloaded.version == current.version + 1
+        assert reloaded.exists("b")
+        assert not current.exists("b")
+
+    def test_touch_without_change_keeps_version(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        _write_variants(path, "a")
+        current = DeviceRegistry(path)
+        _bump_mtime(path)
+        assert reload_registry(current) is None
+        assert current.signature == device_registry.file_signature(path)
+
+    def test_invalid_edit_keeps_current(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        _write_variants(path, "a")
+        current = DeviceRegistry(path)
+        path.write_text("- id: broken\n")
+        _bump_mtime(path)
+        assert reload_registry(current) is None
+        # Not retried until the file changes again
+        assert reload_registry(current) is None
+
+    async def test_watcher_swaps_state(self, temp_dir):
+        path = temp_dir / "variants.yaml"
+        _write_variants(path, "a")
+        state = SimpleNamespace(device_registry=DeviceRegistry(path))
+        settings = Settings(temp_dir=temp_dir, devices_file=path, firmware_dir=temp_dir / "fw", registry_reload_interval=0.01)
+        task = asyncio.create_task(watch_registry(state, settings))
+        try:
+            _write_variants(path, "a", "b")
+            _bump_mtime(path)
+            for _ in range(200):
+                if state.device_registry.version == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert state.device_registry.exists("b")
+        finally:
+            task.cancel()
@@ -0,0 +1,500 @@
+"""Tests for versioned firmware trees and the firmware updater."""
+
+import hashlib
+import io
+import json
+import os
+import subprocess
+import tarfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services import archive_extractor, firmware_store, firmware_updater, update_jobs
+from mtfwbuilder.services.build_service import BuildContext
+from mtfwbuilder.services.device_registry import DeviceVariant
+
+
+def _settings(temp_dir, **kwargs):
+    return Settings(firmware_dir=temp_dir / "firmware", temp_dir=temp_dir / "tmp", base_dir=temp_dir, **kwargs)
+
+
+def _stage(settings, marker: str):
+    """Create a minimal installed-looking tree in staging."""
+    staged = firmware_store.create_staging_dir(settings) / "tree"
+    staged.mkdir()
+    (staged / "platformio.ini").write_text(f"; {marker}\n")
+    return staged
+
+
+class TestFirmwareStore:
+    """Tests for version resolution, activation, and retention."""
+
+    def test_nothing_installed(self, temp_dir):
+        settings = _settings(temp_dir)
+        assert firmware_store.current_version(settings) is None
+        assert firmware_store.resolve(settings) == (None, settings.firmware_dir)
+
+    def test_activate_switches_current(self, temp_dir):
+        settings = _settings(temp_dir)
+        firmware_store.activate(settings, _stage(settings, "a"), "v2.5.0")
+        assert firmware_store.current_version(settings) == "v2.5.0"
+
+        firmware_store.activate(settings, _stage(settings, "b"), "v2.6.0")
+        version, tree = firmware_store.resolve(settings)
+        assert version == "v2.6.0"
+        assert (tree / "platformio.ini").read_text() == "; b\n"
+        # Previous version stays installed and addressable
+        _, old_tree = firmware_store.resolve(settings, "v2.5.0")
+        assert (old_tree / "platformio.ini").read_text() == "; a\n"
+
+    def test_current_link_is_symlink(self, temp_dir):
+        settings = _settings(temp_dir)
+        firmware_store.activate(settings, _stage(settings, "a"), "v2.5.0")
+        link = settings.firmware_dir / firmware_store.CURRENT_LINK
+        assert link.is_symlink()
+        assert not os.path.isabs(os.readlink(link))
+
+    def test_unknown_version_raises(self, temp_dir):
+        settings = _settings(temp_dir)
+        with pytest.raises(KeyError):
+            firmware_store.resolve(settings, "v9.9.9")
+
+    def test_version_name_sanitized(self):
+        assert firmware_store.version_dir_name("v2.5/../x") == "v2.5_.._x"
+        with pytest.raises(ValueError):
+            firmware_store.version_dir_name("..")
+
+    def test_legacy_tree_served_then_migrated(self, temp_dir):
+        settings = _settings(temp_dir)
+        settings.firmware_dir.mkdir()
+        (settings.firmware_dir / "platformio.ini").write_text("; legacy\n")
+        assert firmware_store.current_version(settings) == firmware_store.LEGACY_VERSION
+        assert firmware_store.resolve(settings)[1] == settings.firmware_dir
+
+        firmware_store.activate(settings, _stage(settings, "new"), "v2.6.0")
+        assert firmware_store.current_version(settings) == "v2.6.0"
+        assert not (settings.firmware_dir / "platformio.ini").exists()
+        _, legacy_tree = firmware_store.resolve(settings, firmware_store.LEGACY_VERSION)
+        assert (legacy_tree / "platformio.ini").read_text() == "; legacy\n"
+
+    def test_prune_keeps_current_and_pinned(self, temp_dir):
+        settings = _settings(temp_dir, firmware_keep_versions=1)
+        for i, version in enumerate(["v1", "v2", "v3"]):
+            firmware_store.activate(settings, _stage(settings, version), version)
+            tree = firmware_store.tree_path(settings, version)
+            os.utime(tree, (time.time() + i, time.time() + i))
+
+        firmware_store.pin(settings, "v1")
+        try:
+            removed = firmware_store.prune_versions(settings)
+        finally:
+            firmware_store.unpin(settings, "v1")
+
+        assert removed == ["v2"]
+        assert firmware_store.installed_versions(settings) == ["v3", "v1"]
+
+    def test_reinstall_pinned_version_refused(self, temp_dir):
+        settings = _settings(temp_dir)
+        firmware_store.activate(settings, _stage(settings, "a"), "v1")
+        firmware_store.pin(settings, "v1")
+        try:
+            with pytest.raises(RuntimeError):
+                firmware_store.activate(settings, _stage(settings, "b"), "v1")
+        finally:
+            firmware_store.unpin(settings, "v1")
+
+
+class TestBuildVersionPinning:
+    """Builds resolve their tree when queued and keep it across a switch."""
+
+    def test_build_context_keeps_version_after_switch(self, temp_dir):
+        settings = _settings(temp_dir)
+        firmware_store.activate(settings, _stage(settings, "a"), "v1")
+        variant = DeviceVariant(id="tbeam", name="T-Beam", manufacturer="LILYGO", architecture="esp32")
+        ctx = BuildContext(build_id="build_1_1_1", variant=variant, config_content="{}", settings=settings)
+
+        firmware_store.activate(settings, _stage(settings, "b"), "v2")
+
+        assert ctx.firmware_version == "v1"
+        assert (ctx.firmware_tree / "platformio.ini").read_text() == "; a\n"
+
+    def test_build_context_explicit_version(self, temp_dir):
+        settings = _settings(temp_dir)
+        firmware_store.activate(settings, _stage(settings, "a"), "v1")
+        firmware_store.activate(settings, _stage(settings, "b"), "v2")
+        variant = DeviceVariant(id="tbeam", name="T-Beam", manufacturer="LILYGO", architecture="esp32")
+        ctx = BuildContext(
+            build_id="build_1_1_2", variant=variant, config_content="{}", settings=settings, firmware_version="v1"
+        )
+        assert ctx.firmware_tree == firmware_store.tree_path(settings, "v1")
+
+
+def _blocking_runner(settings, monitor):
+    """Fake update that reports a download, then waits to be cancelled."""
+    monitor.report("download", "Downloading...", 512, 1024)
+    monitor.cancel_event.wait(5)
+    monitor.check_cancelled()
+    return True
+
+
+def _quick_runner(settings, monitor):
+    monitor.report("download", "Downloading...", 1024, 1024)
+    monitor.report("install", "Installing...")
+    return True
+
+
+class TestUpdateJobs:
+    """Tests for background update jobs."""
+
+    @pytest.mark.asyncio
+    async def test_job_streams_phases_and_completes(self, temp_dir):
+        job = update_jobs.start_update_job(_settings(temp_dir), runner=_quick_runner)
+        events = [event async for event in job.follow()]
+
+        assert [e.phase for e in events] == ["download", "install", "done"]
+        assert events[0].bytes_done == 1024
+        assert job.status == "complete"
+        assert update_jobs.active_job() is None
+
+    @pytest.mark.asyncio
+    async def test_second_update_refused_then_cancel(self, temp_dir):
+        settings = _settings(temp_dir)
+        job = update_jobs.start_update_job(settings, runner=_blocking_runner)
+        with pytest.raises(update_jobs.UpdateInProgress):
+            update_jobs.start_update_job(settings, runner=_quick_runner)
+
+        assert job.cancel()
+        events = [event async for event in job.follow()]
+        assert events[-1].status == "cancelled"
+        assert job.status == "cancelled"
+        assert not job.cancel()
+
+    @pytest.mark.asyncio
+    async def test_failure_reports_error(self, temp_dir):
+        def failing(settings, monitor):
+            return monitor.fail("PlatformIO setup failed: boom")
+
+        job = update_jobs.start_update_job(_settings(temp_dir), runner=failing)
+        events = [event async for event in job.follow()]
+        assert events[-1].status == "failed"
+        assert "boom" in events[-1].error
+
+    @pytest.mark.asyncio
+    async def test_update_route_refuses_concurrent_update(self, temp_dir):
+        from httpx import ASGITransport, AsyncClient
+
+        from mtfwbuilder.auth import SESSION_COOKIE, create_session_token
+        from tests.test_security import _make_client_app
+
+        app, settings = _make_client_app()
+        transport = ASGITransport(app=app)
+        with patch("mtfwbuilder.services.update_jobs.update_firmware", _blocking_runner):
+            async with AsyncClient(transport=transport, base_url="http://test") as c:
+                c.cookies.set(SESSION_COOKIE, create_session_token(settings))
+                first = await c.post("/api/v1/update-firmware")
+                assert first.status_code == 200
+                job_id = first.json()["job_id"]
+
+                second = await c.post("/api/v1/update-firmware")
+                assert second.status_code == 409
+                assert second.json()["job_id"] == job_id
+
+                cancel = await c.post(f"/api/v1/update-firmware/{job_id}/cancel")
+                assert cancel.status_code == 200
+                await update_jobs.get_job(job_id)._task
+
+
+class _FakeGitHub:
+    """Local HTTP stand-in for the GitHub releases API and zipball download."""
+
+    def __init__(self, tag: str, archive: bytes):
+        self.tag = tag
+        self.archive = archive
+        self.requests: list[tuple[str, dict]] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.requests.append((self.path, dict(self.headers)))
+                if self.path.endswith("/releases/latest"):
+                    etag = f'"{fake.tag}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                    body = json.dumps(
+                        {
+                            "tag_name": fake.tag,
+                            "published_at": "2026-01-01T00:00:00Z",
+                            "zipball_url": f"{fake.url}/zipball/{fake.tag}",
+                        }
+                    ).encode()
+                    self.send_response(200)
+                    self.send_header("ETag", etag)
+                else:
+                    body = fake.archive
+                    start = 0
+                    if self.headers.get("Range"):
+                        start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                        self.send_response(206)
+                        self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                    else:
+                        self.send_response(200)
+                    body = body[start:]
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self) -> list[str]:
+        return [path for path, _ in self.requests]
+
+
+def _make_zip(top: str = "meshtastic-firmware-abc123", files: dict | None = None) -> bytes:
+    files = files or {"platformio.ini": "; fw\n", "src/main.cpp": "int main() {}\n"}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, content in files.items():
+            zf.writestr(f"{top}/{name}", content)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def fake_github():
+    fake = _FakeGitHub("v2.6.0", _make_zip())
+    yield fake
+    fake.server.shutdown()
+
+
+class TestReleaseFetching:
+    """Tests for cached release info and resumable, verified downloads."""
+
+    def test_release_info_cached_by_etag(self, temp_dir, fake_github):
+        settings = _settings(temp_dir, github_api_url=fake_github.url)
+        first = firmware_updater.get_latest_release_info(settings)
+        second = firmware_updater.get_latest_release_info(settings)
+
+        assert first["version"] == second["version"] == "v2.6.0"
+        assert "If-None-Match" not in fake_github.requests[0][1]
+        assert fake_github.requests[1][1]["If-None-Match"] == '"v2.6.0"'
+
+    def test_update_installs_then_reports_up_to_date(self, temp_dir, fake_github):
+        settings = _settings(temp_dir, github_api_url=fake_github.url)
+        with patch.object(firmware_updater, "_install_packages", return_value=(0, "")):
+            assert firmware_updater.update_firmware(settings)
+        assert firmware_store.current_version(settings) == "v2.6.0"
+        _, tree = firmware_store.resolve(settings)
+        assert (tree / "src" / "main.cpp").exists()
+
+        monitor = firmware_updater.UpdateMonitor()
+        assert firmware_updater.update_firmware(settings, monitor)
+        assert "up to date" in monitor.result.lower()
+        assert sum(1 for path in fake_github.paths() if "/zipball/" in path) == 1
+
+    def test_download_resumes_partial(self, temp_dir, fake_github):
+        settings = _settings(temp_dir)
+        downloads = settings.firmware_dir / firmware_updater.DOWNLOADS_DIR
+        downloads.mkdir(parents=True)
+        (downloads / "v2.6.0.zip.part").write_bytes(fake_github.archive[:100])
+
+        url = f"{fake_github.url}/zipball/v2.6.0"
+        expected = hashlib.sha256(fake_github.archive).hexdigest()
+        archive = firmware_updater.download_archive(settings, url, "v2.6.0", expected_sha256=expected)
+
+        assert archive.read_bytes() == fake_github.archive
+        assert fake_github.requests[-1][1]["Range"] == "bytes=100-"
+        assert (downloads / "v2.6.0.zip.sha256").read_text().strip() == expected
+
+    def test_cached_archive_reused(self, temp_dir, fake_github):
+        settings = _settings(temp_dir)
+        url = f"{fake_github.url}/zipball/v2.6.0"
+        firmware_updater.download_archive(settings, url, "v2.6.0")
+        firmware_updater.download_archive(settings, url, "v2.6.0")
+        assert len(fake_github.requests) == 1
+
+    def test_checksum_mismatch_rejected(self, temp_dir, fake_github):
+        settings = _settings(temp_dir)
+        url = f"{fake_github.url}/zipball/v2.6.0"
+        with pytest.raises(ValueError, match="Checksum mismatch"):
+            firmware_updater.download_archive(settings, url, "v2.6.0", expected_sha256="0" * 64)
+        assert not list((settings.firmware_dir / firmware_updater.DOWNLOADS_DIR).glob("*.zip*"))
+
+
+class TestIncrementalUpdate:
+    """Tests for mtime preservation of unchanged files."""
+
+    def test_sync_report_and_mtimes(self, temp_dir):
+        installed = temp_dir / "installed"
+        staged = temp_dir / "staged"
+        for root in (installed, staged):
+            (root / "src").mkdir(parents=True)
+            (root / "src" / "same.cpp").write_text("same\n")
+        (installed / "src" / "edit.cpp").write_text("old\n")
+        (staged / "src" / "edit.cpp").write_text("new!\n")
+        (installed / "src" / "gone.cpp").write_text("bye\n")
+        (staged / "src" / "new.cpp").write_text("hi\n")
+        (installed / ".pio" / "build").mkdir(parents=True)
+        (installed / ".pio" / "build" / "main.o").write_bytes(b"\x00")
+
+        old_mtime = time.time() - 3600
+        os.utime(installed / "src" / "same.cpp", (old_mtime, old_mtime))
+
+        report = firmware_updater.sync_unchanged_mtimes(installed, staged)
+
+        assert (report.added, report.changed, report.removed, report.unchanged) == (1, 1, 1, 1)
+        assert (staged / "src" / "same.cpp").stat().st_mtime == pytest.approx(old_mtime)
+        assert (staged / "src" / "edit.cpp").stat().st_mtime > old_mtime
+
+    def test_incremental_update_reports_changes(self, temp_dir):
+        settings = _settings(temp_dir)
+        firmware_store.activate(settings, _stage(settings, "fw"), "v1")
+        _, old_tree = firmware_store.resolve(settings)
+        (old_tree / "src").mkdir()
+        (old_tree / "src" / "main.cpp").write_text("int main() {}\n")
+
+        new_tree = firmware_store.create_staging_dir(settings) / "tree"
+        (new_tree / "src").mkdir(parents=True)
+        (new_tree / "platformio.ini").write_text("; fw\n")
+        (new_tree / "src" / "main.cpp").write_text("int main() { return 1; }\n")
+
+        monitor = firmware_updater.UpdateMonitor()
+        with patch.object(firmware_updater, "_install_packages", return_value=(0, "")):
+            assert firmware_updater.install_staged_tree(settings, new_tree, "v2", monitor, mode="incremental")
+
+        assert monitor.sync_report.changed == 1
+        assert monitor.sync_report.unchanged == 1
+        assert "1 changed" in monitor.result
+
+
+class TestOfflineImport:
+    """Tests for installing firmware from local archives and git mirrors."""
+
+    def _import_dir(self, temp_dir):
+        import_dir = temp_dir / "imports"
+        import_dir.mkdir()
+        return import_dir
+
+    def test_import_tarball_with_checksum_file(self, temp_dir):
+        settings = _settings(temp_dir)
+        import_dir = self._import_dir(temp_dir)
+        src = temp_dir / "src" / "firmware-2.6.0"
+        src.mkdir(parents=True)
+        (src / "platformio.ini").write_text("; fw\n")
+        archive = import_dir / "firmware-2.6.0.tar.gz"
+        with tarfile.open(archive, "w:gz") as tf:
+            tf.add(src, arcname="firmware-2.6.0")
+        digest = hashlib.sha256(archive.read_bytes()).hexdigest()
+        (import_dir / "firmware-2.6.0.tar.gz.sha256").write_text(f"{digest}  firmware-2.6.0.tar.gz\n")
+
+        assert firmware_updater.list_import_sources(settings)[0]["kind"] == "archive"
+        with patch.object(firmware_updater, "_install_packages", return_value=(0, "")):
+            assert firmware_updater.import_firmware(settings, "firmware-2.6.0.tar.gz")
+        assert firmware_store.current_version(settings) == "firmware-2.6.0"
+
+    def test_import_checksum_mismatch(self, temp_dir):
+        settings = _settings(temp_dir)
+        import_dir = self._import_dir(temp_dir)
+        (import_dir / "fw.zip").write_bytes(_make_zip())
+        monitor = firmware_updater.UpdateMonitor()
+        assert not firmware_updater.import_firmware(settings, "fw.zip", expected_sha256="0" * 64, monitor=monitor)
+        assert "Checksum mismatch" in monitor.error
+        assert firmware_store.current_version(settings) is None
+
+    def test_import_from_git_mirror(self, temp_dir):
+        settings = _settings(temp_dir)
+        repo = self._import_dir(temp_dir) / "firmware.git"
+        repo.mkdir()
+        git = ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t"]
+        subprocess.run(git[:3] + ["init", "-q"], check=True)
+        (repo / "platformio.ini").write_text("; from git\n")
+        subprocess.run(git + ["add", "."], check=True)
+        subprocess.run(git + ["commit", "-qm", "fw"], check=True)
+        subprocess.run(git + ["tag", "v2.7.0"], check=True)
+
+        monitor = firmware_updater.UpdateMonitor()
+        assert not firmware_updater.import_firmware(settings, "firmware.git", monitor=monitor)
+        assert "ref" in monitor.error
+
+        with patch.object(firmware_updater, "_install_packages", return_value=(0, "")):
+            assert firmware_updater.import_firmware(settings, "firmware.git", ref="v2.7.0")
+        _, tree = firmware_store.resolve(settings)
+        assert (tree / "platformio.ini").read_text() == "; from git\n"
+        assert firmware_store.current_version(settings) == "v2.7.0"
+
+    def test_import_outside_import_dir_refused(self, temp_dir):
+        settings = _settings(temp_dir)
+        self._import_dir(temp_dir)
+        (temp_dir / "elsewhere.zip").write_bytes(_make_zip())
+        with pytest.raises(ValueError):
+            firmware_updater.resolve_import_source(settings, "../elsewhere.zip")
+
+    def test_extract_archive_rejects_escaping_entries(self, temp_dir):
+        archive = temp_dir / "evil.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("../escape.txt", "x")
+        with pytest.raises(ValueError):
+            firmware_updater.extract_archive(archive, temp_dir / "out")
+
+
+class TestArchiveExtractor:
+    def test_strip_top_dir_lands_in_dest(self, temp_dir):
+        archive = temp_dir / "fw.zip"
+        archive.write_bytes(_make_zip())
+        result = archive_extractor.extract_zip(archive, temp_dir / "tree", strip_top_dir=True)
+        assert result.root == temp_dir / "tree"
+        assert (temp_dir / "tree" / "platformio.ini").read_text() == "; fw\n"
+        assert (temp_dir / "tree" / "src" / "main.cpp").exists()
+        assert result.files == 2
+
+    def test_without_strip_returns_top_dir(self, temp_dir):
+        archive = temp_dir / "fw.zip"
+        archive.write_bytes(_make_zip(top="fw-top"))
+        result = archive_extractor.extract_zip(archive, temp_dir / "out")
+        assert result.root == temp_dir / "out" / "fw-top"
+
+    def test_many_files_parallel(self, temp_dir):
+        files = {f"src/mod{i % 20}/file{i}.cpp": f"// {i}\n" for i in range(2000)}
+        archive = temp_dir / "fw.zip"
+        archive.write_bytes(_make_zip(files=files))
+        result = archive_extractor.extract_zip(archive, temp_dir / "tree", strip_top_dir=True, workers=4)
+        assert result.files == 2000
+        assert result.bytes_written == sum(len(c) for c in files.values())
+        assert (temp_dir / "tree" / "src" / "mod7" / "file1987.cpp").read_text() == "// 1987\n"
+
+    def test_executable_bits_preserved(self, temp_dir):
+        archive = temp_dir / "fw.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            info = zipfile.ZipInfo("top/bin/tool.sh")
+            info.external_attr = 0o755 << 16
+            zf.writestr(info, "#!/bin/sh\n")
+        archive_extractor.extract_zip(archive, temp_dir / "tree", strip_top_dir=True)
+        assert os.access(temp_dir / "tree" / "bin" / "tool.sh", os.X_OK)
+
+    def test_rejects_escape_after_valid_entries(self, temp_dir):
+        archive = temp_dir / "evil.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("ok.txt", "x")
+            zf.writestr("sub/../../escape.txt", "x")
+        with pytest.raises(ValueError):
+            archive_extractor.extract_zip(archive, temp_dir / "out")
+        assert not (temp_dir / "escape.txt").exists()
+
+    def test_cancel_stops_extraction(self, temp_dir):
+        archive = temp_dir / "fw.zip"
+        archive.write_bytes(_make_zip())
+        monitor = firmware_updater.UpdateMonitor()
+        monitor.cancel_event.set()
+        with pytest.raises(firmware_updater.UpdateCancelled):
+            firmware_updater.extract_archive(archive, temp_dir / "tree", monitor)
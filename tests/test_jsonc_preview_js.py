@@ -0,0 +1,111 @@
+"""Parity tests: static/js/jsonc-preview.js against generate_jsonc on randomized inputs."""
+
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from mtfwbuilder.services.jsonc_generator import CHANNEL_SCHEMA, SCHEMA, export_schema, generate_jsonc
+
+RENDERER = Path(__file__).resolve().parent.parent / "static" / "js" / "jsonc-preview.js"
+NODE = shutil.which("node")
+
+pytestmark = pytest.mark.skipif(NODE is None, reason="node is not installed")
+
+_RUNNER = """
+const { render } = require(process.argv[1]);
+const { schema, inputs } = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(inputs.map(data => render(schema, data))));
+"""
+
+# Strings that stress escaping, stripping and code-point slicing
+_PIECES = [
+    "", "a", "Node", "true", "false", " ", "\t", "\n", "\x00", "\x1f", "\x7f", '"', "\\", "//", "/*", "{", "}",
+    "é", "Ω", "漢", "🙂", " ", "　", "\xa0", "﻿", "​", "0x", "de", "AD", "US", "EU_868",
+    "meshtastic_Config_LoRaConfig_RegionCode_", "<script>",
+]
+_GATES = ["lora_enabled", "gps_enabled", "fixed_position", "network_enabled", "wifi_enabled", "mqtt_enabled"]
+_COUNTS = ["0", "1", "2", "3", "8", " 2 ", "+2", "-1", "00", "", "x", "1_0", "٣", "　2"]
+
+
+def _random_string(rng: random.Random) -> str:
+    return "".join(rng.choice(_PIECES) for _ in range(rng.randint(0, 4)))
+
+
+def _random_input(rng: random.Random) -> dict:
+    data = {}
+    for field in rng.sample(SCHEMA, rng.randint(0, len(SCHEMA))):
+        data[field.name] = _random_string(rng)
+    for gate in _GATES:
+        if rng.random() < 0.8:
+            data[gate] = rng.choice(["true", "false", "", "True"])
+    if rng.random() < 0.9:
+        data["channels_to_write"] = rng.choice(_COUNTS)
+    for _ in range(rng.randint(0, 12)):
+        index = rng.choice(["0", "1", "2", "7", "01", "x", "²", "99999999999999999999"])
+        prop = rng.choice([f.name for f in CHANNEL_SCHEMA] + ["bogus", ""])
+        name = rng.choice([f"channel_{index}[{prop}]", f"channel_{index}[{prop}", f"channel_{index}{prop}]"])
+        if "psk" in prop and rng.random() < 0.5:
+            value = rng.choice(["deadbeef" * 4, "abc", "{ 0x01, 0x02 }", " {x} ", "🙂🙂🙂"])
+        else:
+            value = _random_string(rng)
+        data[name] = value
+    if rng.random() < 0.2:
+        data["preview_only"] = True  # unknown keys may hold any JSON type
+    return data
+
+
+def _render_js(inputs: list) -> list:
+    result = subprocess.run(
+        [NODE, "-e", _RUNNER, str(RENDERER)],
+        input=json.dumps({"schema": export_schema(), "inputs": inputs}),
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=60,
+    )
+    return json.loads(result.stdout)
+
+
+def _generate_py(data):
+    try:
+        return generate_jsonc(data)
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+class TestClientRendererParity:
+    def test_randomized_inputs(self):
+        rng = random.Random(40)
+        inputs = [_random_input(rng) for _ in range(3000)]
+        rendered = _render_js(inputs)
+
+        deferred = 0
+        for data, js in zip(inputs, rendered):
+            py = _generate_py(data)
+            if js is None:
+                deferred += 1
+                # Only inputs Python's int() reads differently, or Python rejects, go to the server
+                assert py is None or data.get("channels_to_write") in ("1_0", "٣", "　2"), data
+            else:
+                assert js == py, data
+        assert deferred < len(inputs) * 0.3
+
+    def test_form_data_from_the_ui(self, sample_config_data):
+        form = {**sample_config_data, "lora_enabled": "true", "lora_region": "US", "channel_0[uplink_enabled]": "true"}
+        assert _render_js([form]) == [generate_jsonc(form)]
+
+    def test_non_string_values_deferred(self):
+        inputs = [{"device_name": 5}, {"channels_to_write": 2}, {"channel_0[name]": None}, [], None]
+        assert _render_js(inputs) == [None] * len(inputs)
+
+
+class TestGeneratorSchema:
+    def test_version_tracks_content(self):
+        schema = export_schema()
+        assert schema["version"] == export_schema()["version"]
+        assert [f["name"] for f in schema["fields"]] == [f.name for f in SCHEMA]
+        assert schema["channels_before"] == "lora_region"
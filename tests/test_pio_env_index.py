@@ -0,0 +1,148 @@
+"""Tests for the PlatformIO environment index."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from mtfwbuilder.config import Settings
+from mtfwbuilder.services import pio_env_index
+from mtfwbuilder.services.device_registry import DeviceRegistry, refresh_registry
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def _make_tree(root: Path) -> Path:
+    """A firmware tree laid out like Meshtastic's."""
+    _write(root / "platformio.ini", """\
+[platformio]
+default_envs = tbeam
+extra_configs =
+  arch/*/*.ini
+  variants/*/*/platformio.ini
+
+[env]
+test_build_src = true ; inline comment
+board_level = main
+""")
+    _write(root / "arch" / "esp32" / "esp32.ini", """\
+[esp32_base]
+platform = platformio/espressif32@6.9.0
+board_upload.flash_size = 4MB
+
+[esp32s3_base]
+extends = esp32_base
+board_upload.flash_size = 8MB
+""")
+    _write(root / "arch" / "nrf52" / "nrf52.ini", """\
+[nrf52_base]
+platform = platformio/nordicnrf52@10.5.0
+# a comment
+""")
+    _write(root / "variants" / "esp32" / "tbeam" / "platformio.ini", """\
+[env:tbeam]
+extends = esp32_base
+board = ttgo-t-beam
+""")
+    _write(root / "variants" / "esp32s3" / "heltec_v3" / "platformio.ini", """\
+[env:heltec-v3]
+extends = esp32s3_base
+board = heltec_wifi_lora_32_V3
+
+[env:heltec-v3-tft]
+extends = env:heltec-v3
+board_upload.flash_size = ${esp32_base.board_upload.flash_size}
+""")
+    _write(root / "variants" / "nrf52840" / "rak4631" / "platformio.ini", """\
+[env:rak4631]
+extends = nrf52_base
+board = wiscore_rak4631
+""")
+    _write(root / "boards" / "wiscore_rak4631.json", json.dumps({"upload": {"flash_size": "1MB"}}))
+    return root
+
+
+class TestBuildIndex:
+    def test_environments_discovered(self, temp_dir):
+        index = pio_env_index.build_index(_make_tree(temp_dir))
+        assert set(index) == {"tbeam", "heltec-v3", "heltec-v3-tft", "rak4631"}
+
+    def test_extends_chain_resolved(self, temp_dir):
+        index = pio_env_index.build_index(_make_tree(temp_dir))
+        heltec = index["heltec-v3"]
+        assert heltec.platform == "platformio/espressif32@6.9.0"
+        assert heltec.board == "heltec_wifi_lora_32_V3"
+        assert heltec.flash_size == "8MB"
+        assert heltec.variant_dir == "esp32s3"
+        assert heltec.source == "variants/esp32s3/heltec_v3/platformio.ini"
+
+    def test_env_extending_env_and_interpolation(self, temp_dir):
+        index = pio_env_index.build_index(_make_tree(temp_dir))
+        tft = index["heltec-v3-tft"]
+        assert tft.board == "heltec_wifi_lora_32_V3"
+        assert tft.flash_size == "4MB"
+
+    def test_flash_size_from_board_json(self, temp_dir):
+        index = pio_env_index.build_index(_make_tree(temp_dir))
+        assert index["rak4631"].flash_size == "1MB"
+        assert index["rak4631"].variant_dir == "nrf52840"
+
+    def test_extends_cycle_does_not_hang(self, temp_dir):
+        _write(temp_dir / "platformio.ini", "[a]\nextends = b\n[b]\nextends = a\n[env:x]\nextends = a\n")
+        index = pio_env_index.build_index(temp_dir)
+        assert index["x"].platform == ""
+
+
+class TestIndexCache:
+    def _settings(self, temp_dir) -> Settings:
+        _make_tree(temp_dir / "firmware" / "versions" / "v2.6.0")
+        (temp_dir / "firmware" / "current").symlink_to("versions/v2.6.0")
+        return Settings(temp_dir=temp_dir, firmware_dir=temp_dir / "firmware")
+
+    def test_index_built_once_per_version(self, temp_dir, monkeypatch):
+        settings = self._settings(temp_dir)
+        first = pio_env_index.get_index(settings)
+        assert first.version == "v2.6.0"
+        monkeypatch.setattr(pio_env_index, "build_index", lambda tree: pytest.fail("re-indexed"))
+        assert pio_env_index.get_index(settings) is first
+        assert pio_env_index.get_index(settings, "v2.6.0") is first
+
+    def test_no_firmware_installed(self, temp_dir):
+        assert pio_env_index.get_index(Settings(temp_dir=temp_dir, firmware_dir=temp_dir / "none")) is None
+
+    def test_metadata_merged_into_registry(self, temp_dir, variants_path):
+        settings = self._settings(temp_dir)
+        settings.devices_file = variants_path
+        registry = DeviceRegistry(variants_path)
+        merged = refresh_registry(registry, settings)
+
+        assert merged.version == registry.version + 1
+        tbeam = merged.get("tbeam")
+        assert tbeam.board == "ttgo-t-beam"
+        assert tbeam.flash_size == "4MB"
+        assert tbeam.pio_platform == registry.get("tbeam").pio_platform
+        assert registry.get("tbeam").board == ""
+        # Already merged with this index: nothing to swap
+        assert refresh_registry(merged, settings) is None
+
+
+class TestBuildRouteRejectsUnknownEnv:
+    def test_variant_missing_from_firmware_rejected(self, temp_dir):
+        from fastapi.testclient import TestClient
+
+        from mtfwbuilder.main import create_app
+
+        _make_tree(temp_dir / "firmware" / "versions" / "v2.6.0")
+        (temp_dir / "firmware" / "current").symlink_to("versions/v2.6.0")
+        app = create_app()
+        with TestClient(app) as client:
+            app.state.settings.firmware_dir = temp_dir / "firmware"
+            response = client.post(
+                "/api/v1/build-firmware",
+                data={"variant": "t-echo", "config_source": "current", "config_json": "{}"},
+            )
+        assert response.status_code == 400
+        assert "not a build environment" in response.json()["detail"]
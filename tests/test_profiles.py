@@ -0,0 +1,177 @@
+"""Tests for stored config profiles."""
+
+import json
+import shutil
+import sqlite3
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from mtfwbuilder.auth import SESSION_COOKIE, create_session_token
+from mtfwbuilder.config import Settings
+from mtfwbuilder.database import init_db
+from mtfwbuilder.main import create_app
+from mtfwbuilder.services.config_canonical import canonicalize
+from mtfwbuilder.services.device_registry import DeviceRegistry
+from mtfwbuilder.services.jsonc_generator import generate_jsonc
+from mtfwbuilder.services.profiles import ProfileCache, merge_layers
+
+BASE_CONFIG = {
+    "lora_enabled": "true",
+    "lora_region": "EU_868",
+    "channels_to_write": "1",
+    "channel_0[name]": "OrgNet",
+    "channel_0[psk]": "ab" * 32,
+    "device_name": "Base",
+}
+
+
+def _row(profile_id, config, parent_id=None, revision=1):
+    return {"id": profile_id, "parent_id": parent_id, "revision": revision, "config_json": json.dumps(config)}
+
+
+class TestMerge:
+    def test_overlay_overrides_and_removes(self):
+        merged = merge_layers([{"a": "1", "b": "2", "c": "3"}, {"b": "x", "c": None}])
+        assert merged == {"a": "1", "b": "x"}
+
+    def test_resolve_memoized_by_revision(self):
+        cache = ProfileCache()
+        chain = [_row(1, BASE_CONFIG), _row(2, {"device_name": "Node7"}, parent_id=1)]
+        first = cache.resolve(chain)
+        assert cache.resolve(chain) is first
+        assert first.config["device_name"] == "Node7"
+        assert first.config_hash == canonicalize(generate_jsonc(first.config)).digest
+
+        chain[0] = _row(1, {**BASE_CONFIG, "lora_region": "US"}, revision=2)
+        assert cache.resolve(chain).config["lora_region"] == "US"
+        assert cache.stats() == {"entries": 2, "hits": 1, "misses": 2}
+
+
+@pytest.mark.asyncio
+async def test_init_db_migrates_old_profiles_table(temp_dir):
+    path = temp_dir / "old.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE config_profiles (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+            "config_json TEXT NOT NULL, created_at TIMESTAMP, updated_at TIMESTAMP)"
+        )
+        conn.execute("INSERT INTO config_profiles (name, config_json) VALUES ('old', '{}')")
+
+    await init_db(Settings(database_path=path, temp_dir=temp_dir))
+    await init_db(Settings(database_path=path, temp_dir=temp_dir))  # idempotent
+
+    with sqlite3.connect(path) as conn:
+        row = conn.execute("SELECT kind, org, parent_id, revision FROM config_profiles").fetchone()
+    assert row == ("node", "", None, 1)
+
+
+class TestProfileRoutes:
+    @pytest.fixture
+    async def client(self, temp_dir):
+        from mtfwbuilder.services.build_service import init_build_system
+
+        settings = Settings(database_path=temp_dir / "test.db", temp_dir=temp_dir / "builds")
+        await init_db(settings)
+        app = create_app()
+        app.state.settings = settings
+        app.state.device_registry = DeviceRegistry(settings.devices_file)
+        app.state.active_builds = {}
+        init_build_system(settings)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+            c.cookies.set(SESSION_COOKIE, create_session_token(settings))
+            yield c
+    async def _create(self, client, **body):
+        resp = await client.post("/api/v1/profiles", json=body)
+        assert resp.status_code == 201, resp.text
+        return resp.json()["profile"]["id"]
+
+    @pytest.mark.asyncio
+    async def test_requires_admin(self, client):
+        client.cookies.clear()
+        resp = await client.get("/api/v1/profiles")
+        assert resp.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_overlay_resolves_over_base(self, client):
+        base = await self._create(client, name="Org base", kind="base", org="acme", config=BASE_CONFIG)
+        node = await self._create(
+            client, name="Node 7", org="acme", parent_id=base, config={"device_name": "Node7", "lora_region": None}
+        )
+
+        data = (await client.get(f"/api/v1/profiles/{node}")).json()
+        assert data["profile"]["config"] == {"device_name": "Node7", "lora_region": None}
+        assert data["resolved"]["channel_0[name]"] == "OrgNet"
+        assert data["resolved"]["device_name"] == "Node7"
+        assert "lora_region" not in data["resolved"]
+        assert data["config_hash"] == canonicalize(generate_jsonc(data["resolved"])).digest
+
+        # Editing the base is seen through the overlay
+        resp = await client.put(
+            f"/api/v1/profiles/{base}",
+            json={"name": "Org base", "kind": "base", "org": "acme", "config": {**BASE_CONFIG, "channel_0[name]": "New"}},
+        )
+        assert resp.status_code == 200
+        assert resp.json()["profile"]["revision"] == 2
+        data = (await client.get(f"/api/v1/profiles/{node}")).json()
+        assert data["resolved"]["channel_0[name]"] == "New"
+
+        listed = (await client.get("/api/v1/profiles", params={"org": "acme", "kind": "node"})).json()["profiles"]
+        assert [p["id"] for p in listed] == [node]
+        assert "config_json" not in listed[0]
+
+    @pytest.mark.asyncio
+    async def test_hierarchy_rules(self, client):
+        base = await self._create(client, name="Base", kind="base", org="acme", config=BASE_CONFIG)
+        node = await self._create(client, name="Node", org="acme", parent_id=base)
+        child = await self._create(client, name="Child base", kind="base", org="acme", parent_id=base)
+
+        for body, message in [
+            ({"name": "x", "org": "acme", "parent_id": node}, "only inherit from a base"),
+            ({"name": "x", "org": "other", "parent_id": base}, "another org"),
+            ({"name": "x", "org": "acme", "parent_id": 999}, "not found"),
+        ]:
+            resp = await client.post("/api/v1/profiles", json=body)
+            assert resp.status_code == 400
+            assert message in resp.json()["detail"]
+
+        resp = await client.put(
+            f"/api/v1/profiles/{base}", json={"name": "Base", "kind": "base", "org": "acme", "parent_id": child}
+        )
+        assert resp.status_code == 400
+        assert "descendants" in resp.json()["detail"]
+
+        resp = await client.put(f"/api/v1/profiles/{base}", json={"name": "Base", "kind": "node", "org": "acme"})
+        assert resp.status_code == 400
+
+        resp = await client.put("/api/v1/profiles/999", json={"name": "x"})
+        assert resp.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_node_profiles_validated(self, client):
+        partial = {"channels_to_write": "2", "channel_0[name]": "A"}
+        assert await self._create(client, name="Partial", kind="base", config=partial)
+
+        resp = await client.post("/api/v1/profiles", json={"name": "Bad", "config": partial})
+        assert resp.status_code == 422
+        assert resp.json()["detail"]["errors"][0]["key"] == "USERPREFS_CHANNELS_TO_WRITE"
+
+    @pytest.mark.asyncio
+    async def test_build_by_reference(self, client):
+        base = await self._create(client, name="Base", kind="base", config=BASE_CONFIG)
+        node = await self._create(client, name="Node", parent_id=base, config={"device_name": "Node7"})
+        profile = (await client.get(f"/api/v1/profiles/{node}")).json()
+
+        resp = await client.post("/api/v1/build-firmware", data={"variant": "tbeam", "profile_id": str(node)})
+        assert resp.status_code == 200, resp.text
+        data = resp.json()
+        assert data["profile_id"] == node
+        assert data["config_hash"] == profile["config_hash"]
+        shutil.rmtree(client._transport.app.state.settings.temp_dir, ignore_errors=True)
+
+        resp = await client.post("/api/v1/build-firmware", data={"variant": "tbeam", "profile_id": "999"})
+        assert resp.status_code == 400
+
+        client.cookies.clear()
+        resp = await client.post("/api/v1/build-firmware", data={"variant": "tbeam", "profile_id": str(node)})
+        assert resp.status_code == 403
@@ -0,0 +1,110 @@
+"""Tests for the SQLite token-bucket rate limiter."""
+
+import bcrypt
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from mtfwbuilder.config import Settings
+from mtfwbuilder.main import create_app
+from mtfwbuilder.rate_limit import RateLimiter, parse_rate, quota
+
+
+class TestParseRate:
+    @pytest.mark.parametrize(
+        "text,capacity,period",
+        [("10/minute", 10, 60), ("60 per hour", 60, 3600), ("100/5 minutes", 100, 300), ("2.5/second", 2.5, 1)],
+    )
+    def test_formats(self, text, capacity, period):
+        rate = parse_rate(text)
+        assert (rate.capacity, rate.period) == (capacity, period)
+
+    @pytest.mark.parametrize("text", ["10", "ten/minute", "10/fortnight", "/minute"])
+    def test_invalid(self, text):
+        with pytest.raises(ValueError):
+            parse_rate(text)
+
+    def test_overrides_and_unlimited(self, temp_dir):
+        settings = Settings(
+            temp_dir=temp_dir, api_rate_limit="", rate_limit_overrides={"10.0.0.5": {"build": "600/hour"}}
+        )
+        assert quota(settings, "api", "10.0.0.5") is None
+        assert quota(settings, "build", "10.0.0.5").capacity == 600
+        assert quota(settings, "build", "10.0.0.6").capacity == 60
+
+
+class TestTokenBucket:
+    RATE = parse_rate("3/minute")  # a token every 20s
+
+    def test_spends_and_refills(self, temp_dir):
+        limiter = RateLimiter()
+        path = temp_dir / "rl.db"
+        assert [limiter.acquire(path, "k", self.RATE, 1, now=0) for _ in range(3)] == [0, 0, 0]
+        assert limiter.acquire(path, "k", self.RATE, 1, now=0) == pytest.approx(20)
+        assert limiter.acquire(path, "k", self.RATE, 1, now=10) == pytest.approx(10)  # denials spend nothing
+        assert limiter.acquire(path, "k", self.RATE, 1, now=20) == 0
+        # Refill stops at capacity
+        assert limiter.acquire(path, "k", self.RATE, 3, now=1000) == 0
+        assert limiter.acquire(path, "other", self.RATE, 1, now=1000) == 0
+        limiter.close()
+
+    def test_cost_weighted(self, temp_dir):
+        limiter = RateLimiter()
+        path = temp_dir / "rl.db"
+        assert limiter.acquire(path, "k", self.RATE, 2, now=0) == 0
+        assert limiter.acquire(path, "k", self.RATE, 2, now=0) == pytest.approx(20)
+        # More than the capacity costs the whole bucket
+        assert limiter.acquire(path, "k", self.RATE, 10, now=60) == 0
+        assert limiter.acquire(path, "k", self.RATE, 1, now=60) == pytest.approx(20)
+        limiter.close()
+
+    def test_shared_between_workers(self, temp_dir):
+        path = temp_dir / "rl.db"
+        workers = [RateLimiter(), RateLimiter()]
+        granted = [workers[i % 2].acquire(path, "k", self.RATE, 1, now=0) == 0 for i in range(6)]
+        assert granted.count(True) == 3
+        workers[0].reset()
+        assert workers[1].acquire(path, "k", self.RATE, 1, now=0) == 0
+        for limiter in workers:
+            limiter.close()
+
+
+class TestRoutes:
+    @pytest.fixture
+    async def app(self, temp_dir):
+        from mtfwbuilder.services.build_service import init_build_system
+        from mtfwbuilder.services.device_registry import DeviceRegistry
+
+        settings = Settings(
+            temp_dir=temp_dir,
+            admin_password_hash=bcrypt.hashpw(b"secret", bcrypt.gensalt(4)).decode(),
+            rate_limit_path=temp_dir / "rl.db",
+            login_rate_limit="2/minute",
+            build_rate_limit="10/hour",
+            build_estimate_seconds=300,
+        )
+        app = create_app()
+        app.state.settings = settings
+        app.state.device_registry = DeviceRegistry(settings.devices_file)
+        app.state.active_builds = {}
+        init_build_system(settings)
+        yield app
+        app.state.rate_limiter.close()
+
+    @pytest.mark.asyncio
+    async def test_login_limited(self, app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            for _ in range(2):
+                resp = await client.post("/admin/login", data={"admin_key": "wrong"})
+                assert resp.status_code == 401
+            resp = await client.post("/admin/login", data={"admin_key": "wrong"})
+        assert resp.status_code == 429
+        assert 0 < int(resp.headers["Retry-After"]) <= 30
+
+    @pytest.mark.asyncio
+    async def test_builds_cost_predicted_minutes(self, app):
+        form = {"variant": "tbeam", "config_source": "current", "config_json": '{"device_name": "N"}'}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            statuses = [(await client.post("/api/v1/build-firmware", data=form)).status_code for _ in range(3)]
+            # Cheap requests draw on their own bucket
+            assert (await client.post("/api/v1/preview", json={})).status_code == 200
+        assert statuses == [200, 200, 429]  # 5 tokens each from 10/hour
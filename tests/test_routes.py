@@ -104,3 +104,208 @@ class TestConfigGeneratorRoutes:
     async def test_preview_userprefs_no_file(self, client):
         resp = await client.post("/api/v1/preview-userprefs")
         assert resp.status_code == 422  # FastAPI validation error — missing required file
+
+    @pytest.mark.asyncio
+    async def test_preview_memoized_with_etag(self, client):
+        cache = client._transport.app.state.jsonc_cache
+        first = await client.post("/api/v1/preview", json={"device_name": "N", "channels_to_write": "1"})
+        etag = first.headers["etag"]
+        # Same request in another key order is a cache hit with the same validator
+        second = await client.post(
+            "/api/v1/generate", content='{"channels_to_write":"1",  "device_name":"N"}',
+            headers={"content-type": "application/json"},
+        )
+        assert second.headers["etag"] == etag
+        assert second.json() == first.json()
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        resp = await client.post("/api/v1/preview", json={"device_name": "M"}, headers={"If-None-Match": etag})
+        assert resp.status_code == 200  # different content, different validator
+
+        resp = await client.post(
+            "/api/v1/preview", json={"device_name": "N", "channels_to_write": "1"}, headers={"If-None-Match": etag}
+        )
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+    @pytest.mark.asyncio
+    async def test_preview_errors_not_cached(self, client):
+        cache = client._transport.app.state.jsonc_cache
+        for _ in range(2):
+            resp = await client.post("/api/v1/preview", json={"channels_to_write": "many"})
+            assert resp.json()["success"] is False
+            assert "etag" not in resp.headers
+        assert cache.stats()["entries"] == 0
+
+
+class TestBulkGenerate:
+    """Tests for /api/v1/bulk-generate."""
+
+    @pytest.mark.asyncio
+    async def test_ndjson_rows_over_base(self, client):
+        body = "\n".join(
+            [
+                json.dumps({"$base": {"owner_short_name": "FLT", "device_name": "Base"}}),
+                json.dumps({"$name": "alpha", "device_name": "Alpha"}),
+                "",
+                json.dumps({"owner_long_name": "Beta"}),
+            ]
+        )
+        resp = await client.post(
+            "/api/v1/bulk-generate?base=" + json.dumps({"tz_string": "UTC0"}),
+            content=body,
+            headers={"content-type": "application/x-ndjson"},
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in resp.text.splitlines()]
+        assert [(r["row"], r["name"]) for r in rows] == [(1, "alpha"), (2, "node-2")]
+        alpha, beta = (json.loads(r["content"]) for r in rows)
+        assert alpha["USERPREFS_CONFIG_DEVICE_NAME"] == "Alpha"
+        assert alpha["USERPREFS_CONFIG_OWNER_SHORT_NAME"] == "FLT"
+        assert alpha["USERPREFS_TZ_STRING"] == "UTC0"
+        assert beta["USERPREFS_CONFIG_DEVICE_NAME"] == "Base"
+
+    @pytest.mark.asyncio
+    async def test_bad_rows_reported_inline(self, client):
+        body = '{"device_name": "ok"}\nnot json\n[1, 2]\n{"channels_to_write": "many"}\n'
+        resp = await client.post("/api/v1/bulk-generate", content=body, headers={"content-type": "application/x-ndjson"})
+        rows = [json.loads(line) for line in resp.text.splitlines()]
+        assert "content" in rows[0]
+        assert [r["row"] for r in rows[1:]] == [2, 3, 4]
+        assert all("error" in r for r in rows[1:])
+
+    @pytest.mark.asyncio
+    async def test_csv_to_zip(self, client):
+        import io
+        import zipfile
+
+        body = '$name,device_name,owner_short_name\nnode a,"Two\nLines",\nnode a,Second,S2\n../x,,\n'
+        resp = await client.post(
+            "/api/v1/bulk-generate?format=zip&base=" + json.dumps({"owner_short_name": "DEF"}),
+            content=body,
+            headers={"content-type": "text/csv"},
+        )
+        assert resp.status_code == 200
+        archive = zipfile.ZipFile(io.BytesIO(resp.content))
+        assert archive.namelist() == ["node_a.jsonc", "node_a-2.jsonc", "x.jsonc"]
+        first = json.loads(archive.read("node_a.jsonc"))
+        assert first["USERPREFS_CONFIG_DEVICE_NAME"] == "Two\nLines"
+        assert first["USERPREFS_CONFIG_OWNER_SHORT_NAME"] == "DEF"  # empty cell keeps the base value
+
+    @pytest.mark.asyncio
+    async def test_row_limit_ends_stream_with_error(self, client):
+        client._transport.app.state.settings.bulk_max_rows = 2
+        body = "{}\n{}\n{}\n"
+        resp = await client.post("/api/v1/bulk-generate", content=body, headers={"content-type": "application/x-ndjson"})
+        rows = [json.loads(line) for line in resp.text.splitlines()]
+        assert len(rows) == 3
+        assert rows[-1] == {"error": "Too many rows (max 2)"}
+
+    @pytest.mark.asyncio
+    async def test_request_errors(self, client):
+        resp = await client.post("/api/v1/bulk-generate", content="{}", headers={"content-type": "text/plain"})
+        assert resp.status_code == 415
+        resp = await client.post(
+            "/api/v1/bulk-generate?format=tar", content="{}", headers={"content-type": "application/x-ndjson"}
+        )
+        assert resp.status_code == 400
+        resp = await client.post(
+            "/api/v1/bulk-generate?base=[1]", content="{}", headers={"content-type": "application/x-ndjson"}
+        )
+        assert resp.status_code == 400
+        client._transport.app.state.settings.bulk_max_bytes = 10
+        resp = await client.post(
+            "/api/v1/bulk-generate", content="{}\n" * 10, headers={"content-type": "application/x-ndjson"}
+        )
+        assert resp.status_code == 413
+
+
+class TestVariantRoutes:
+    """Tests for /api/v1/variants."""
+
+    @pytest.mark.asyncio
+    async def test_list_all_variants(self, client):
+        resp = await client.get("/api/v1/variants")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["count"] == len(data["variants"]) > 60
+        assert resp.headers["etag"].startswith('"')
+        assert resp.headers["cache-control"] == "no-cache"
+
+    @pytest.mark.asyncio
+    async def test_filters_combine(self, client):
+        resp = await client.get("/api/v1/variants", params={"manufacturer": "LILYGO", "architecture": "esp32"})
+        variants = resp.json()["variants"]
+        assert variants
+        assert all(v["manufacturer"] == "LILYGO" and v["architecture"] == "esp32" for v in variants)
+        assert "tbeam" in [v["id"] for v in variants]
+
+        resp = await client.get("/api/v1/variants", params={"pio_platform": "nrf52840", "architecture": "esp32"})
+        assert resp.json()["count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_etag_revalidation(self, client):
+        first = await client.get("/api/v1/variants", params={"architecture": "rp2040"})
+        etag = first.headers["etag"]
+        resp = await client.get("/api/v1/variants", params={"architecture": "rp2040"}, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.headers["etag"] == etag
+        assert resp.content == b""
+
+        # A different filter is a different representation
+        other = await client.get("/api/v1/variants", params={"architecture": "nrf52"}, headers={"If-None-Match": etag})
+        assert other.status_code == 200
+        assert other.headers["etag"] != etag
+
+    @pytest.mark.asyncio
+    async def test_etag_changes_with_registry_version(self, client):
+        app = client._transport.app
+        first = await client.get("/api/v1/variants")
+        registry = app.state.device_registry
+        app.state.device_registry = type(registry)(registry.path, version=registry.version + 1)
+        resp = await client.get("/api/v1/variants", headers={"If-None-Match": first.headers["etag"]})
+        assert resp.status_code == 200
+        assert resp.json()["registry_version"] == registry.version + 1
+
+
+class TestPageCache:
+    """Tests for cached HTML page rendering."""
+
+    @pytest.mark.asyncio
+    async def test_page_rendered_once(self, client):
+        page_cache = client._transport.app.state.page_cache
+        first = await client.get("/firmware-builder")
+        second = await client.get("/firmware-builder")
+        assert first.status_code == second.status_code == 200
+        assert first.text == second.text
+        assert 'value="tbeam"' in first.text
+        assert first.headers["etag"] == second.headers["etag"]
+        assert (page_cache.misses, page_cache.hits) == (1, 1)
+
+    @pytest.mark.asyncio
+    async def test_etag_revalidation(self, client):
+        etag = (await client.get("/")).headers["etag"]
+        resp = await client.get("/", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+    @pytest.mark.asyncio
+    async def test_registry_reload_invalidates(self, client):
+        app = client._transport.app
+        first = await client.get("/firmware-builder")
+        registry = app.state.device_registry
+        app.state.device_registry = type(registry)(registry.path, version=registry.version + 1)
+        resp = await client.get("/firmware-builder", headers={"If-None-Match": first.headers["etag"]})
+        # Same content, re-rendered for the new registry
+        assert resp.status_code == 304
+        assert app.state.page_cache.misses == 2
+
+    @pytest.mark.asyncio
+    async def test_disabled_renders_every_time(self, client):
+        app = client._transport.app
+        app.state.settings.page_cache = False
+        resp = await client.get("/admin")
+        assert resp.status_code == 200
+        assert "etag" not in resp.headers
+        assert app.state.page_cache.misses == 0
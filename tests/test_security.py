@@ -157,3 +157,65 @@ class TestAdminRoutes:
             resp = await c.post("/admin/logout")
             assert resp.status_code == 303
             # Cookie should be deleted (set to empty/expired)
+
+
+class TestBodyLimits:
+    """Tests for streaming request body caps (BodyLimitMiddleware)."""
+
+    @pytest.fixture
+    async def client(self):
+        app, _ = _make_client_app()
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as c:
+            yield c
+
+    @pytest.mark.asyncio
+    async def test_declared_length_rejected_up_front(self, client):
+        big = b"x" * (200 * 1024)
+        resp = await client.post("/api/v1/preview-userprefs", files={"userPrefs": ("u.jsonc", big, "text/plain")})
+        assert resp.status_code == 413
+        assert resp.json()["detail"] == "Request body too large (max 128KB)"
+
+    @pytest.mark.asyncio
+    async def test_chunked_body_aborted_when_cap_crossed(self, client):
+        sent = []
+
+        async def body():
+            for _ in range(64):  # 64 x 16KB = 1MB, far past the 256KB default
+                sent.append(1)
+                yield b" " * (16 * 1024)
+
+        resp = await client.post("/api/v1/preview", content=body(), headers={"content-type": "application/json"})
+        assert resp.status_code == 413
+        assert len(sent) <= 17  # stopped reading at the chunk that crossed 256KB
+
+    @pytest.mark.asyncio
+    async def test_chunked_multipart_upload_aborted(self, client):
+        boundary = "limit-test"
+
+        async def body():
+            yield f'--{boundary}\r\nContent-Disposition: form-data; name="userPrefs"; filename="u.jsonc"\r\n\r\n'.encode()
+            for _ in range(32):
+                yield b"x" * (8 * 1024)
+
+        resp = await client.post(
+            "/api/v1/preview-userprefs",
+            content=body(),
+            headers={"content-type": f"multipart/form-data; boundary={boundary}"},
+        )
+        assert resp.status_code == 413
+
+    @pytest.mark.asyncio
+    async def test_limits_are_per_route(self, client):
+        payload = b'{"device_name": "' + b"x" * (300 * 1024) + b'"}'
+        headers = {"content-type": "application/json"}
+        assert (await client.post("/api/v1/preview", content=payload, headers=headers)).status_code == 413
+        resp = await client.post("/api/v1/bulk-generate", content=payload, headers=headers)
+        assert resp.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_zero_disables_limit(self, client):
+        client._transport.app.state.settings.max_body_bytes = 0
+        payload = b'{"device_name": "' + b"x" * (300 * 1024) + b'"}'
+        resp = await client.post("/api/v1/preview", content=payload, headers={"content-type": "application/json"})
+        assert resp.status_code == 200
@@ -0,0 +1,102 @@
+"""Tests for the fingerprinted static asset pipeline."""
+
+import gzip
+from pathlib import Path
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from mtfwbuilder.static_assets import IMMUTABLE, StaticAssets, choose_encoding
+
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+
+
+class TestBuild:
+    def test_fingerprinted_urls(self, temp_dir):
+        assets = StaticAssets(STATIC_DIR)
+        assert assets.url("js/main.js") == "/static/js/main.js"  # before build
+        assert assets.build(temp_dir) >= 3
+        url = assets.url("js/main.js")
+        assert url.startswith("/static/js/main.") and url.endswith(".js") and url != "/static/js/main.js"
+        assert assets.url("no/such.css") == "/static/no/such.css"
+
+    def test_variants_written_and_reused(self, temp_dir):
+        assets = StaticAssets(STATIC_DIR)
+        assets.build(temp_dir)
+        asset = assets.lookup(assets.url("css/style.css").removeprefix("/static/"))
+        assert gzip.decompress(asset.files["gzip"].read_bytes()) == (STATIC_DIR / "css" / "style.css").read_bytes()
+
+        mtime = asset.files["gzip"].stat().st_mtime_ns
+        StaticAssets(STATIC_DIR).build(temp_dir)
+        assert asset.files["gzip"].stat().st_mtime_ns == mtime
+
+    def test_content_change_changes_url(self, temp_dir):
+        static = temp_dir / "static"
+        (static / "js").mkdir(parents=True)
+        (static / "js" / "app.js").write_text("let a = 1;\n" * 50)
+        assets = StaticAssets(static)
+        assets.build(temp_dir / "out")
+        before, version = assets.url("js/app.js"), assets.version
+        (static / "js" / "app.js").write_text("let a = 2;\n" * 50)
+        assets.build(temp_dir / "out")
+        assert assets.url("js/app.js") != before
+        assert assets.version != version
+
+
+class TestChooseEncoding:
+    @pytest.mark.parametrize(
+        "header, expected",
+        [
+            ("gzip, deflate, br", "br"),
+            ("gzip", "gzip"),
+            ("br;q=0.5, gzip", "gzip"),
+            ("br;q=0, gzip;q=0", "identity"),
+            ("*", "br"),
+            ("", "identity"),
+        ],
+    )
+    def test_negotiation(self, header, expected):
+        assert choose_encoding(header, {"identity", "gzip", "br"}) == expected
+
+    def test_only_available_encodings(self):
+        assert choose_encoding("br, gzip", {"identity", "gzip"}) == "gzip"
+
+
+class TestServing:
+    @pytest.fixture
+    async def client(self, temp_dir):
+        from tests.test_security import _make_client_app
+
+        app, settings = _make_client_app()
+        app.state.static_assets.build(temp_dir)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+            yield c
+
+    async def test_precompressed_immutable(self, client):
+        url = client._transport.app.state.static_assets.url("js/main.js")
+        resp = await client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["cache-control"] == IMMUTABLE
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert "javascript" in resp.headers["content-type"]
+        assert resp.content == (STATIC_DIR / "js" / "main.js").read_bytes()  # httpx decodes gzip
+
+        revalidated = await client.get(url, headers={"If-None-Match": resp.headers["etag"]})
+        assert revalidated.status_code == 304
+
+    async def test_identity_when_not_accepted(self, client):
+        url = client._transport.app.state.static_assets.url("css/style.css")
+        resp = await client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in resp.headers
+        assert resp.content == (STATIC_DIR / "css" / "style.css").read_bytes()
+
+    async def test_plain_path_still_served(self, client):
+        resp = await client.get("/static/js/main.js")
+        assert resp.status_code == 200
+        assert resp.headers.get("cache-control") != IMMUTABLE
+
+    async def test_pages_link_fingerprinted_assets(self, client):
+        page = await client.get("/")
+        assert client._transport.app.state.static_assets.url("js/main.js") in page.text
+        assert "/static/js/main.js" not in page.text
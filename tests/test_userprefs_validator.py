@@ -0,0 +1,176 @@
+"""Tests for pre-build userPrefs validation."""
+
+import json
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from mtfwbuilder.services.config_canonical import parse_prefs
+from mtfwbuilder.services.jsonc_generator import CHANNEL_SCHEMA, SCHEMA, generate_jsonc
+from mtfwbuilder.services.userprefs_validator import (
+    CHANNEL_PREFS_SCHEMA,
+    PREFS_SCHEMA,
+    firmware_enums,
+    parse_enums,
+    validate,
+)
+
+PSK = "{ " + ", ".join(["0xab"] * 32) + " }"
+
+
+def _errors(prefs: dict, enums=None) -> dict[str, str]:
+    return {e.key: e.message for e in validate(prefs, enums)}
+
+
+class TestSchema:
+    def test_every_generated_key_is_typed(self):
+        assert {f.key for f in SCHEMA} <= set(PREFS_SCHEMA)
+        assert {f.key for f in CHANNEL_SCHEMA} == set(CHANNEL_PREFS_SCHEMA)
+
+    def test_form_config_is_valid(self, sample_config_data):
+        form = {
+            **sample_config_data,
+            "lora_enabled": "true",
+            "lora_region": "EU_868",
+            "lora_modem_preset": "meshtastic_Config_LoRaConfig_ModemPreset_LONG_FAST",
+            "gps_enabled": "true",
+            "fixed_position": "true",
+            "fixed_lat": "48.85873920",
+            "fixed_lon": "-2.294508368",
+            "fixed_alt": "35",
+            "bluetooth_fixed_pin": "123456",
+            "channel_0[precision]": "14",
+        }
+        assert validate(parse_prefs(generate_jsonc(form))) == []
+
+
+class TestFieldChecks:
+    def test_odd_length_hex_psk(self):
+        prefs = parse_prefs(generate_jsonc({"channel_0[name]": "P", "channel_0[psk]": "deadbee"}))
+        assert "odd number of hex" in _errors(prefs)["USERPREFS_CHANNEL_0_PSK"]
+
+    @pytest.mark.parametrize(
+        "psk,ok",
+        [(PSK, True), ("{ 0x01 }", True), ("{}", True), ("{ 0x01, 0x02 }", False), ("{ 0xzz }", False), ("abc", False)],
+    )
+    def test_psk_lengths_and_format(self, psk, ok):
+        prefs = {"USERPREFS_CHANNELS_TO_WRITE": "1", "USERPREFS_CHANNEL_0_PSK": psk}
+        assert ("USERPREFS_CHANNEL_0_PSK" not in _errors(prefs)) is ok
+
+    def test_unknown_region(self):
+        prefs = {"USERPREFS_CONFIG_LORA_REGION": "meshtastic_Config_LoRaConfig_RegionCode_MARS"}
+        assert "must be one of" in _errors(prefs)["USERPREFS_CONFIG_LORA_REGION"]
+
+    @pytest.mark.parametrize("lat,ok", [("48.8", True), ("-90", True), ("90.5", False), ("48,85", False), ("1e2", False)])
+    def test_latitude(self, lat, ok):
+        prefs = {"USERPREFS_CONFIG_POSITION_FIXED_LAT": lat, "USERPREFS_CONFIG_POSITION_FIXED_LON": "2.3"}
+        assert ("USERPREFS_CONFIG_POSITION_FIXED_LAT" not in _errors(prefs)) is ok
+
+    def test_string_limits(self):
+        errors = _errors({"USERPREFS_CONFIG_OWNER_SHORT_NAME": "ÄÄÄ", "USERPREFS_CONFIG_WIFI_PSK": "short"})
+        assert errors["USERPREFS_CONFIG_OWNER_SHORT_NAME"] == "must be at most 4 bytes"
+        assert errors["USERPREFS_CONFIG_WIFI_PSK"] == "must be at least 8 characters"
+
+    def test_unknown_keys_pass_through(self):
+        assert validate({"USERPREFS_CONFIG_DEVICE_ROLE": "meshtastic_Config_DeviceConfig_Role_ROUTER"}) == []
+        assert _errors({"BAD KEY": "x"}) == {"BAD KEY": "is not a valid preference name"}
+
+    def test_form_field_reported(self):
+        (error,) = validate({"USERPREFS_CHANNELS_TO_WRITE": "1", "USERPREFS_CHANNEL_0_PRECISION": "x"})
+        assert error.to_dict() == {
+            "key": "USERPREFS_CHANNEL_0_PRECISION",
+            "field": "channel_0[precision]",
+            "message": "must be a whole number",
+        }
+
+
+class TestCrossFieldChecks:
+    def test_settings_beyond_channel_count(self):
+        prefs = {"USERPREFS_CHANNELS_TO_WRITE": "1", "USERPREFS_CHANNEL_0_NAME": "A", "USERPREFS_CHANNEL_2_NAME": "C"}
+        assert "settings for channel 2" in _errors(prefs)["USERPREFS_CHANNELS_TO_WRITE"]
+
+    def test_secondary_channel_missing(self):
+        prefs = {"USERPREFS_CHANNELS_TO_WRITE": "3", "USERPREFS_CHANNEL_0_NAME": "A", "USERPREFS_CHANNEL_1_NAME": "B"}
+        assert "channel 2 has no settings" in _errors(prefs)["USERPREFS_CHANNELS_TO_WRITE"]
+        assert validate({"USERPREFS_CHANNELS_TO_WRITE": "1"}) == []  # firmware default primary
+
+    def test_half_a_fixed_position(self):
+        assert "USERPREFS_CONFIG_POSITION_FIXED_LON" in _errors({"USERPREFS_CONFIG_POSITION_FIXED_LAT": "1"})
+
+    def test_oem_image_size(self):
+        prefs = {
+            "USERPREFS_CONFIG_OEM_IMAGE_WIDTH": "9",
+            "USERPREFS_CONFIG_OEM_IMAGE_HEIGHT": "2",
+            "USERPREFS_CONFIG_OEM_IMAGE_DATA": "{ " + ", ".join(["0x00"] * 4) + " }",
+        }
+        assert validate(prefs) == []
+        prefs["USERPREFS_CONFIG_OEM_IMAGE_HEIGHT"] = "3"
+        assert "needs 6" in _errors(prefs)["USERPREFS_CONFIG_OEM_IMAGE_DATA"]
+
+
+class TestFirmwareEnums:
+    HEADER = """
+typedef enum _meshtastic_Config_LoRaConfig_RegionCode {
+    meshtastic_Config_LoRaConfig_RegionCode_UNSET = 0,
+    meshtastic_Config_LoRaConfig_RegionCode_MARS = 99
+} meshtastic_Config_LoRaConfig_RegionCode;
+#define _meshtastic_Config_LoRaConfig_RegionCode_MIN meshtastic_Config_LoRaConfig_RegionCode_UNSET
+"""
+
+    def test_parse_header(self):
+        enums = parse_enums(self.HEADER)
+        assert enums == {"meshtastic_Config_LoRaConfig_RegionCode_": frozenset({"UNSET", "MARS"})}
+        prefs = {"USERPREFS_CONFIG_LORA_REGION": "meshtastic_Config_LoRaConfig_RegionCode_MARS"}
+        assert validate(prefs, enums) == []
+
+    def test_read_from_installed_tree(self, temp_dir):
+        from mtfwbuilder.config import Settings
+
+        settings = Settings(firmware_dir=temp_dir / "firmware", temp_dir=temp_dir)
+        assert firmware_enums(settings) == {}
+        header = settings.firmware_dir / "src/mesh/generated/meshtastic/config.pb.h"
+        header.parent.mkdir(parents=True)
+        header.write_text(self.HEADER)
+        assert "MARS" in firmware_enums(settings)["meshtastic_Config_LoRaConfig_RegionCode_"]
+
+
+class TestBuildRoute:
+    @pytest.fixture
+    async def client(self):
+        from mtfwbuilder.config import load_settings
+        from mtfwbuilder.main import create_app
+        from mtfwbuilder.services.build_service import init_build_system
+        from mtfwbuilder.services.device_registry import DeviceRegistry
+
+        app = create_app()
+        settings = load_settings()
+        app.state.settings = settings
+        app.state.device_registry = DeviceRegistry(settings.devices_file)
+        init_build_system(settings)
+        app.state.active_builds = {}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+            yield c
+    @pytest.mark.asyncio
+    async def test_invalid_config_rejected_with_field_errors(self, client):
+        config = json.dumps({"lora_enabled": "true", "lora_region": "MARS", "channel_0[psk]": "abc"})
+        resp = await client.post(
+            "/api/v1/build-firmware",
+            data={"variant": "tbeam", "config_source": "current", "config_json": config},
+        )
+        assert resp.status_code == 422
+        detail = resp.json()["detail"]
+        assert detail["message"] == "Invalid configuration"
+        fields = {e["field"] for e in detail["errors"]}
+        assert fields == {"lora_region", "channel_0[psk]"}
+        assert client._transport.app.state.active_builds == {}
+
+    @pytest.mark.asyncio
+    async def test_invalid_upload_rejected(self, client):
+        upload = '{"USERPREFS_CHANNELS_TO_WRITE": "9"}'
+        resp = await client.post(
+            "/api/v1/build-firmware",
+            data={"variant": "tbeam", "config_source": "upload"},
+            files={"userPrefs": ("userPrefs.jsonc", upload.encode(), "application/json")},
+        )
+        assert resp.status_code == 422
+        assert resp.json()["detail"]["errors"][0]["key"] == "USERPREFS_CHANNELS_TO_WRITE"